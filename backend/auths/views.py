@@ -1,8 +1,9 @@
 from django.shortcuts import render
 from django.conf import settings
-from django.template.loader import render_to_string
 from django.core.mail import EmailMultiAlternatives
 from django.contrib.auth import get_user_model
+from users.outbox import enqueue_message
+from users.email_rendering import render_email
 # from django.contrib.auth.hashers import check_password
 
 # from ..users.models import User
@@ -85,8 +86,8 @@ class PasswordResetEmailVerifyAPIView(generics.RetrieveAPIView):
             }
 
             subject = "Password Reset Email"
-            text_body = render_to_string('email/password_reset.txt', context)
-            html_body = render_to_string('email/password_reset.html', context)
+            text_body = render_email('email/password_reset.txt', context)
+            html_body = render_email('email/password_reset.html', context)
 
             message = EmailMultiAlternatives(
                 subject=subject,
@@ -96,7 +97,7 @@ class PasswordResetEmailVerifyAPIView(generics.RetrieveAPIView):
             )
 
             message.attach_alternative(html_body, "text/html")
-            message.send()
+            enqueue_message(message, dedupe_key=f'password-reset:{user.pk}:{user.otp}')
 
             # print("Link ===========", link)
 
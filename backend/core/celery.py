@@ -6,3 +6,13 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 app = Celery('core')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
+
+# Grading tasks are sent to the queues in settings.GRADING_QUEUES by the
+# scheduler in users/scheduling.py; run dedicated workers for the priority
+# queue so timed quizzes never wait behind a deadline rush:
+#
+#   celery -A core worker -Q grading-priority
+#   celery -A core worker -Q grading,celery
+app.conf.task_routes = {
+    'users.tasks.grade_submission_task': {'queue': 'grading'},
+}
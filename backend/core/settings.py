@@ -56,9 +56,12 @@ INSTALLED_APPS = [
     "drf_yasg",
     "corsheaders",
     "anymail",
+    "channels",
 ]
 
 MIDDLEWARE = [
+    'users.metrics.MetricsMiddleware',
+    'users.middleware.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -88,6 +91,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'core.wsgi.application'
+ASGI_APPLICATION = 'core.asgi.application'
 
 
 # Database
@@ -152,6 +156,8 @@ AUTH_USER_MODEL = 'users.User'
 CORS_ALLOW_ALL_ORIGINS = True
 
 OPENAI_API_KEY = env('OPENAI_API_KEY')
+# Point at a compatible endpoint (e.g. a local stub server) instead of api.openai.com
+OPENAI_BASE_URL = env('OPENAI_BASE_URL', None)
 
 FRONTEND_SITE_URL = env('FRONTEND_SITE_URL')
 BACKEND_SITE_URL = env('BACKEND_SITE_URL')
@@ -167,10 +173,183 @@ ANYMAIL = {
 }
 
 FROM_EMAIL = env('FROM_EMAIL')
-EMAIL_BACKEND = "anymail.backends.mailgun.EmailBackend"
+EMAIL_BACKEND = env('EMAIL_BACKEND', "anymail.backends.mailgun.EmailBackend")
+# Used when EMAIL_BACKEND is django.core.mail.backends.filebased.EmailBackend
+EMAIL_FILE_PATH = BASE_DIR / 'sent_emails'
+
+# Outgoing mail is queued in the outbox and sent by Celery (see
+# users/outbox.py). Each provider has its own backend (default:
+# EMAIL_BACKEND), batch size and messages-per-minute limit.
+EMAIL_OUTBOX_PROVIDERS = {
+    'default': {
+        'BACKEND': None,
+        'RATE_PER_MINUTE': env.int('EMAIL_RATE_PER_MINUTE', 600),
+        'BATCH_SIZE': 100,
+    },
+}
+EMAIL_OUTBOX_RATE_LIMIT_BACKEND = 'redis'
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_BACKOFF_BASE = 30
+EMAIL_OUTBOX_BACKOFF_CAP = 15 * 60
+EMAIL_OUTBOX_CLAIM_TIMEOUT = 10 * 60
 
 CELERY_BROKER_URL = 'redis://localhost:6379/1'
 
+# Shared through Redis when CACHE_URL is set (e.g. redis://localhost:6379/2);
+# without it each process keeps its own, which is enough for tests and a
+# single development server.
+CACHE_URL = env('CACHE_URL', None)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_URL,
+    } if CACHE_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Grading status pushed over WebSockets (see users/realtime.py). 'memory'
+# keeps groups inside one process, which is enough for tests and a single
+# ASGI worker; 'redis' shares them between the web, ASGI and Celery workers.
+CHANNEL_LAYER_BACKEND = env('CHANNEL_LAYER_BACKEND', 'redis')
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+    } if CHANNEL_LAYER_BACKEND == 'memory' else {
+        'BACKEND': 'channels_redis.core.RedisChannelLayer',
+        'CONFIG': {'hosts': ['redis://localhost:6379/3']},
+    }
+}
+
+# How long an AI grading result is reused for identical submissions
+AI_GRADING_CACHE_TTL = 60 * 60 * 24 * 7
+
+# Batched grading worker (see users/grading_worker.py). In batch mode new
+# submissions are not queued one task each; the worker picks them up.
+AI_GRADING_BATCH_MODE = env.bool('AI_GRADING_BATCH_MODE', False)
+AI_GRADING_BATCH_SIZE = 50
+AI_GRADING_CONCURRENCY = 8
+AI_GRADING_TIMEOUT = 60
+AI_GRADING_IDLE_SLEEP = 2
+# A claimed batch is leased to its worker for this long; a failed grading
+# is retried after AI_GRADING_RETRY_DELAY * attempts seconds, then FAILED
+AI_GRADING_LEASE = 10 * 60
+AI_GRADING_MAX_ATTEMPTS = 3
+AI_GRADING_RETRY_DELAY = 60
+
+# Shared pacing for the grading provider (see users/rate_limit.py). Set these
+# to the account's quota; 'memory' keeps the buckets per process.
+AI_GRADING_REQUESTS_PER_MINUTE = env.int('AI_GRADING_REQUESTS_PER_MINUTE', 500)
+AI_GRADING_TOKENS_PER_MINUTE = env.int('AI_GRADING_TOKENS_PER_MINUTE', 200000)
+AI_GRADING_RATE_LIMIT_BACKEND = 'redis'
+AI_GRADING_RATE_LIMIT_REDIS_URL = CELERY_BROKER_URL
+AI_GRADING_MAX_RETRIES = 5
+AI_GRADING_BACKOFF_BASE = 1
+AI_GRADING_BACKOFF_CAP = 60
+
+# Grading scheduler (see users/scheduling.py). Timed quizzes go to their own
+# Celery queue; each queue is kept at most GRADING_DISPATCH_HIGH_WATER deep
+# and the rest waits in per-institution fair queues. Weights are keyed by
+# institution id, e.g. {'3': 2} gives institution 3 twice the default share.
+GRADING_QUEUES = {
+    'priority': 'grading-priority',
+    'standard': 'grading',
+}
+GRADING_DISPATCH_HIGH_WATER = env.int('GRADING_DISPATCH_HIGH_WATER', 50)
+GRADING_DISPATCH_INTERVAL = 1
+GRADING_INSTITUTION_WEIGHTS = {}
+GRADING_SCHEDULER_BACKEND = 'redis'
+
+# Timed quiz sessions (see users/quiz_sessions.py). Deadlines are checked
+# every QUIZ_SESSION_TICK seconds; submissions are still accepted for
+# QUIZ_SESSION_GRACE_SECONDS after the deadline to allow for the request in
+# flight, after which the latest draft is submitted automatically.
+QUIZ_SESSION_SCHEDULER_BACKEND = 'redis'
+QUIZ_SESSION_TICK = 5
+QUIZ_SESSION_GRACE_SECONDS = 10
+QUIZ_SESSION_EXPIRE_BATCH = 500
+# The tick chain re-arms itself on draft saves and submissions; with
+# `celery -A core beat` running, this also restarts it every minute.
+CELERY_BEAT_SCHEDULE = {
+    'expire-quiz-sessions': {
+        'task': 'users.tasks.expire_quiz_sessions_task',
+        'schedule': 60,
+    },
+}
+
+# Editor autosave (see users/drafts.py). Patches are folded into a snapshot
+# every DRAFT_COMPACT_EVERY saves or DRAFT_COMPACT_INTERVAL seconds. Edits
+# are written through to PlayGround.code_area at most DRAFT_COMPACT_INTERVAL
+# seconds after the last save.
+DRAFT_COMPACT_EVERY = 50
+DRAFT_COMPACT_INTERVAL = 60
+DRAFT_CACHE_TTL = 60 * 60
+DRAFT_MAX_LENGTH = 200000
+
+# Submitted code is stored once per distinct text, compressed (see
+# users/code_store.py). 'zstd' needs the zstandard package; 'zlib' does not.
+CODE_BLOB_COMPRESSION = env('CODE_BLOB_COMPRESSION', 'zlib')
+# prune_code_blobs keeps unreferenced blobs this many seconds after they
+# were last stored, so it never races a submission that is being saved.
+CODE_BLOB_PRUNE_GRACE = 24 * 60 * 60
+
+# Test case execution (see users/sandbox.py). Limits apply to every run;
+# memory and output are in bytes, times in seconds.
+SANDBOX_POOL_SIZE = env.int('SANDBOX_POOL_SIZE', 2)
+SANDBOX_CPU_TIME_LIMIT = 2
+SANDBOX_WALL_TIME_LIMIT = 5
+SANDBOX_MEMORY_LIMIT = 256 * 1024 * 1024
+SANDBOX_OUTPUT_LIMIT = 64 * 1024
+# Runs get no network, a chroot and this uid/gid; the grading workers must
+# start as root to set that up. Only turn isolation off on a developer machine.
+SANDBOX_ISOLATION = env.bool('SANDBOX_ISOLATION', True)
+SANDBOX_UID = env.int('SANDBOX_UID', 65534)
+SANDBOX_GID = env.int('SANDBOX_GID', 65534)
+
+# Bulk user imports are inserted and reported on in chunks of this many rows
+USER_IMPORT_CHUNK_SIZE = 500
+
+# Account provisioning hashes passwords in a process pool (None: one worker
+# per core) once a batch has at least PASSWORD_HASH_PARALLEL_MIN passwords
+PASSWORD_HASH_WORKERS = env.int('PASSWORD_HASH_WORKERS', None)
+PASSWORD_HASH_PARALLEL_MIN = 8
+
+# How long course analytics stay cached; new grades invalidate them sooner
+COURSE_ANALYTICS_CACHE_TTL = 60 * 60
+
+# How long test case results are reused for identical code and tests
+TEST_RUN_CACHE_TTL = 60 * 60 * 24 * 7
+
+# Where run_benchmarks stores its results, one JSON file per run
+BENCHMARK_RESULTS_DIR = BASE_DIR / 'benchmarks'
+
+# Per-request query accounting (see users/middleware.py). Budgets are set
+# on views with `query_budget`, or here by URL name.
+QUERY_BUDGET_ENFORCE = env.bool('QUERY_BUDGET_ENFORCE', False)
+QUERY_BUDGET_HEADERS = DEBUG
+QUERY_BUDGET_REPEAT_THRESHOLD = 10
+QUERY_BUDGETS = {}
+
+# Prometheus metrics are served at /api/metrics/ (see users/metrics.py);
+# set a token to require it as a bearer token. Multi-process servers also
+# need PROMETHEUS_MULTIPROC_DIR in their environment.
+METRICS_TOKEN = env('METRICS_TOKEN', None)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'users.queries': {
+            'handlers': ['console'],
+            'level': env('QUERY_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -185,6 +364,8 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
+    'DEFAULT_PAGINATION_CLASS': 'users.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
 }
 
 SIMPLE_JWT = {
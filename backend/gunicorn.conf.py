@@ -0,0 +1,25 @@
+# Loaded automatically when gunicorn is started from this directory.
+#
+# Metrics from all workers are aggregated through PROMETHEUS_MULTIPROC_DIR
+# (see users/metrics.py). Samples left over from an earlier run would be
+# added to the new ones, so the directory is emptied on start.
+
+import glob
+import os
+
+wsgi_app = 'core.wsgi:application'
+
+
+def on_starting(server):
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        for path in glob.glob(os.path.join(directory, '*.db')):
+            os.remove(path)
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -51,4 +51,36 @@ class PlayGround(admin.ModelAdmin):
 @admin.register(user_models.Submission)
 class Submission(admin.ModelAdmin):
     list_display = ["student", "submission_type", "score"]
+    raw_id_fields = ["code_blob"]
 
+@admin.register(user_models.CodeTestCase)
+class CodeTestCase(admin.ModelAdmin):
+    list_display = ["name", "assessment", "quiz", "points", "is_hidden", "order"]
+
+@admin.register(user_models.UserImportJob)
+class UserImportJob(admin.ModelAdmin):
+    list_display = ["job_id", "institution", "status", "processed_rows", "total_rows", "created_count", "created_at"]
+
+@admin.register(user_models.OutboxEmail)
+class OutboxEmail(admin.ModelAdmin):
+    list_display = ["subject", "to", "provider", "status", "attempts", "next_attempt_at", "sent_at"]
+
+@admin.register(user_models.GradebookEntry)
+class GradebookEntry(admin.ModelAdmin):
+    list_display = ["student", "course", "work_key", "attempts", "best_score", "latest_score", "status"]
+
+@admin.register(user_models.NotificationCounter)
+class NotificationCounter(admin.ModelAdmin):
+    list_display = ["user", "unread", "read_up_to"]
+
+@admin.register(user_models.QuizSession)
+class QuizSession(admin.ModelAdmin):
+    list_display = ["student", "quiz", "status", "started_at", "expires_at", "closed_at"]
+
+@admin.register(user_models.CodeDraft)
+class CodeDraft(admin.ModelAdmin):
+    list_display = ["student", "kind", "object_id", "version", "snapshot_version", "updated_at"]
+
+@admin.register(user_models.CodeBlob)
+class CodeBlob(admin.ModelAdmin):
+    list_display = ["hash", "compression", "size", "created_at"]
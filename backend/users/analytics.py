@@ -0,0 +1,167 @@
+# backend/users/analytics.py
+"""
+Course analytics computed with pandas.
+
+The columns needed are read once with values_list into a DataFrame and all
+statistics are computed per assessment/quiz with grouped, vectorized
+operations: score distribution and percentiles over each student's best
+graded attempt (as a percentage of max_score), attempts per student,
+on-time vs late submission rates against Assessment.due_date, and how long
+before the deadline work is submitted.
+
+Results are cached per course. refresh_gradebook calls
+invalidate_course_analytics whenever a submission of the course is created
+or graded, which moves the course to a new cache version.
+"""
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Submission
+from .service import _count
+
+
+ANALYTICS_CACHE_PREFIX = 'course-analytics'
+PERCENTILES = [10, 25, 50, 75, 90]
+# Score distribution buckets, in percent of max_score
+BINS = list(range(0, 101, 10))
+
+COLUMNS = [
+    'id', 'student_id', 'work_id', 'title', 'max_score', 'due_date', 'score', 'grading_status', 'submitted_at',
+]
+
+
+def _version_key(course_id):
+    return f'{ANALYTICS_CACHE_PREFIX}:{course_id}:version'
+
+
+def course_analytics_cache_key(course_id):
+    return f'{ANALYTICS_CACHE_PREFIX}:{course_id}:v{cache.get(_version_key(course_id), 0)}'
+
+
+def invalidate_course_analytics(course_ids):
+    """Moves the courses to a new cache version so their next read recomputes."""
+    for course_id in set(course_ids):
+        _count(_version_key(course_id))
+
+
+def course_frame(course):
+    """One row per submission of the course's assessments and quizzes, with the columns analytics needs."""
+    assessments = Submission.objects.filter(assessment__course=course).values_list(
+        'id', 'student_id', 'assessment__assessment_id', 'assessment__title', 'assessment__max_score',
+        'assessment__due_date', 'score', 'grading_status', 'submitted_at',
+    )
+    # Quizzes have no due date
+    quizzes = Submission.objects.filter(quiz__course=course, assessment__isnull=True).values_list(
+        'id', 'student_id', 'quiz__quiz_id', 'quiz__title', 'quiz__max_score',
+        'score', 'grading_status', 'submitted_at',
+    )
+    assessment_frame = pd.DataFrame.from_records(list(assessments), columns=COLUMNS)
+    assessment_frame['work_type'] = 'ASSESSMENT'
+    quiz_frame = pd.DataFrame.from_records(list(quizzes), columns=[c for c in COLUMNS if c != 'due_date'])
+    quiz_frame['due_date'] = None
+    quiz_frame['work_type'] = 'QUIZ'
+    frame = pd.concat([assessment_frame, quiz_frame[assessment_frame.columns]], ignore_index=True)
+    frame['score'] = pd.to_numeric(frame['score'], errors='coerce')
+    frame['max_score'] = pd.to_numeric(frame['max_score'], errors='coerce').fillna(100).replace(0, 100)
+    frame['submitted_at'] = pd.to_datetime(frame['submitted_at'], utc=True)
+    frame['due_date'] = pd.to_datetime(frame['due_date'], utc=True)
+    return frame
+
+
+def _number(value, digits=2):
+    """JSON-safe float: NaN becomes None."""
+    return None if pd.isna(value) else round(float(value), digits)
+
+
+def _score_stats(percent):
+    """Summary statistics of a Series of percentage scores."""
+    quantiles = percent.quantile([p / 100 for p in PERCENTILES]) if len(percent) else pd.Series(dtype=float)
+    counts, _ = np.histogram(percent.clip(0, 100), bins=BINS)
+    return {
+        'count': int(percent.count()),
+        'mean': _number(percent.mean()),
+        'median': _number(percent.median()),
+        'std': _number(percent.std()),
+        'min': _number(percent.min()),
+        'max': _number(percent.max()),
+        'percentiles': {f'p{p}': _number(quantiles.get(p / 100)) for p in PERCENTILES},
+        'distribution': [
+            {'range': f'{low}-{high}', 'count': int(count)} for low, high, count in zip(BINS, BINS[1:], counts)
+        ],
+    }
+
+
+def _lead_stats(hours):
+    return {
+        'mean': _number(hours.mean()),
+        'median': _number(hours.median()),
+        'p10': _number(hours.quantile(0.1)) if len(hours) else None,
+        'p90': _number(hours.quantile(0.9)) if len(hours) else None,
+    }
+
+
+def compute_course_analytics(course):
+    frame = course_frame(course)
+    frame['percent'] = frame['score'] / frame['max_score'] * 100
+    graded = frame[(frame['grading_status'] == 'GRADED') & frame['score'].notna()]
+    # Each student counts once per item, with their best attempt
+    best = graded.groupby(['work_id', 'student_id'], sort=False)['percent'].max().reset_index()
+
+    dated = frame[frame['due_date'].notna()].copy()
+    dated['late'] = dated['submitted_at'] > dated['due_date']
+    # Positive: submitted that many hours before the deadline
+    dated['lead_hours'] = (dated['due_date'] - dated['submitted_at']).dt.total_seconds() / 3600
+
+    items = frame.groupby('work_id', sort=False).agg(
+        work_type=('work_type', 'first'),
+        title=('title', 'first'),
+        max_score=('max_score', 'first'),
+        submissions=('id', 'size'),
+        students=('student_id', 'nunique'),
+    )
+    items['graded'] = graded.groupby('work_id').size().reindex(items.index, fill_value=0)
+    items['late_rate'] = dated.groupby('work_id')['late'].mean().reindex(items.index)
+    best_by_item = dict(tuple(best.groupby('work_id')['percent']))
+    lead_by_item = dict(tuple(dated.groupby('work_id')['lead_hours']))
+    empty = pd.Series(dtype=float)
+
+    results = []
+    for work_id, item in items.iterrows():
+        late_rate = item['late_rate']
+        results.append({
+            'work_id': work_id,
+            'work_type': item['work_type'],
+            'title': item['title'],
+            'max_score': _number(item['max_score']),
+            'submissions': int(item['submissions']),
+            'students': int(item['students']),
+            'graded': int(item['graded']),
+            'attempts_per_student': _number(item['submissions'] / item['students']),
+            'on_time_rate': None if pd.isna(late_rate) else _number(1 - late_rate, 4),
+            'late_rate': _number(late_rate, 4),
+            'scores': _score_stats(best_by_item.get(work_id, empty)),
+            'hours_before_due': _lead_stats(lead_by_item.get(work_id, empty)),
+        })
+
+    return {
+        'course_id': course.course_id,
+        'submissions': int(len(frame)),
+        'students': int(frame['student_id'].nunique()),
+        'scores': _score_stats(best['percent']),
+        'late_rate': _number(dated['late'].mean(), 4) if len(dated) else None,
+        'hours_before_due': _lead_stats(dated['lead_hours']),
+        'items': results,
+    }
+
+
+def course_analytics(course):
+    """Cached course analytics; recomputed after any new submission or grade in the course."""
+    key = course_analytics_cache_key(course.id)
+    result = cache.get(key)
+    if result is None:
+        result = compute_course_analytics(course)
+        cache.set(key, result, timeout=settings.COURSE_ANALYTICS_CACHE_TTL)
+    return result
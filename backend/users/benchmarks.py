@@ -0,0 +1,161 @@
+# backend/users/benchmarks.py
+"""
+Endpoint benchmarks over a synthetic institution (see users/synthetic.py).
+
+Each key endpoint is requested in-process with Django's test client:
+latency over several runs, then the queries, database time and peak Python
+memory of one more run under tracemalloc. Results are saved as JSON named
+after the current git commit, so runs can be compared across commits with
+compare_results.
+"""
+
+import json
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Count
+from django.test import Client, override_settings
+
+from .middleware import record_queries
+from .models import Student, Teacher, Course
+
+
+# name -> URL template, filled from benchmark_context
+ENDPOINTS = {
+    'student-scores': '/api/students/{student}/scores/',
+    'student-course-list': '/api/students/{student}/course-list/',
+    'student-gradebook': '/api/students/{student}/gradebook/',
+    'student-course-detail': '/api/students/{student}/course-detail/{course}/',
+    'teacher-course-list': '/api/teacher/{teacher}/course/',
+    'teacher-course-detail': '/api/teacher/{teacher}/course-detail/{course}/',
+    'teacher-enrolled-students': '/api/teacher/{teacher}/enrolled-students/{course}/',
+    'teacher-course-gradebook': '/api/teacher/courses/{course}/gradebook/',
+    'teacher-course-analytics': '/api/teacher/courses/{course}/analytics/',
+    'teacher-assessment-list': '/api/teacher/assessment-list/{course}/',
+    'teacher-quiz-list': '/api/teacher/quiz-list/{course}/',
+    'admin-teacher-student-list': '/api/admin/{institution}/teacher-student-list/',
+}
+
+# Metrics compared between runs; all are lower-is-better
+COMPARED = ['p50_ms', 'p95_ms', 'queries', 'db_ms', 'peak_memory_kb']
+
+
+def benchmark_context(institution):
+    """Picks the busiest course, its teacher and its most active student, so every endpoint has data."""
+    course = (
+        Course.objects.filter(institution=institution)
+        .annotate(size=Count('courseenrollment')).order_by('-size', 'id').first()
+    )
+    student = (
+        Student.objects.filter(courseenrollment__course=course)
+        .annotate(submission_count=Count('submissions')).order_by('-submission_count', 'id').first()
+    )
+    teacher = course.teacher if course else Teacher.objects.filter(institution=institution).first()
+    return {
+        'institution': institution.id,
+        'course': course.course_id if course else '',
+        'teacher': teacher.id if teacher else '',
+        'student': student.id if student else '',
+    }
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(percent / 100 * (len(ordered) - 1)))]
+
+
+def benchmark_endpoint(client, url, repeat=20, warmup=2):
+    for _ in range(warmup):
+        client.get(url)
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(url)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    try:
+        with record_queries() as recorder:
+            response = client.get(url)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'url': url,
+        'status': response.status_code,
+        'response_bytes': len(response.content),
+        'mean_ms': round(statistics.mean(timings), 2),
+        'p50_ms': round(_percentile(timings, 50), 2),
+        'p95_ms': round(_percentile(timings, 95), 2),
+        'queries': recorder.count,
+        'db_ms': round(recorder.duration * 1000, 2),
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def run_benchmarks(institution, repeat=20, warmup=2, endpoints=None):
+    """Benchmarks `endpoints` (default: all of ENDPOINTS) against an institution."""
+    context = benchmark_context(institution)
+    client = Client()
+    results = {}
+    # The test client's host is not in ALLOWED_HOSTS outside the test runner
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], QUERY_BUDGET_ENFORCE=False):
+        for name in endpoints or ENDPOINTS:
+            results[name] = benchmark_endpoint(client, ENDPOINTS[name].format(**context), repeat, warmup)
+    return {
+        'commit': current_commit(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'institution': institution.name,
+        'repeat': repeat,
+        'endpoints': results,
+    }
+
+
+def save_results(results, directory):
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{results['created_at'].replace(':', '')}-{results['commit']}.json"
+    path.write_text(json.dumps(results, indent=2))
+    return path
+
+
+def latest_results(directory, exclude=None):
+    """The most recent saved results in `directory`, or None."""
+    paths = sorted(path for path in Path(directory).glob('*.json') if path != exclude)
+    return json.loads(paths[-1].read_text()) if paths else None
+
+
+def compare_results(current, baseline):
+    """
+    Returns rows of (endpoint, metric, before, after, change in percent) for
+    the endpoints both runs measured.
+    """
+    rows = []
+    for name, result in current['endpoints'].items():
+        before = baseline['endpoints'].get(name)
+        if not before:
+            continue
+        for metric in COMPARED:
+            old, new = before.get(metric), result.get(metric)
+            if old is None or new is None:
+                continue
+            change = round((new - old) / old * 100, 1) if old else (0.0 if new == old else None)
+            rows.append((name, metric, old, new, change))
+    return rows
@@ -0,0 +1,48 @@
+# backend/users/code_store.py
+"""
+Hashing and compression for submitted code.
+
+Submission code lives in CodeBlob rows keyed by the SHA-256 of the text, so
+identical attempts are stored once and Submission only holds the 64
+character key. Blobs are compressed with zstd when CODE_BLOB_COMPRESSION is
+'zstd' and the zstandard package is installed, with zlib otherwise. Each
+blob records its codec, so blobs written either way can always be read.
+"""
+
+import hashlib
+import zlib
+
+from django.conf import settings
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def code_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def compress_code(text):
+    """Returns (codec, data). Text that does not shrink is stored as is."""
+    raw = text.encode('utf-8')
+    if settings.CODE_BLOB_COMPRESSION == 'zstd' and zstandard is not None:
+        codec, data = 'zstd', zstandard.ZstdCompressor(level=10).compress(raw)
+    else:
+        codec, data = 'zlib', zlib.compress(raw, 9)
+    if len(data) >= len(raw):
+        return 'none', raw
+    return codec, data
+
+
+def decompress_code(codec, data):
+    # Some database drivers return memoryview for binary columns
+    data = bytes(data)
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("Reading zstd code blobs needs the zstandard package.")
+        data = zstandard.ZstdDecompressor().decompress(data)
+    elif codec == 'zlib':
+        data = zlib.decompress(data)
+    return data.decode('utf-8')
@@ -0,0 +1,41 @@
+# backend/users/consumers.py
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from .models import Student, Course
+from .realtime import student_group, course_group
+
+
+class GradingStatusConsumer(AsyncJsonWebsocketConsumer):
+    """Pushes submission status changes to the submitting student and the course teacher."""
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close(code=4401)
+            return
+        self.status_groups = await self.groups_for(user)
+        if not self.status_groups:
+            await self.close(code=4403)
+            return
+        for group in self.status_groups:
+            await self.channel_layer.group_add(group, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        for group in getattr(self, 'status_groups', []):
+            await self.channel_layer.group_discard(group, self.channel_name)
+
+    @database_sync_to_async
+    def groups_for(self, user):
+        if user.user_role == 'student':
+            student = Student.objects.filter(user=user).values_list('id', flat=True).first()
+            return [student_group(student)] if student else []
+        if user.user_role == 'teacher':
+            courses = Course.objects.filter(teacher__user=user).values_list('id', flat=True)
+            return [course_group(course_id) for course_id in courses]
+        return []
+
+    async def submission_status(self, event):
+        await self.send_json(event['submission'])
@@ -0,0 +1,234 @@
+# backend/users/drafts.py
+"""
+Delta-compressed autosave for code editors.
+
+Editors send edits against the draft version they last saw instead of the
+whole text. An edit is a list of [position, delete_count, insert] ops
+applied in order, e.g. [[120, 3, 'foo']] replaces three characters at 120.
+Each autosave stores only those ops as a DraftPatch and bumps the draft's
+version; the full text is not rewritten.
+
+A draft is its snapshot plus the patches after snapshot_version. The
+current text is cached per version, so an autosave usually reads no
+patches at all. Every DRAFT_COMPACT_EVERY patches, or DRAFT_COMPACT_INTERVAL
+seconds after the last snapshot, the text is folded into a new snapshot,
+the older patches are deleted and the text is written through to where the
+rest of the app reads it: PlayGround.code_area or QuizSession.draft_code.
+A save that does not compact schedules flush_draft_task for
+DRAFT_COMPACT_INTERVAL seconds later, so the last edits before the editor
+goes quiet are written through too, and listing playgrounds flushes the
+student's drafts first.
+
+An edit against an older version is refused with the current version and
+text so the editor can rebase. Clients that can only send full text can
+still PATCH {"text": ...}; the server stores the line diff, so the write
+is just as small.
+"""
+
+import difflib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import CodeDraft, DraftPatch, PlayGround, QuizSession, Assessment
+from .quiz_sessions import ensure_open
+
+
+DRAFT_CACHE_PREFIX = 'code-draft'
+
+
+class InvalidPatch(ValueError):
+    pass
+
+
+class DraftConflict(Exception):
+    """The edit was made against an older version of the draft."""
+
+    def __init__(self, version, text):
+        super().__init__(f'The draft is at version {version}.')
+        self.version = version
+        self.text = text
+
+
+def apply_ops(text, ops):
+    """Applies [position, delete_count, insert] ops in order."""
+    if not isinstance(ops, list):
+        raise InvalidPatch('ops must be a list of [position, delete_count, insert].')
+    for op in ops:
+        if not isinstance(op, (list, tuple)) or len(op) != 3:
+            raise InvalidPatch('Each op must be [position, delete_count, insert].')
+        position, delete, insert = op
+        if not isinstance(position, int) or not isinstance(delete, int) or not isinstance(insert, str):
+            raise InvalidPatch('Each op must be [position, delete_count, insert].')
+        if position < 0 or delete < 0 or position + delete > len(text):
+            raise InvalidPatch(f'Op {list(op)} is outside the text.')
+        text = text[:position] + insert + text[position + delete:]
+    if len(text) > settings.DRAFT_MAX_LENGTH:
+        raise InvalidPatch('The draft is too long.')
+    return text
+
+
+def diff_ops(old, new):
+    """Ops that turn `old` into `new`, compared line by line."""
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    offsets = [0]
+    for line in old_lines:
+        offsets.append(offsets[-1] + len(line))
+
+    ops = []
+    # Positions are in the text as already edited by the earlier ops
+    shift = 0
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+        deleted = offsets[i2] - offsets[i1]
+        inserted = ''.join(new_lines[j1:j2])
+        ops.append([offsets[i1] + shift, deleted, inserted])
+        shift += len(inserted) - deleted
+    return ops
+
+
+def _cache_key(draft_id):
+    return f'{DRAFT_CACHE_PREFIX}:{draft_id}'
+
+
+def _flush_key(draft_id):
+    return f'{DRAFT_CACHE_PREFIX}:flush:{draft_id}'
+
+
+def current_text(draft):
+    cached = cache.get(_cache_key(draft.id))
+    if cached is not None and cached[0] == draft.version:
+        return cached[1]
+    text = draft.snapshot
+    for ops in draft.patches.filter(version__gt=draft.snapshot_version).order_by('version').values_list('ops', flat=True):
+        text = apply_ops(text, ops)
+    cache.set(_cache_key(draft.id), (draft.version, text), timeout=settings.DRAFT_CACHE_TTL)
+    return text
+
+
+def draft_source(student, kind, object_id):
+    """
+    The text a new draft starts from. Raises ObjectDoesNotExist when the
+    student has nothing to edit there, and SessionClosed for a quiz whose
+    session is over.
+    """
+    if kind == 'playground':
+        return PlayGround.objects.get(playground_id=object_id, student=student).code_area or ''
+    if kind == 'quiz':
+        session = QuizSession.objects.get(quiz__quiz_id=object_id, student=student)
+        ensure_open(session)
+        return session.draft_code
+    if kind == 'assessment':
+        Assessment.objects.get(assessment_id=object_id)
+        return ''
+    raise CodeDraft.DoesNotExist
+
+
+def get_draft(student, kind, object_id):
+    """The student's draft, created from its source the first time."""
+    draft = CodeDraft.objects.filter(student=student, kind=kind, object_id=object_id).first()
+    if draft is None:
+        text = draft_source(student, kind, object_id)
+        draft, _ = CodeDraft.objects.get_or_create(
+            student=student, kind=kind, object_id=object_id, defaults={'snapshot': text})
+    elif kind == 'quiz':
+        draft_source(student, kind, object_id)
+    return draft
+
+
+def _write_through(draft, text, now):
+    if draft.kind == 'playground':
+        PlayGround.objects.filter(playground_id=draft.object_id, student_id=draft.student_id).update(code_area=text)
+    elif draft.kind == 'quiz':
+        QuizSession.objects.filter(
+            quiz__quiz_id=draft.object_id, student_id=draft.student_id, status='ACTIVE',
+        ).update(draft_code=text, draft_saved_at=now)
+
+
+def _compact(draft, text, now):
+    draft.snapshot = text
+    draft.snapshot_version = draft.version
+    draft.snapshot_at = now
+    draft.patches.filter(version__lte=draft.version).delete()
+    _write_through(draft, text, now)
+
+
+def _due_for_snapshot(draft, now):
+    return (
+        draft.version - draft.snapshot_version >= settings.DRAFT_COMPACT_EVERY
+        or now - draft.snapshot_at >= timedelta(seconds=settings.DRAFT_COMPACT_INTERVAL)
+    )
+
+
+def save_patch(draft, base_version, ops=None, text=None):
+    """
+    Applies `ops` (or the diff to `text`) to the draft at `base_version`, or
+    to its latest version when base_version is None. Returns the new version.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        draft = CodeDraft.objects.select_for_update().get(id=draft.id)
+        current = current_text(draft)
+        if base_version is not None and base_version != draft.version:
+            raise DraftConflict(draft.version, current)
+        if ops is None:
+            ops = diff_ops(current, text)
+        if not ops:
+            return draft.version
+        current = apply_ops(current, ops)
+
+        draft.version += 1
+        DraftPatch.objects.create(draft=draft, version=draft.version, ops=ops)
+        fields = ['version', 'updated_at']
+        if _due_for_snapshot(draft, now):
+            _compact(draft, current, now)
+            fields += ['snapshot', 'snapshot_version', 'snapshot_at']
+        else:
+            draft_id = draft.id
+            transaction.on_commit(lambda: schedule_flush(draft_id), robust=True)
+        draft.save(update_fields=fields)
+        version = draft.version
+        # Only cache text that was committed
+        transaction.on_commit(
+            lambda: cache.set(_cache_key(draft.id), (version, current), timeout=settings.DRAFT_CACHE_TTL))
+    return version
+
+
+def schedule_flush(draft_id):
+    """Queues one flush of the draft DRAFT_COMPACT_INTERVAL seconds from now, unless one is queued."""
+    if cache.add(_flush_key(draft_id), 1, timeout=settings.DRAFT_COMPACT_INTERVAL):
+        from .tasks import flush_draft_task
+
+        flush_draft_task.apply_async(args=[draft_id], countdown=settings.DRAFT_COMPACT_INTERVAL)
+
+
+def flush_draft(draft):
+    """Snapshots the draft now and writes it through. Returns its text."""
+    # Edits from here on need a flush of their own
+    cache.delete(_flush_key(draft.id))
+    with transaction.atomic():
+        draft = CodeDraft.objects.select_for_update().get(id=draft.id)
+        text = current_text(draft)
+        if draft.version != draft.snapshot_version:
+            _compact(draft, text, timezone.now())
+            draft.save(update_fields=['snapshot', 'snapshot_version', 'snapshot_at', 'updated_at'])
+    return text
+
+
+def flush_student_drafts(student, kind):
+    """Writes through every draft of the student's that has edits since its snapshot."""
+    for draft in CodeDraft.objects.filter(student=student, kind=kind).exclude(version=F('snapshot_version')):
+        flush_draft(draft)
+
+
+def latest_text(student_id, kind, object_id, default=''):
+    """The draft's current text, or `default` if the student has no draft there."""
+    draft = CodeDraft.objects.filter(student_id=student_id, kind=kind, object_id=object_id).first()
+    return current_text(draft) if draft is not None else default
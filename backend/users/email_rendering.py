@@ -0,0 +1,83 @@
+# backend/users/email_rendering.py
+"""
+Fast rendering for transactional email templates.
+
+A template is compiled once into a render plan: runs of static text are
+joined into plain strings ahead of time, and only the per-user parts
+({{ variables }} and any tags) are evaluated for each context. Rendering
+many contexts therefore costs little more than formatting the fields that
+actually differ between users. Output matches render_to_string.
+"""
+
+from functools import lru_cache
+
+from django.conf import settings
+from django.template import Context
+from django.template.base import TextNode, VariableNode, render_value_in_context
+from django.template.loader import get_template
+
+
+class CompiledEmailTemplate:
+    def __init__(self, template):
+        # The Django backend wraps the engine-level Template
+        self.template = getattr(template, 'template', template)
+        self.autoescape = self.template.engine.autoescape
+        self.parts = []
+        static = []
+        for node in self.template.nodelist:
+            if isinstance(node, TextNode):
+                static.append(node.s)
+                continue
+            if static:
+                self.parts.append(''.join(static))
+                static = []
+            self.parts.append(node)
+        if static:
+            self.parts.append(''.join(static))
+
+    def _render_part(self, part, context):
+        if isinstance(part, str):
+            return part
+        if isinstance(part, VariableNode):
+            return render_value_in_context(part.filter_expression.resolve(context), context)
+        return part.render_annotated(context)
+
+    def render(self, data):
+        context = Context(data, autoescape=self.autoescape)
+        # Same setup Template.render does, for tags that rely on it
+        with context.render_context.push_state(self.template), context.bind_template(self.template):
+            context.template_name = self.template.name
+            return ''.join(self._render_part(part, context) for part in self.parts)
+
+    def render_many(self, contexts):
+        return [self.render(data) for data in contexts]
+
+
+@lru_cache(maxsize=64)
+def _compiled(name):
+    return CompiledEmailTemplate(get_template(name))
+
+
+def get_email_template(name):
+    """
+    Returns the compiled template, kept for the life of the process. With
+    DEBUG on it is recompiled every time so template edits show up.
+    """
+    if settings.DEBUG:
+        return CompiledEmailTemplate(get_template(name))
+    return _compiled(name)
+
+
+def render_email(name, context):
+    return get_email_template(name).render(context)
+
+
+def render_email_batch(template, contexts):
+    """
+    Renders the text and HTML parts of one email template for many contexts.
+    `template` is the path without extension, e.g. 'admin/create_new_user'.
+    Returns a list of (text_body, html_body).
+    """
+    text = get_email_template(f'{template}.txt').render_many(contexts)
+    html = get_email_template(f'{template}.html').render_many(contexts)
+    return list(zip(text, html))
@@ -0,0 +1,136 @@
+# backend/users/gradebook.py
+"""
+Materialized gradebook.
+
+GradebookEntry holds one row per student and assessment/quiz with the
+attempt count, best and latest score and the status of the latest attempt.
+Whenever submissions are created or graded, refresh_gradebook recomputes
+just the rows they belong to from those students' attempts on that work
+and upserts them in one statement, so the gradebook views are a single
+indexed read of GradebookEntry instead of a scan of Submission. The
+courses' cached analytics are invalidated and the new statuses are pushed
+to WebSocket clients at the same time.
+
+rebuild_gradebook recomputes everything, e.g. after the table is first
+added; see the rebuild_gradebook management command.
+"""
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .analytics import invalidate_course_analytics
+from .models import Submission, GradebookEntry
+from .realtime import publish_submission_status
+
+
+ENTRY_FIELDS = [
+    'course', 'assessment', 'quiz', 'attempts', 'graded_attempts', 'best_score', 'latest_score',
+    'status', 'latest_submission', 'last_submitted_at', 'updated_at',
+]
+
+ATTEMPT_FIELDS = [
+    'id', 'student_id', 'assessment_id', 'quiz_id', 'assessment__course_id', 'quiz__course_id',
+    'score', 'grading_status', 'submitted_at',
+]
+
+
+def work_key(assessment_id=None, quiz_id=None):
+    return f'A{assessment_id}' if assessment_id else f'Q{quiz_id}'
+
+
+def _entries(attempts):
+    """Builds GradebookEntry objects from attempt rows, one per student and work."""
+    grouped = {}
+    for row in attempts:
+        if not row['student_id'] or not (row['assessment_id'] or row['quiz_id']):
+            continue
+        grouped.setdefault((row['student_id'], work_key(row['assessment_id'], row['quiz_id'])), []).append(row)
+
+    entries = []
+    for (student_id, key), rows in grouped.items():
+        latest = max(rows, key=lambda row: (row['submitted_at'], row['id']))
+        graded = [row['score'] for row in rows if row['grading_status'] == 'GRADED' and row['score'] is not None]
+        entries.append(GradebookEntry(
+            course_id=latest['assessment__course_id'] or latest['quiz__course_id'],
+            student_id=student_id,
+            assessment_id=latest['assessment_id'],
+            quiz_id=latest['quiz_id'],
+            work_key=key,
+            attempts=len(rows),
+            graded_attempts=len(graded),
+            best_score=max(graded) if graded else None,
+            latest_score=latest['score'] if latest['grading_status'] == 'GRADED' else None,
+            status=latest['grading_status'],
+            latest_submission_id=latest['id'],
+            last_submitted_at=latest['submitted_at'],
+        ))
+    return entries
+
+
+def _upsert(entries):
+    # MySQL's ON DUPLICATE KEY UPDATE takes no conflict target
+    target = ['student', 'work_key'] if connection.features.supports_update_conflicts_with_target else None
+    GradebookEntry.objects.bulk_create(
+        entries,
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=target,
+        update_fields=ENTRY_FIELDS,
+    )
+
+
+def refresh_gradebook(submissions):
+    """
+    Recomputes the gradebook rows of the students and work these submissions
+    belong to. Call it after the submissions are saved, not from inside a
+    transaction that still holds their row locks.
+    """
+    keys = {
+        (submission.student_id, submission.assessment_id, submission.quiz_id)
+        for submission in submissions
+        if submission.student_id and (submission.assessment_id or submission.quiz_id)
+    }
+    if not keys:
+        return
+    condition = Q()
+    for student_id, assessment_id, quiz_id in keys:
+        if assessment_id:
+            condition |= Q(student_id=student_id, assessment_id=assessment_id)
+        else:
+            condition |= Q(student_id=student_id, quiz_id=quiz_id, assessment__isnull=True)
+    with transaction.atomic():
+        # A locking read sees the latest committed attempts, and a concurrent
+        # refresh of the same rows waits for this one instead of upserting
+        # an older snapshot over it. Locks are taken in id order.
+        attempts = list(
+            Submission.objects.filter(condition).select_for_update(of=('self',))
+            .order_by('id').values(*ATTEMPT_FIELDS)
+        )
+        entries = _entries(attempts)
+        _upsert(entries)
+    invalidate_course_analytics(entry.course_id for entry in entries)
+    changed = {submission.pk for submission in submissions}
+    statuses = [row for row in attempts if row['id'] in changed]
+    # Clients may fetch the submission as soon as they hear about it
+    transaction.on_commit(lambda: publish_submission_status(statuses))
+
+
+def save_submission(submission):
+    """Saves a submission and brings its gradebook row up to date."""
+    submission.save()
+    refresh_gradebook([submission])
+
+
+def rebuild_gradebook(course=None):
+    """Recomputes the whole gradebook, or one course's, from scratch. Returns the number of rows."""
+    submissions = Submission.objects.all()
+    entries = GradebookEntry.objects.all()
+    if course is not None:
+        submissions = submissions.filter(Q(assessment__course=course) | Q(quiz__course=course))
+        entries = entries.filter(course=course)
+    rows = _entries(submissions.values(*ATTEMPT_FIELDS).iterator(chunk_size=5000))
+    with transaction.atomic():
+        entries.delete()
+        _upsert(rows)
+    invalidate_course_analytics(entry.course_id for entry in rows)
+    return len(rows)
@@ -0,0 +1,247 @@
+# backend/users/grading_worker.py
+
+import asyncio
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+import openai
+from openai import AsyncOpenAI
+
+from .models import Submission
+from .gradebook import refresh_gradebook
+from .notifications import notify_graded
+from .rate_limit import get_rate_limiter, estimate_tokens, backoff_delay
+from .service import (
+    build_grading_request, parse_ai_response, get_cached_grade, cache_grade,
+    provider_retry_after, TRANSIENT_PROVIDER_ERRORS,
+)
+
+
+logger = logging.getLogger(__name__)
+
+GRADING_FAILED_FEEDBACK = "AI grading failed due to an internal error."
+
+
+def grading_inputs(submission):
+    """
+    Returns (instructor_solution, grading_parameters) for a submission, or
+    None when it is not linked to an assessment or quiz of its type.
+    """
+    if submission.submission_type == 'ASSESSMENT' and submission.assessment:
+        return submission.assessment.instructor_solution, submission.assessment.ai_grading_parameters
+    if submission.submission_type == 'QUIZ' and submission.quiz:
+        return submission.quiz.instructor_solution, submission.quiz.ai_grading_parameters
+    return None
+
+
+class GradingWorker:
+    """
+    Grades pending submissions in micro-batches.
+
+    A worker owns one event loop and one AsyncOpenAI client for its whole
+    lifetime, so connections to the provider are pooled and reused across
+    batches. Each batch is graded concurrently, capped at `concurrency`
+    in-flight requests, and written back with a single bulk_update.
+
+    A submission that cannot be graded is retried up to
+    AI_GRADING_MAX_ATTEMPTS times, AI_GRADING_RETRY_DELAY seconds apart
+    (growing with each attempt), and then marked FAILED for the teacher.
+    """
+
+    def __init__(self, batch_size=None, concurrency=None):
+        self.batch_size = batch_size or settings.AI_GRADING_BATCH_SIZE
+        self.concurrency = concurrency or settings.AI_GRADING_CONCURRENCY
+        self._loop = asyncio.new_event_loop()
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = AsyncOpenAI(
+                api_key=settings.OPENAI_API_KEY,
+                base_url=settings.OPENAI_BASE_URL,
+                timeout=settings.AI_GRADING_TIMEOUT,
+                # Retries are paced by the shared rate limiter instead
+                max_retries=0,
+            )
+        return self._client
+
+    def pending_submissions(self, now=None):
+        now = now or timezone.now()
+        return (
+            Submission.objects
+            .filter(grading_status='PENDING')
+            .filter(Q(assessment__use_ai_grading=True) | Q(quiz__use_ai_grading=True))
+            # Submissions with test cases are graded by grade_submission_task
+            .filter(assessment__test_cases__isnull=True, quiz__test_cases__isnull=True)
+            # Leased to a worker, or waiting to be retried
+            .filter(Q(grading_available_at__isnull=True) | Q(grading_available_at__lte=now))
+            .select_related('assessment', 'quiz', 'code_blob')
+            .order_by('submitted_at', 'id')
+        )
+
+    def claim_batch(self):
+        """
+        Leases up to batch_size pending submissions to this worker.
+
+        Rows are locked with SKIP LOCKED only while the lease is written, so
+        several workers can run side by side without grading twice and no
+        transaction stays open while the provider is called. A worker that
+        dies leaves rows that are claimed again once AI_GRADING_LEASE runs out.
+        """
+        now = timezone.now()
+        lease = now + timedelta(seconds=settings.AI_GRADING_LEASE)
+        with transaction.atomic():
+            batch = list(
+                self.pending_submissions(now)
+                .select_for_update(skip_locked=True, of=('self',))[:self.batch_size]
+            )
+            if batch:
+                Submission.objects.filter(pk__in=[submission.pk for submission in batch]).update(
+                    grading_attempts=F('grading_attempts') + 1,
+                    grading_available_at=lease,
+                )
+        for submission in batch:
+            submission.grading_attempts += 1
+            submission.grading_available_at = lease
+        return batch
+
+    def grade_batch(self, batch):
+        """
+        Grades claimed submissions and writes back those whose lease this
+        worker still holds. Returns the number graded.
+        """
+        leases = {}
+        for submission in batch:
+            leases.setdefault(submission.grading_available_at, []).append(submission.pk)
+        jobs = []
+        results = {}
+        for submission in batch:
+            inputs = grading_inputs(submission)
+            if inputs is None:
+                continue
+            cached = get_cached_grade(submission.submitted_code, *inputs)
+            if cached is not None:
+                results[submission.pk] = cached
+            else:
+                jobs.append((submission, inputs))
+
+        graded = self._loop.run_until_complete(self._grade_all(jobs))
+        for (submission, inputs), result in zip(jobs, graded):
+            cache_grade(submission.submitted_code, *inputs, *result)
+            results[submission.pk] = result
+
+        now = timezone.now()
+        for submission in batch:
+            submission.grading_available_at = None
+            if submission.pk not in results:
+                # Not linked to an assessment or quiz of its type; nothing to grade against
+                submission.grading_status = 'FAILED'
+                continue
+            submission.score, submission.ai_feedback = results[submission.pk]
+            if submission.score is not None:
+                submission.grading_status = 'GRADED'
+            elif submission.grading_attempts >= settings.AI_GRADING_MAX_ATTEMPTS:
+                # Left for the teacher rather than retried forever ahead of newer work
+                submission.grading_status = 'FAILED'
+            else:
+                delay = settings.AI_GRADING_RETRY_DELAY * submission.grading_attempts
+                submission.grading_available_at = now + timedelta(seconds=delay)
+
+        with transaction.atomic():
+            # A lease that ran out while grading was slow belongs to whichever worker claimed the rows again
+            held = Q()
+            for lease, pks in leases.items():
+                held |= Q(pk__in=pks, grading_available_at=lease)
+            kept = set(
+                Submission.objects.select_for_update().filter(held, grading_status='PENDING')
+                .values_list('pk', flat=True)
+            ) if batch else set()
+            batch = [submission for submission in batch if submission.pk in kept]
+            Submission.objects.bulk_update(batch, ['score', 'ai_feedback', 'grading_status', 'grading_available_at'])
+        # Outside the update's transaction; the refresh locks the students' attempts itself
+        refresh_gradebook(batch)
+        notify_graded([submission for submission in batch if submission.grading_status == 'GRADED'])
+        return sum(1 for submission in batch if submission.grading_status == 'GRADED')
+
+    def run_once(self):
+        """Claims and grades one batch. Returns the number of submissions that were graded."""
+        return self.grade_batch(self.claim_batch())
+
+    def run_forever(self, idle_sleep=None):
+        idle_sleep = settings.AI_GRADING_IDLE_SLEEP if idle_sleep is None else idle_sleep
+        while True:
+            batch = self.claim_batch()
+            if not batch:
+                time.sleep(idle_sleep)
+                continue
+            self.grade_batch(batch)
+
+    def drain(self):
+        """Grades batches until there is nothing left to claim. Returns the number graded."""
+        total = 0
+        while True:
+            batch = self.claim_batch()
+            if not batch:
+                return total
+            total += self.grade_batch(batch)
+
+    def close(self):
+        if self._client is not None:
+            self._loop.run_until_complete(self._client.close())
+            self._client = None
+        self._loop.close()
+
+    async def _grade_all(self, jobs):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(*[
+            self._grade(semaphore, submission.submitted_code, instructor_solution, grading_parameters)
+            for submission, (instructor_solution, grading_parameters) in jobs
+        ])
+
+    async def _grade(self, semaphore, submitted_code, instructor_solution, grading_parameters):
+        request = build_grading_request(submitted_code, instructor_solution, grading_parameters)
+        tokens = estimate_tokens(request)
+        limiter = get_rate_limiter()
+
+        for attempt in range(settings.AI_GRADING_MAX_RETRIES + 1):
+            async with semaphore:
+                wait = limiter.try_acquire(tokens)
+                while wait:
+                    await asyncio.sleep(wait)
+                    wait = limiter.try_acquire(tokens)
+
+                try:
+                    response = await self.client.chat.completions.create(**request)
+                except openai.RateLimitError as e:
+                    limiter.on_rate_limited()
+                    delay = backoff_delay(attempt, provider_retry_after(e))
+                except TRANSIENT_PROVIDER_ERRORS as e:
+                    delay = backoff_delay(attempt, provider_retry_after(e))
+                except Exception:
+                    logger.exception("AI grading request failed")
+                    return None, GRADING_FAILED_FEEDBACK
+                else:
+                    limiter.on_success()
+                    return parse_ai_response(response.choices[0].message.content.strip())
+
+            # Back off outside the semaphore so other requests keep flowing
+            await asyncio.sleep(delay)
+
+        return None, GRADING_FAILED_FEEDBACK
+
+
+_worker = None
+
+
+def get_worker():
+    """Returns this process's shared grading worker."""
+    global _worker
+    if _worker is None:
+        _worker = GradingWorker()
+    return _worker
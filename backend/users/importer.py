@@ -0,0 +1,198 @@
+# backend/users/importer.py
+"""
+Streaming bulk user import.
+
+Rows are read from the uploaded CSV/XLSX file one at a time and handled in
+chunks: each chunk is validated as a DataFrame, checked against the
+database with one query, inserted with bulk_create inside its own
+transaction (see users/provisioning.py), and its credential emails are
+queued in the outbox.
+Progress is written to the UserImportJob after every chunk.
+"""
+
+import csv
+import io
+from itertools import islice
+
+import pandas as pd
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import User, Admin, UserImportJob
+from .provisioning import create_accounts, existing_emails, send_credentials
+
+
+REQUIRED_COLUMNS = ['email', 'user-role']
+IMPORTABLE_ROLES = ['teacher', 'student']
+EMAIL_PATTERN = r'^[^@\s]+@[^@\s]+\.[^@\s]+$'
+
+
+class ImportFileError(Exception):
+    pass
+
+
+def _is_xlsx(name):
+    return name.lower().endswith('.xlsx')
+
+
+def _clean_header(values):
+    return [str(value).strip().lower() if value is not None else '' for value in values]
+
+
+def _check_columns(columns):
+    missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+    if missing:
+        raise ImportFileError(f'File must contain {", ".join(missing)} column(s)')
+    return columns
+
+
+def read_columns(file, name):
+    """Reads and checks just the header row, leaving the file rewound."""
+    if _is_xlsx(name):
+        import openpyxl
+
+        workbook = openpyxl.load_workbook(file, read_only=True)
+        header = next(workbook.active.iter_rows(max_row=1, values_only=True), None)
+    else:
+        line = file.readline().decode('utf-8-sig')
+        header = next(csv.reader([line]), None) if line else None
+    file.seek(0)
+    if header is None:
+        raise ImportFileError("The file is empty.")
+    return _check_columns(_clean_header(header))
+
+
+def read_rows(file, name):
+    """
+    Returns (columns, rows) for an uploaded file, where rows lazily yields
+    one tuple per non-blank data row. Only the current row is held in memory.
+    """
+    if _is_xlsx(name):
+        import openpyxl
+
+        workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+        rows = workbook.active.iter_rows(values_only=True)
+    else:
+        rows = csv.reader(io.TextIOWrapper(file, encoding='utf-8-sig', newline=''))
+
+    try:
+        columns = _check_columns(_clean_header(next(rows)))
+    except StopIteration:
+        raise ImportFileError("The file is empty.")
+    width = len(columns)
+    return columns, (
+        (tuple(row) + (None,) * width)[:width]
+        for row in rows if any(value not in (None, '') for value in row)
+    )
+
+
+def count_rows(file, name):
+    """Counts the data rows of a file without loading it, for progress reporting."""
+    if _is_xlsx(name):
+        import openpyxl
+
+        workbook = openpyxl.load_workbook(file, read_only=True)
+        return max(0, (workbook.active.max_row or 1) - 1)
+    return max(0, sum(1 for _ in io.TextIOWrapper(file, encoding='utf-8-sig', newline='')) - 1)
+
+
+def validate_chunk(frame, seen_emails):
+    """
+    Normalizes and validates a chunk of rows in one pass per check. Returns
+    the valid rows and a list of per-row errors. `seen_emails` carries the
+    emails of earlier chunks so duplicates are caught across the whole file.
+    """
+    frame['email'] = frame['email'].fillna('').astype(str).str.strip().str.lower()
+    frame['user-role'] = frame['user-role'].fillna('').astype(str).str.strip().str.lower()
+
+    problems = pd.Series('', index=frame.index)
+    checks = [
+        (frame['email'] == '', "Missing email."),
+        (~frame['email'].str.match(EMAIL_PATTERN), "Invalid email address."),
+        (~frame['user-role'].isin(IMPORTABLE_ROLES), "User role must be teacher or student."),
+        (frame['email'].duplicated() | frame['email'].isin(seen_emails), "Duplicate email in file."),
+    ]
+    for mask, message in checks:
+        problems = problems.mask(mask & (problems == ''), message)
+
+    candidates = frame.loc[problems == '', 'email'].tolist()
+    existing = existing_emails(candidates)
+    problems = problems.mask(frame['email'].isin(existing) & (problems == ''), "A user with this email already exists.")
+
+    seen_emails.update(frame['email'])
+    errors = [
+        {'row': int(row), 'email': email, 'error': problem}
+        for row, email, problem in zip(frame['row'], frame['email'], problems)
+        if problem
+    ]
+    return frame[problems == ''], errors
+
+
+class UserImporter:
+    def __init__(self, job, chunk_size=None):
+        self.job = job
+        self.chunk_size = chunk_size or settings.USER_IMPORT_CHUNK_SIZE
+        admin = Admin.objects.filter(institution=job.institution).select_related('user').first()
+        self.from_email = admin.user.email if admin else settings.FROM_EMAIL
+
+    def run(self):
+        job = self.job
+        with job.file.open('rb') as file:
+            job.total_rows = count_rows(file, job.file.name)
+        job.status = 'running'
+        job.save(update_fields=['status', 'total_rows'])
+
+        errors = []
+        seen_emails = set()
+        try:
+            with job.file.open('rb') as file:
+                columns, rows = read_rows(file, job.file.name)
+                # Spreadsheet numbering: the header is row 1
+                numbered = ((number, row) for number, row in enumerate(rows, start=2))
+                while True:
+                    chunk = list(islice(numbered, self.chunk_size))
+                    if not chunk:
+                        break
+                    frame = pd.DataFrame([row for _, row in chunk], columns=columns)
+                    frame['row'] = [number for number, _ in chunk]
+                    valid, chunk_errors = validate_chunk(frame, seen_emails)
+                    created = self.import_chunk(valid, chunk_errors)
+                    errors.extend(chunk_errors)
+
+                    job.processed_rows += len(chunk)
+                    job.created_count += created
+                    job.errors = errors
+                    job.save(update_fields=['processed_rows', 'created_count', 'errors'])
+        except Exception as e:
+            job.status = 'failed'
+            job.errors = errors + [{'row': None, 'email': None, 'error': str(e)}]
+        else:
+            job.status = 'completed'
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'errors', 'finished_at'])
+        return job
+
+    def import_chunk(self, frame, errors):
+        """Inserts one validated chunk in a single transaction. Returns the number created."""
+        if frame.empty:
+            return 0
+
+        specs = [(int(row), email, role) for row, email, role in zip(frame['row'], frame['email'], frame['user-role'])]
+        accounts, insert_errors = create_accounts(self.job.institution, specs)
+        errors.extend(insert_errors)
+        send_credentials(
+            accounts, self.from_email, 'admin/create_new_user',
+            "Your {user_role} Account for Institution Management System",
+        )
+        return len(accounts)
+
+
+def start_import(institution, file, created_by=None):
+    """Checks the file's header, stores it and queues the import. Returns the job."""
+    from .tasks import import_users_task
+
+    read_columns(file, file.name)
+    job = UserImportJob.objects.create(institution=institution, file=file, created_by=created_by)
+    transaction.on_commit(lambda: import_users_task.delay(job.id))
+    return job
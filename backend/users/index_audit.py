@@ -0,0 +1,135 @@
+# backend/users/index_audit.py
+"""
+Checks that querysets have an index to filter by.
+
+For every table a queryset filters with equality lookups (exact, in,
+isnull), there must be an index whose leading columns cover those filters,
+possibly together with the join column the table is reached through, or a
+unique index on filtered columns alone. Otherwise the database has to scan
+the table, which is what shows up in the MySQL slow log.
+
+Use audit_queryset on a single queryset, or wrap code in unindexed_queries()
+to audit every queryset it evaluates, as IndexAuditTestCase does for the
+hot views.
+"""
+
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.db import connection
+from django.db.models import UniqueConstraint
+from django.db.models.expressions import Col
+from django.db.models.lookups import Lookup
+from django.db.models.query import QuerySet
+from django.db.models.sql.datastructures import Join
+from django.db.models.sql.where import AND
+
+
+EQUALITY_LOOKUPS = {'exact', 'iexact', 'in', 'isnull'}
+
+
+def model_indexes(model):
+    """Returns (columns, unique) for every index of a model, columns in index order."""
+    meta = model._meta
+    indexes = []
+    for field in meta.concrete_fields:
+        if field.primary_key or field.unique:
+            indexes.append(((field.column,), True))
+        elif field.db_index:
+            indexes.append(((field.column,), False))
+    for index in meta.indexes:
+        # Partial indexes are silently skipped on MySQL
+        if index.condition is not None and not connection.features.supports_partial_indexes:
+            continue
+        if index.fields:
+            columns = tuple(meta.get_field(name.lstrip('-')).column for name in index.fields)
+            indexes.append((columns, False))
+    for fields in meta.unique_together:
+        indexes.append((tuple(meta.get_field(name).column for name in fields), True))
+    for constraint in meta.constraints:
+        if isinstance(constraint, UniqueConstraint) and constraint.fields and constraint.condition is None:
+            indexes.append((tuple(meta.get_field(name).column for name in constraint.fields), True))
+    return indexes
+
+
+def _equality_columns(where, columns):
+    """Collects (alias, column) pairs filtered by equality, following AND branches only."""
+    if where.connector != AND or where.negated:
+        return
+    for child in where.children:
+        if isinstance(child, Lookup):
+            if child.lookup_name in EQUALITY_LOOKUPS and isinstance(child.lhs, Col):
+                columns.setdefault(child.lhs.alias, set()).add(child.lhs.target.column)
+        elif hasattr(child, 'children'):
+            _equality_columns(child, columns)
+
+
+def is_supported(indexes, filtered, reachable):
+    """
+    Whether one of `indexes` serves an equality filter on the `filtered`
+    columns of a table whose `reachable` columns (the filtered ones plus any
+    join columns) are known at lookup time.
+    """
+    for columns, unique in indexes:
+        prefix = []
+        for column in columns:
+            if column not in reachable:
+                break
+            prefix.append(column)
+        if not prefix:
+            continue
+        if filtered <= set(prefix) or (unique and len(prefix) == len(columns)):
+            return True
+    return False
+
+
+def audit_queryset(queryset):
+    """
+    Returns one problem per table the queryset filters without a supporting
+    index, as dicts with 'table' and 'columns'.
+    """
+    query = queryset.query
+    tables = {model._meta.db_table: model for model in apps.get_models()}
+
+    filtered = {}
+    _equality_columns(query.where, filtered)
+
+    join_columns = {}
+    for alias, join in query.alias_map.items():
+        if isinstance(join, Join):
+            for parent_column, child_column in join.join_cols:
+                join_columns.setdefault(join.parent_alias, set()).add(parent_column)
+                join_columns.setdefault(alias, set()).add(child_column)
+
+    problems = []
+    for alias, columns in filtered.items():
+        model = tables.get(query.alias_map[alias].table_name)
+        if model is None:
+            continue
+        reachable = columns | join_columns.get(alias, set())
+        if not is_supported(model_indexes(model), columns, reachable):
+            problems.append({'table': model._meta.db_table, 'columns': sorted(columns)})
+    return problems
+
+
+@contextmanager
+def unindexed_queries():
+    """
+    Audits every queryset evaluated inside the block. Yields a list that
+    collects (model label, problems) for each one that lacks an index.
+    """
+    found = []
+    fetch_all = QuerySet._fetch_all
+
+    def audited_fetch_all(queryset):
+        if queryset._result_cache is None:
+            problems = audit_queryset(queryset)
+            if problems:
+                found.append((queryset.model._meta.label, problems))
+        return fetch_all(queryset)
+
+    QuerySet._fetch_all = audited_fetch_all
+    try:
+        yield found
+    finally:
+        QuerySet._fetch_all = fetch_all
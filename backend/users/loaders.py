@@ -0,0 +1,63 @@
+# backend/users/loaders.py
+
+from collections import defaultdict
+
+from .models import Submission
+
+
+# Columns needed for a score summary; submitted_code is deliberately left out.
+SCORE_FIELDS = [
+    'id',
+    'student_id',
+    'submission_type',
+    'assessment__assessment_id',
+    'quiz__quiz_id',
+    'score',
+    'grading_status',
+    'submitted_at',
+]
+
+
+class StudentScoreLoader:
+    """
+    DataLoader-style batch loader for student score summaries.
+
+    Students are queued with prime() and fetched together the first time any
+    of them is loaded, so a page of students costs a single grouped query.
+    Loading a student that was never primed falls back to a batch of one.
+    """
+
+    def __init__(self):
+        self._pending = set()
+        self._cache = {}
+
+    def prime(self, students):
+        for student in students:
+            if student.pk not in self._cache:
+                self._pending.add(student.pk)
+
+    def load(self, student):
+        if student.pk not in self._cache:
+            self._pending.add(student.pk)
+            self._dispatch()
+        return self._cache[student.pk]
+
+    def _dispatch(self):
+        student_ids = self._pending
+        self._pending = set()
+
+        grouped = defaultdict(list)
+        rows = Submission.objects.filter(student_id__in=student_ids).order_by('student_id', 'submitted_at').values(*SCORE_FIELDS)
+        for row in rows:
+            grouped[row['student_id']].append({
+                'submission_id': row['id'],
+                'submission_type': row['submission_type'],
+                'assessment_id': row['assessment__assessment_id'],
+                'quiz_id': row['quiz__quiz_id'],
+                'score': row['score'],
+                'grading_status': row['grading_status'],
+                'submitted_at': row['submitted_at'],
+            })
+
+        for student_id in student_ids:
+            self._cache[student_id] = grouped.get(student_id, [])
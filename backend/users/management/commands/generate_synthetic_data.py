@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.models import Institution
+from users.synthetic import generate_institution, SYNTHETIC_PASSWORD
+
+
+class Command(BaseCommand):
+    help = "Create a synthetic institution with realistic volumes of users, courses and submissions."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--name', default='Synthetic Institution', help="Institution name; must not exist yet")
+        parser.add_argument('--students', type=int, default=2000)
+        parser.add_argument('--teachers', type=int, default=50)
+        parser.add_argument('--courses', type=int, default=100)
+        parser.add_argument('--assessments', type=int, default=5, help="Assessments per course")
+        parser.add_argument('--quizzes', type=int, default=3, help="Quizzes per course")
+        parser.add_argument('--submissions', type=int, default=20000)
+        parser.add_argument('--enrollments', type=int, default=4, help="Courses per student")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if Institution.objects.filter(name=options['name']).exists():
+            raise CommandError(f"Institution {options['name']!r} already exists.")
+
+        start = time.perf_counter()
+        institution = generate_institution(
+            options['name'],
+            students=options['students'],
+            teachers=options['teachers'],
+            courses=options['courses'],
+            assessments_per_course=options['assessments'],
+            quizzes_per_course=options['quizzes'],
+            submissions=options['submissions'],
+            enrollments_per_student=options['enrollments'],
+            seed=options['seed'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {institution.name} (id {institution.id}) in {time.perf_counter() - start:.1f}s. "
+            f"Every account's password is {SYNTHETIC_PASSWORD!r}."
+        ))
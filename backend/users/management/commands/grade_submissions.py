@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from users.grading_worker import GradingWorker
+
+
+class Command(BaseCommand):
+    help = "Run the batched AI grading worker over pending submissions."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help="Submissions pulled per batch")
+        parser.add_argument('--concurrency', type=int, default=None, help="Maximum in-flight grading requests")
+        parser.add_argument('--once', action='store_true', help="Drain the pending queue and exit instead of polling")
+
+    def handle(self, *args, **options):
+        worker = GradingWorker(batch_size=options['batch_size'], concurrency=options['concurrency'])
+        try:
+            if options['once']:
+                graded = worker.drain()
+                self.stdout.write(self.style.SUCCESS(f"Graded {graded} submission(s)."))
+            else:
+                worker.run_forever()
+        finally:
+            worker.close()
@@ -0,0 +1,39 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from users.models import CodeBlob, Submission
+
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = "Delete stored code that no submission has referred to for a while."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=int, default=None,
+                            help="Seconds a blob must have gone unstored before it is pruned")
+
+    def handle(self, *args, **options):
+        grace = options['grace'] if options['grace'] is not None else settings.CODE_BLOB_PRUNE_GRACE
+        cutoff = timezone.now() - timedelta(seconds=grace)
+        # Blobs stored within the grace period may belong to a submission that
+        # is being saved right now, so only older ones are candidates
+        unused = CodeBlob.objects.filter(last_stored_at__lt=cutoff).exclude(
+            Exists(Submission.objects.filter(code_blob=OuterRef('pk'))))
+        total = 0
+        while True:
+            with transaction.atomic():
+                # Locked rows make a concurrent CodeBlob.objects.store() of the same
+                # text wait for the delete and then store the blob again
+                hashes = list(unused.select_for_update(skip_locked=True).values_list('hash', flat=True)[:BATCH_SIZE])
+                if not hashes:
+                    break
+                deleted, _ = unused.filter(hash__in=hashes).delete()
+            total += deleted
+        self.stdout.write(self.style.SUCCESS(f"Deleted {total} unused code blob(s)."))
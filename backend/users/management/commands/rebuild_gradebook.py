@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from users.gradebook import rebuild_gradebook
+from users.models import Course
+
+
+class Command(BaseCommand):
+    help = "Recompute the materialized gradebook from submissions, for all courses or one."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', default=None, help="course_id of the only course to rebuild")
+
+    def handle(self, *args, **options):
+        course = None
+        if options['course']:
+            course = Course.objects.filter(course_id=options['course']).first()
+            if course is None:
+                raise CommandError(f"No course {options['course']!r}.")
+        rows = rebuild_gradebook(course)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} gradebook row(s)."))
@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from users.benchmarks import ENDPOINTS, run_benchmarks, save_results, latest_results, compare_results
+from users.models import Institution
+
+
+class Command(BaseCommand):
+    help = "Benchmark the key endpoints against a synthetic institution and compare with an earlier run."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--institution', default='Synthetic Institution', help="Name of the institution to use")
+        parser.add_argument('--repeat', type=int, default=20, help="Timed requests per endpoint")
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--endpoint', action='append', choices=sorted(ENDPOINTS), help="Only these endpoints")
+        parser.add_argument('--output-dir', default=settings.BENCHMARK_RESULTS_DIR)
+        parser.add_argument('--no-save', action='store_true')
+
+    def handle(self, *args, **options):
+        institution = Institution.objects.filter(name=options['institution']).first()
+        if institution is None:
+            raise CommandError(f"No institution {options['institution']!r}; create one with generate_synthetic_data.")
+
+        baseline = latest_results(options['output_dir'])
+        results = run_benchmarks(institution, options['repeat'], options['warmup'], options['endpoint'])
+
+        self.stdout.write(f"{'endpoint':<28}{'status':>7}{'p50 ms':>10}{'p95 ms':>10}{'queries':>9}{'db ms':>9}{'peak KB':>10}")
+        for name, result in results['endpoints'].items():
+            self.stdout.write(
+                f"{name:<28}{result['status']:>7}{result['p50_ms']:>10}{result['p95_ms']:>10}"
+                f"{result['queries']:>9}{result['db_ms']:>9}{result['peak_memory_kb']:>10}"
+            )
+
+        if baseline:
+            self.stdout.write(f"\nCompared with {baseline['commit']} ({baseline['created_at']}):")
+            for name, metric, old, new, change in compare_results(results, baseline):
+                if change:
+                    style = self.style.ERROR if change > 0 else self.style.SUCCESS
+                    self.stdout.write(style(f"  {name} {metric}: {old} -> {new} ({change:+}%)"))
+
+        if not options['no_save']:
+            path = save_results(results, options['output_dir'])
+            self.stdout.write(self.style.SUCCESS(f"Saved results to {path}"))
@@ -0,0 +1,27 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from users.outbox import dispatch
+
+
+class Command(BaseCommand):
+    help = "Send queued outbox emails without a Celery worker, e.g. offline or from cron."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--provider', default=None, help="Only send for this provider")
+
+    def handle(self, *args, **options):
+        providers = [options['provider']] if options['provider'] else list(settings.EMAIL_OUTBOX_PROVIDERS)
+        total = 0
+        for provider in providers:
+            while True:
+                sent, retry_in = dispatch(provider)
+                total += sent
+                # Wait out the throughput limit, but leave backed-off retries for later
+                if retry_in is None or (not sent and retry_in > 0):
+                    break
+                if retry_in:
+                    time.sleep(retry_in)
+        self.stdout.write(self.style.SUCCESS(f"Sent {total} email(s)."))
@@ -0,0 +1,157 @@
+# backend/users/metrics.py
+"""
+Prometheus metrics for the API and the Celery tasks.
+
+MetricsMiddleware records per-route latency, response size, and how much
+of each request went to the database and to serializers built on
+TimedSerializerMixin (all of users/serializers.py). Celery task
+durations and outcomes come from the task signals. Everything is served in
+the text exposition format by MetricsView (/api/metrics/).
+
+With several processes (gunicorn workers, Celery prefork children) set
+PROMETHEUS_MULTIPROC_DIR to a directory shared by all of them on the host,
+before they start: each process then writes its samples to memory-mapped
+files there, and the scrape endpoint adds them up. gunicorn.conf.py clears
+the directory when the server starts.
+"""
+
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+from celery import signals as celery_signals
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+)
+
+from .middleware import record_queries
+
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000)
+TASK_BUCKETS = (.05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Time to handle a request.',
+    ['method', 'route', 'status'], buckets=LATENCY_BUCKETS,
+)
+RESPONSE_SIZE = Histogram(
+    'http_response_size_bytes', 'Size of response bodies.',
+    ['method', 'route'], buckets=SIZE_BUCKETS,
+)
+REQUEST_DB_TIME = Histogram(
+    'http_request_db_seconds', 'Time a request spent in database queries.',
+    ['method', 'route'], buckets=LATENCY_BUCKETS,
+)
+REQUEST_SERIALIZER_TIME = Histogram(
+    'http_request_serializer_seconds', 'Time a request spent in serializers, not counting their queries.',
+    ['method', 'route'], buckets=LATENCY_BUCKETS,
+)
+TASK_DURATION = Histogram(
+    'celery_task_duration_seconds', 'Time to run a Celery task.',
+    ['task', 'outcome'], buckets=TASK_BUCKETS,
+)
+TASKS = Counter('celery_tasks', 'Celery tasks run, by outcome.', ['task', 'outcome'])
+
+
+class RequestTimings:
+    def __init__(self, recorder):
+        self.recorder = recorder
+        self.serializer = 0.0
+        self.depth = 0
+
+
+_timings = ContextVar('request_timings', default=None)
+
+
+def route_of(request):
+    """The URL pattern that matched, so ids in the path do not create new series."""
+    match = getattr(request, 'resolver_match', None)
+    return match.route if match else 'unmatched'
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with record_queries() as recorder:
+            timings = RequestTimings(recorder)
+            token = _timings.set(timings)
+            try:
+                response = self.get_response(request)
+            finally:
+                _timings.reset(token)
+
+        method = request.method
+        route = route_of(request)
+        REQUEST_LATENCY.labels(method, route, response.status_code).observe(time.perf_counter() - start)
+        REQUEST_DB_TIME.labels(method, route).observe(recorder.duration)
+        REQUEST_SERIALIZER_TIME.labels(method, route).observe(timings.serializer)
+        if not response.streaming:
+            RESPONSE_SIZE.labels(method, route).observe(len(response.content))
+        return response
+
+
+class TimedSerializerMixin:
+    """
+    Adds the time a serializer spends rendering, less the queries it runs,
+    to the current request's serializer time. Nested serializers are part of
+    the outermost one's time; with many=True each row counts on its own.
+    """
+
+    def to_representation(self, instance):
+        timings = _timings.get()
+        if timings is None or timings.depth:
+            return super().to_representation(instance)
+        timings.depth += 1
+        start = time.perf_counter()
+        db_start = timings.recorder.duration
+        try:
+            return super().to_representation(instance)
+        finally:
+            timings.depth -= 1
+            timings.serializer += time.perf_counter() - start - (timings.recorder.duration - db_start)
+
+
+_task_starts = {}
+_task_lock = threading.Lock()
+
+
+def task_started(task_id=None, **kwargs):
+    with _task_lock:
+        _task_starts[task_id] = time.perf_counter()
+
+
+def task_finished(task_id=None, task=None, state=None, **kwargs):
+    with _task_lock:
+        start = _task_starts.pop(task_id, None)
+    outcome = (state or 'unknown').lower()
+    TASKS.labels(task.name, outcome).inc()
+    if start is not None:
+        TASK_DURATION.labels(task.name, outcome).observe(time.perf_counter() - start)
+
+
+_instrumented = False
+
+
+def instrument():
+    """Connects the Celery task signals. Called once, from UsersConfig.ready."""
+    global _instrumented
+    if _instrumented:
+        return
+    celery_signals.task_prerun.connect(task_started, weak=False)
+    celery_signals.task_postrun.connect(task_finished, weak=False)
+    _instrumented = True
+
+
+def render_metrics():
+    """Returns (body, content type) for a scrape, summed over all processes in multiprocess mode."""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
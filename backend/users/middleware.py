@@ -0,0 +1,124 @@
+# backend/users/middleware.py
+"""
+Per-request SQL accounting.
+
+QueryBudgetMiddleware counts the queries a request runs and the time spent
+in the database, and groups them by shape (the SQL with its parameters left
+out) so the same statement issued once per row, the N+1 pattern, stands
+out. Each request is logged to the 'users.queries' logger, and with
+QUERY_BUDGET_HEADERS on the numbers are also sent as response headers.
+
+A view can declare `query_budget = <max queries>`; QUERY_BUDGETS overrides
+it by URL name. Going over the budget, or repeating one shape at least
+QUERY_BUDGET_REPEAT_THRESHOLD times, is logged as a warning, or raises
+QueryBudgetExceeded when QUERY_BUDGET_ENFORCE is set, as the tests do.
+"""
+
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+
+logger = logging.getLogger('users.queries')
+
+# Collapses IN lists so queries differing only in the number of ids share a shape
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_shape(sql):
+    return IN_LIST.sub('IN (...)', sql)
+
+
+class QueryRecorder:
+    """An execute wrapper that tallies the queries run through it."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.shapes[query_shape(sql)] += 1
+
+    def repeated(self, threshold):
+        """Shapes run at least `threshold` times, most repeated first."""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+
+@contextmanager
+def record_queries():
+    """Records the queries run on every database connection inside the block."""
+    recorder = QueryRecorder()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        yield recorder
+
+
+def view_budget(request):
+    """The query budget of the view that handled `request`, or None."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    if match.url_name and match.url_name in settings.QUERY_BUDGETS:
+        return settings.QUERY_BUDGETS[match.url_name]
+    view_class = getattr(match.func, 'view_class', None)
+    return getattr(view_class, 'query_budget', None)
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with record_queries() as recorder:
+            response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else None
+        budget = view_budget(request)
+        repeated = recorder.repeated(settings.QUERY_BUDGET_REPEAT_THRESHOLD)
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': view,
+            'status': response.status_code,
+            'queries': recorder.count,
+            'db_ms': round(recorder.duration * 1000, 2),
+            'budget': budget,
+            'repeated': [{'sql': shape, 'count': count} for shape, count in repeated],
+        }
+
+        problems = []
+        if budget is not None and recorder.count > budget:
+            problems.append(f'{recorder.count} queries, budget is {budget}')
+        if repeated:
+            problems.append(f'same query run {repeated[0][1]} times: {repeated[0][0]}')
+        if problems:
+            logger.warning(json.dumps(record), extra={'queries': record})
+            if settings.QUERY_BUDGET_ENFORCE:
+                raise QueryBudgetExceeded(f'{request.method} {request.path} ({view}): ' + '; '.join(problems))
+        else:
+            logger.info(json.dumps(record), extra={'queries': record})
+
+        if settings.QUERY_BUDGET_HEADERS:
+            response['X-Query-Count'] = str(recorder.count)
+            response['X-Query-Time-Ms'] = str(record['db_ms'])
+            response['X-Query-Repeated'] = str(repeated[0][1] if repeated else 0)
+        return response
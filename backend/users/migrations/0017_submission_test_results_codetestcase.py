@@ -0,0 +1,36 @@
+# Generated by Django 5.1.2 on 2026-10-18 08:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0016_remove_manager_email'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='submission',
+            name='test_results',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='CodeTestCase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='at most 200 characters', max_length=200)),
+                ('stdin', models.TextField(blank=True, default='')),
+                ('expected_output', models.TextField(blank=True, default='')),
+                ('points', models.FloatField(default=1)),
+                ('is_hidden', models.BooleanField(default=False, help_text='Hidden test cases are not shown to students')),
+                ('order', models.PositiveIntegerField(default=0)),
+                ('assessment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='test_cases', to='users.assessment')),
+                ('quiz', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='test_cases', to='users.quiz')),
+            ],
+            options={
+                'ordering': ['order', 'id'],
+            },
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.1.2 on 2026-10-18 09:04
+
+import shortuuid
+import shortuuid.django_fields
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def dedupe_course_ids(apps, schema_editor):
+    """Gives a fresh course_id to all but the first course sharing one, so the unique index can be built."""
+    Course = apps.get_model('users', 'Course')
+    alphabet = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ1234567890'
+    duplicated = (
+        Course.objects.values('course_id').annotate(count=Count('id')).filter(count__gt=1)
+        .values_list('course_id', flat=True)
+    )
+    taken = set(Course.objects.values_list('course_id', flat=True))
+    for course_id in list(duplicated):
+        for course in Course.objects.filter(course_id=course_id).order_by('id')[1:]:
+            new_id = shortuuid.ShortUUID(alphabet=alphabet).random(length=8)
+            while new_id in taken:
+                new_id = shortuuid.ShortUUID(alphabet=alphabet).random(length=8)
+            taken.add(new_id)
+            course.course_id = new_id
+            course.save(update_fields=['course_id'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0019_outboxemail'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_course_ids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='course',
+            name='course_id',
+            field=shortuuid.django_fields.ShortUUIDField(alphabet='ABCDEFGHIJKLMNOPQRSTUVWXYZ1234567890', length=8, max_length=10, prefix='', unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='courseenrollment',
+            index=models.Index(fields=['teacher', 'course'], name='enrollment_teacher_course_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(fields=['student', 'grading_status', '-submitted_at'], name='submission_student_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(fields=['assessment', 'grading_status', '-submitted_at'], name='submission_assess_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(fields=['quiz', 'grading_status', '-submitted_at'], name='submission_quiz_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(fields=['grading_status', 'submitted_at'], name='submission_status_queue_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.2 on 2026-10-18 09:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0020_submission_enrollment_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GradebookEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('work_key', models.CharField(max_length=25)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('graded_attempts', models.PositiveIntegerField(default=0)),
+                ('best_score', models.FloatField(blank=True, null=True)),
+                ('latest_score', models.FloatField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('GRADED', 'Graded'), ('REVALIDATION_REQUESTED', 'Revalidation Requested')], default='PENDING', max_length=25)),
+                ('last_submitted_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('assessment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='users.assessment')),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='gradebook', to='users.course')),
+                ('latest_submission', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='users.submission')),
+                ('quiz', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='users.quiz')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='gradebook', to='users.student')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['course', 'student'], name='gradebook_course_student_idx')],
+                'unique_together': {('student', 'work_key')},
+            },
+        ),
+    ]
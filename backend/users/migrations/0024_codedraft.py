@@ -0,0 +1,44 @@
+# Generated by Django 5.1.2 on 2026-10-18 09:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0023_quizsession'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CodeDraft',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('playground', 'Playground'), ('assessment', 'Assessment'), ('quiz', 'Quiz')], max_length=20)),
+                ('object_id', models.CharField(max_length=20)),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('snapshot', models.TextField(blank=True, default='')),
+                ('snapshot_version', models.PositiveIntegerField(default=0)),
+                ('snapshot_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='code_drafts', to='users.student')),
+            ],
+            options={
+                'unique_together': {('student', 'kind', 'object_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DraftPatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField()),
+                ('ops', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('draft', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='patches', to='users.codedraft')),
+            ],
+            options={
+                'unique_together': {('draft', 'version')},
+            },
+        ),
+    ]
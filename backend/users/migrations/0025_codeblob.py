@@ -0,0 +1,81 @@
+# Generated by Django 5.1.2 on 2026-10-18 09:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from users.code_store import code_hash, compress_code
+
+
+BATCH_SIZE = 2000
+
+
+def move_code_to_blobs(apps, schema_editor):
+    Submission = apps.get_model('users', 'Submission')
+    CodeBlob = apps.get_model('users', 'CodeBlob')
+    rows = Submission.objects.order_by('id').values_list('id', 'submitted_code')
+    last_id = 0
+    while True:
+        batch = list(rows.filter(id__gt=last_id)[:BATCH_SIZE])
+        if not batch:
+            break
+        last_id = batch[-1][0]
+        blobs, updates = {}, []
+        for submission_id, text in batch:
+            text = text or ''
+            digest = code_hash(text)
+            if digest not in blobs:
+                compression, data = compress_code(text)
+                blobs[digest] = CodeBlob(hash=digest, compression=compression, data=data, size=len(text.encode('utf-8')))
+            updates.append(Submission(id=submission_id, code_blob_id=digest))
+        CodeBlob.objects.bulk_create(list(blobs.values()), batch_size=500, ignore_conflicts=True)
+        Submission.objects.bulk_update(updates, ['code_blob'], batch_size=500)
+
+
+def restore_code(apps, schema_editor):
+    from users.code_store import decompress_code
+
+    Submission = apps.get_model('users', 'Submission')
+    for submission in Submission.objects.select_related('code_blob').iterator(chunk_size=BATCH_SIZE):
+        submission.submitted_code = decompress_code(submission.code_blob.compression, submission.code_blob.data)
+        submission.save(update_fields=['submitted_code'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0024_codedraft'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CodeBlob',
+            fields=[
+                ('hash', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('compression', models.CharField(max_length=10)),
+                ('data', models.BinaryField()),
+                ('size', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='submission',
+            name='code_blob',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='submissions', to='users.codeblob'),
+        ),
+        # A default lets the column be added back when migrating backwards
+        migrations.AlterField(
+            model_name='submission',
+            name='submitted_code',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.RunPython(move_code_to_blobs, restore_code),
+        migrations.RemoveField(
+            model_name='submission',
+            name='submitted_code',
+        ),
+        migrations.AlterField(
+            model_name='submission',
+            name='code_blob',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='submissions', to='users.codeblob'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.2 on 2026-10-18 11:05
+
+from django.db import migrations
+
+
+HIDDEN_RESULT_FIELDS = ('name', 'stdout', 'stderr', 'duration')
+
+
+def scrub_hidden_test_results(apps, schema_editor):
+    Submission = apps.get_model('users', 'Submission')
+    updates = []
+    for submission in Submission.objects.exclude(test_results=None).only('id', 'test_results').iterator(chunk_size=2000):
+        changed = False
+        for result in submission.test_results or []:
+            if result.get('is_hidden') and any(field in result for field in HIDDEN_RESULT_FIELDS):
+                for field in HIDDEN_RESULT_FIELDS:
+                    result.pop(field, None)
+                changed = True
+        if changed:
+            updates.append(submission)
+    Submission.objects.bulk_update(updates, ['test_results'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0025_codeblob'),
+    ]
+
+    operations = [
+        migrations.RunPython(scrub_hidden_test_results, migrations.RunPython.noop),
+    ]
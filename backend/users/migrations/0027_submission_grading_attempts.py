@@ -0,0 +1,33 @@
+# Generated by Django 5.1.2 on 2026-10-18 09:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0026_scrub_hidden_test_results'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='submission',
+            name='grading_attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='submission',
+            name='grading_available_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='gradebookentry',
+            name='status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('GRADED', 'Graded'), ('REVALIDATION_REQUESTED', 'Revalidation Requested'), ('FAILED', 'Failed')], default='PENDING', max_length=25),
+        ),
+        migrations.AlterField(
+            model_name='submission',
+            name='grading_status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('GRADED', 'Graded'), ('REVALIDATION_REQUESTED', 'Revalidation Requested'), ('FAILED', 'Failed')], default='PENDING', max_length=25),
+        ),
+    ]
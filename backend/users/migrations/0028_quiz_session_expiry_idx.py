@@ -0,0 +1,17 @@
+# Generated by Django 5.1.2 on 2026-10-18 09:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0027_submission_grading_attempts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='quizsession',
+            index=models.Index(fields=['status', 'expires_at'], name='quiz_session_expiry_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.2 on 2026-10-18 10:00
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0028_quiz_session_expiry_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codeblob',
+            name='last_stored_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='codeblob',
+            index=models.Index(fields=['last_stored_at'], name='codeblob_last_stored_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:10
+
+from django.db import migrations
+
+
+def clear_finished_outbox_bodies(apps, schema_editor):
+    OutboxEmail = apps.get_model('users', 'OutboxEmail')
+    OutboxEmail.objects.filter(status__in=['sent', 'failed']).update(body='', html_body=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0029_codeblob_last_stored_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_finished_outbox_bodies, migrations.RunPython.noop),
+    ]
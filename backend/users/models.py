@@ -3,8 +3,10 @@ from django.contrib.auth.models import AbstractUser
 from django.core.validators import FileExtensionValidator
 from django.apps import apps
 from django.utils import timezone
+from django.utils.functional import cached_property
 
 from .validators import validate_image
+from .code_store import code_hash, compress_code, decompress_code
 
 from shortuuid.django_fields import ShortUUIDField
 # Create your models here.
@@ -120,10 +122,10 @@ class Student(models.Model):
         return Course.objects.filter(courseenrollment__student=self)
 
     def assessments(self):
-        return Assessment.objects.filter(students=self)
+        return Assessment.objects.filter(course__courseenrollment__student=self)
 
     def quizzes(self):
-        return Quiz.objects.filter(students=self)
+        return Quiz.objects.filter(course__courseenrollment__student=self)
 
     def playgrounds(self):
         return PlayGround.objects.filter(students=self)
@@ -139,17 +141,17 @@ class Course(models.Model):
     image = models.ImageField(upload_to='course_folder', default='default_course.jpg', null=True, blank=True)
     enrollment_code = models.CharField(max_length=10, null=True, blank=True)
     course_id = ShortUUIDField(
-        length=8, max_length=10, alphabet="ABCDEFGHIJKLMNOPQRSTUVWXYZ1234567890")
+        unique=True, length=8, max_length=10, alphabet="ABCDEFGHIJKLMNOPQRSTUVWXYZ1234567890")
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return self.title
     
     def students(self):
-        return CourseEnrollment.objects.filter(course=self)
+        return self.courseenrollment_set.all()
     
     def assessments(self):
-        return Assessment.objects.filter(course=self)
+        return self.assessment_set.all()
 
     def quizzes(self):
         return Quiz.objects.filter(course=self)
@@ -166,15 +168,18 @@ class CourseEnrollment(models.Model):
 
     class Meta:
         unique_together = [('course', 'student')]
+        indexes = [
+            models.Index(fields=['teacher', 'course'], name='enrollment_teacher_course_idx'),
+        ]
 
     def __str__(self):
         return f"{self.student.user.username} enrolled in {self.course.title}"
 
     def assessments(self):
-        return Assessment.objects.filter(course=self.course)
+        return self.course.assessment_set.all()
 
     def quizzes(self):
-        return Quiz.objects.filter(course=self.course)
+        return self.course.quizzes.all()
     
 
 class CourseMaterial(models.Model):
@@ -260,6 +265,38 @@ class Quiz(models.Model):
         return self.title
 
 
+class QuizSession(models.Model):
+    """
+    A student's attempt at a quiz, started on the server. For timed quizzes
+    expires_at is enforced on submit and the latest draft is submitted
+    automatically at expiry (see users/quiz_sessions.py).
+    """
+    STATUS = [
+        ('ACTIVE', 'Active'),
+        ('SUBMITTED', 'Submitted'),
+        ('AUTO_SUBMITTED', 'Auto-submitted'),
+        ('EXPIRED', 'Expired'),
+    ]
+
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name='sessions')
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='quiz_sessions')
+    status = models.CharField(max_length=20, choices=STATUS, default='ACTIVE')
+    started_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    draft_code = models.TextField(blank=True, default='')
+    draft_saved_at = models.DateTimeField(null=True, blank=True)
+    submission = models.OneToOneField('Submission', on_delete=models.SET_NULL, null=True, blank=True, related_name='quiz_session')
+    closed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = [('quiz', 'student')]
+        # The expiry tick's sweep for overdue sessions
+        indexes = [models.Index(fields=['status', 'expires_at'], name='quiz_session_expiry_idx')]
+
+    def __str__(self):
+        return f"{self.student} on {self.quiz}"
+
+
 class PlayGround(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='playgrounds')
     title = models.CharField(max_length=200, help_text="at most 200 characters")
@@ -270,6 +307,99 @@ class PlayGround(models.Model):
         return self.title
 
 
+class CodeDraft(models.Model):
+    """
+    An editor's autosaved code as a snapshot plus the patches applied since
+    (see users/drafts.py).
+    """
+    KINDS = [
+        ('playground', 'Playground'),
+        ('assessment', 'Assessment'),
+        ('quiz', 'Quiz'),
+    ]
+
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='code_drafts')
+    kind = models.CharField(max_length=20, choices=KINDS)
+    # The playground_id, assessment_id or quiz_id the draft is for
+    object_id = models.CharField(max_length=20)
+    version = models.PositiveIntegerField(default=0)
+    snapshot = models.TextField(blank=True, default='')
+    snapshot_version = models.PositiveIntegerField(default=0)
+    snapshot_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = [('student', 'kind', 'object_id')]
+
+    def __str__(self):
+        return f"{self.student} {self.kind} {self.object_id} v{self.version}"
+
+
+class DraftPatch(models.Model):
+    """The edits that turn version - 1 of a draft into version."""
+    draft = models.ForeignKey(CodeDraft, on_delete=models.CASCADE, related_name='patches')
+    version = models.PositiveIntegerField()
+    ops = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = [('draft', 'version')]
+
+    def __str__(self):
+        return f"{self.draft_id} v{self.version}"
+
+
+class CodeBlobManager(models.Manager):
+    def store_many(self, texts):
+        """Stores each distinct text once. Returns {hash: blob}."""
+        blobs = {}
+        for text in texts:
+            digest = code_hash(text)
+            if digest not in blobs:
+                compression, data = compress_code(text)
+                blobs[digest] = CodeBlob(hash=digest, compression=compression, data=data, size=len(text.encode('utf-8')))
+        # Texts stored before are left as they are, but marked as used again
+        # first, so prune_code_blobs leaves them alone until they are referenced
+        self.filter(hash__in=list(blobs)).update(last_stored_at=timezone.now())
+        self.bulk_create(list(blobs.values()), batch_size=500, ignore_conflicts=True)
+        return blobs
+
+    def store(self, text):
+        return self.store_many([text])[code_hash(text)]
+
+    def attach(self, submissions):
+        """Stores the code of unsaved submissions in one go, e.g. before bulk_create."""
+        pending = [submission for submission in submissions if submission._pending_code is not None]
+        blobs = self.store_many(submission._pending_code for submission in pending)
+        for submission in pending:
+            submission.code_blob = blobs[code_hash(submission._pending_code)]
+            submission._pending_code = None
+
+
+class CodeBlob(models.Model):
+    """Compressed source code, stored once per distinct text (see users/code_store.py)."""
+    hash = models.CharField(max_length=64, primary_key=True)
+    compression = models.CharField(max_length=10)
+    data = models.BinaryField()
+    # Uncompressed size in bytes
+    size = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # When a submission last stored this text; unreferenced blobs are only pruned well after it
+    last_stored_at = models.DateTimeField(default=timezone.now)
+
+    objects = CodeBlobManager()
+
+    class Meta:
+        indexes = [models.Index(fields=['last_stored_at'], name='codeblob_last_stored_idx')]
+
+    @cached_property
+    def text(self):
+        return decompress_code(self.compression, self.data)
+
+    def __str__(self):
+        return self.hash
+
+
 class Submission(models.Model):
     SUBMISSION_TYPES = [
         ('ASSESSMENT', 'Assessment'),
@@ -280,6 +410,7 @@ class Submission(models.Model):
         ('PENDING', 'Pending'),
         ('GRADED', 'Graded'),
         ('REVALIDATION_REQUESTED', 'Revalidation Requested'),
+        ('FAILED', 'Failed'),
     ]
 
     teacher = models.ForeignKey(Teacher, on_delete=models.CASCADE, related_name='submissions', null=True, blank=True)
@@ -287,7 +418,8 @@ class Submission(models.Model):
     assessment = models.ForeignKey(Assessment, on_delete=models.CASCADE, null=True, blank=True)
     quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, null=True, blank=True)
     submission_type = models.CharField(max_length=10, choices=SUBMISSION_TYPES)
-    submitted_code = models.TextField()
+    # The code itself is in CodeBlob; see the submitted_code property
+    code_blob = models.ForeignKey(CodeBlob, on_delete=models.PROTECT, related_name='submissions')
     submitted_at = models.DateTimeField(auto_now_add=True)
     score = models.FloatField(null=True, blank=True)
     grading_status = models.CharField(
@@ -295,10 +427,96 @@ class Submission(models.Model):
     ai_feedback = models.TextField(null=True, blank=True)
     is_viewed = models.BooleanField(default=False)
     instructor_feedback = models.TextField(null=True, blank=True)
+    test_results = models.JSONField(null=True, blank=True)
+    # Batch grading worker bookkeeping; see users/grading_worker.py
+    grading_attempts = models.PositiveSmallIntegerField(default=0)
+    grading_available_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # Match the score views' filters and their keyset ordering, and the
+        # grading worker's scan of pending submissions
+        indexes = [
+            models.Index(fields=['student', 'grading_status', '-submitted_at'], name='submission_student_status_idx'),
+            models.Index(fields=['assessment', 'grading_status', '-submitted_at'], name='submission_assess_status_idx'),
+            models.Index(fields=['quiz', 'grading_status', '-submitted_at'], name='submission_quiz_status_idx'),
+            models.Index(fields=['grading_status', 'submitted_at'], name='submission_status_queue_idx'),
+        ]
+
+    _pending_code = None
+
+    @property
+    def submitted_code(self):
+        """The source, read from its CodeBlob the first time it is used."""
+        if self._pending_code is not None:
+            return self._pending_code
+        return self.code_blob.text if self.code_blob_id else ''
+
+    @submitted_code.setter
+    def submitted_code(self, value):
+        self._pending_code = value
+
+    def save(self, *args, **kwargs):
+        if self._pending_code is not None or self.code_blob_id is None:
+            self.code_blob = CodeBlob.objects.store(self._pending_code or '')
+            self._pending_code = None
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'code_blob'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.student.user.username}'s submission for {self.get_submission_type_display()}"
 
+
+class GradebookEntry(models.Model):
+    """
+    A student's standing on one assessment or quiz, derived from their
+    submissions and kept up to date by users/gradebook.py as they are
+    submitted and graded. `work_key` is 'A<id>' or 'Q<id>'.
+    """
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='gradebook')
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='gradebook')
+    assessment = models.ForeignKey(Assessment, on_delete=models.CASCADE, null=True, blank=True)
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, null=True, blank=True)
+    work_key = models.CharField(max_length=25)
+    attempts = models.PositiveIntegerField(default=0)
+    graded_attempts = models.PositiveIntegerField(default=0)
+    best_score = models.FloatField(null=True, blank=True)
+    latest_score = models.FloatField(null=True, blank=True)
+    status = models.CharField(max_length=25, choices=Submission.GRADING_STATUS, default='PENDING')
+    latest_submission = models.ForeignKey(Submission, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_submitted_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = [('student', 'work_key')]
+        indexes = [
+            models.Index(fields=['course', 'student'], name='gradebook_course_student_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.student} on {self.work_key}"
+
+
+class CodeTestCase(models.Model):
+    """
+    An instructor-defined check for an assessment or quiz: the submission is
+    run with `stdin` as input and must print `expected_output`.
+    """
+    assessment = models.ForeignKey(Assessment, on_delete=models.CASCADE, related_name='test_cases', null=True, blank=True)
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name='test_cases', null=True, blank=True)
+    name = models.CharField(max_length=200, help_text="at most 200 characters")
+    stdin = models.TextField(blank=True, default='')
+    expected_output = models.TextField(blank=True, default='')
+    points = models.FloatField(default=1)
+    is_hidden = models.BooleanField(default=False, help_text="Hidden test cases are not shown to students")
+    order = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['order', 'id']
+
+    def __str__(self):
+        return self.name
+
 class Feedback(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='feedbacks')
     feedback = models.TextField()
@@ -332,5 +550,83 @@ class Notification(models.Model):
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # The inbox is a keyset walk of one user's notifications, newest first
+        indexes = [
+            models.Index(fields=['user', '-id'], name='notification_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"Notification for {self.user.username}"
+
+
+class NotificationCounter(models.Model):
+    """
+    A user's unread notification count, kept up to date by users/notifications.py.
+    Notifications with an id up to read_up_to count as read.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='notification_counter')
+    unread = models.PositiveIntegerField(default=0)
+    read_up_to = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user.username}: {self.unread} unread"
+
+class UserImportJob(models.Model):
+    """A bulk user import running in the background, with its progress."""
+    STATUS = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    job_id = ShortUUIDField(unique=True, length=20, max_length=20, alphabet="ABCDEFGHIJKLMNOPQRSTUVWXYZ1234567890")
+    institution = models.ForeignKey(Institution, on_delete=models.CASCADE, related_name='import_jobs')
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='import_jobs', null=True, blank=True)
+    file = models.FileField(upload_to='user_imports/', validators=[FileExtensionValidator(['csv', 'xlsx'])])
+    status = models.CharField(max_length=20, choices=STATUS, default='pending')
+    total_rows = models.PositiveIntegerField(default=0)
+    processed_rows = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Import {self.job_id} ({self.status})"
+
+
+class OutboxEmail(models.Model):
+    """
+    An email waiting to be sent by the outbox dispatcher (users/outbox.py).
+    Request handlers only add rows here; delivery happens in Celery.
+    """
+    STATUS = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    provider = models.CharField(max_length=50, default='default')
+    dedupe_key = models.CharField(max_length=255, unique=True, null=True, blank=True)
+    subject = models.CharField(max_length=255)
+    from_email = models.CharField(max_length=255)
+    to = models.JSONField(default=list)
+    body = models.TextField()
+    html_body = models.TextField(null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(null=True, blank=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['provider', 'status', 'next_attempt_at']),
+        ]
+
     def __str__(self):
-        return f"Notification for {self.user.username}"
\ No newline at end of file
+        return f"{self.subject} to {', '.join(self.to)} ({self.status})"
@@ -0,0 +1,109 @@
+# backend/users/notifications.py
+"""
+Notification fan-out and unread counters.
+
+notify_users writes one Notification per recipient with bulk_create and
+bumps every recipient's NotificationCounter with a single UPDATE ... SET
+unread = unread + 1, so notifying a whole course is a few statements
+however many students it has, and the unread badge is a primary key read.
+
+Marking everything read does not touch the notifications: it moves the
+counter's read_up_to watermark to the user's newest notification and
+zeroes the count. A notification is read if it is at or below the
+watermark or was marked read on its own.
+
+Counter rows are locked while they change so that a notification arriving
+during mark_all_read is either covered by the new watermark or counted as
+unread, never lost.
+"""
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import Notification, NotificationCounter, CourseEnrollment, Student
+
+
+BATCH_SIZE = 1000
+
+
+def notify_users(user_ids, message):
+    """Sends `message` to each user once. Returns the number of notifications created."""
+    user_ids = list(dict.fromkeys(user_ids))
+    for start in range(0, len(user_ids), BATCH_SIZE):
+        batch = user_ids[start:start + BATCH_SIZE]
+        with transaction.atomic():
+            Notification.objects.bulk_create([Notification(user_id=user_id, message=message) for user_id in batch])
+            NotificationCounter.objects.bulk_create(
+                [NotificationCounter(user_id=user_id) for user_id in batch], ignore_conflicts=True)
+            NotificationCounter.objects.filter(user_id__in=batch).update(unread=F('unread') + 1)
+    return len(user_ids)
+
+
+def notify_course(course, message):
+    """Notifies every student enrolled in the course."""
+    user_ids = CourseEnrollment.objects.filter(course=course, is_enrolled=True).values_list('student__user_id', flat=True)
+    return notify_users(list(user_ids), message)
+
+
+def schedule_course_notification(course, message):
+    """
+    Has a worker notify the course once the current transaction commits. A
+    broker that is down loses the notification but does not fail the caller.
+    """
+    from .tasks import notify_course_task
+
+    course_id = course.id
+    transaction.on_commit(lambda: notify_course_task.delay(course_id, message), robust=True)
+
+
+def notify_students(student_ids, message):
+    user_ids = Student.objects.filter(id__in=set(student_ids)).values_list('user_id', flat=True)
+    return notify_users(list(user_ids), message)
+
+
+def notify_graded(submissions):
+    """Tells students their work was graded, one fan-out per assessment or quiz."""
+    students = {}
+    for submission in submissions:
+        work = submission.assessment or submission.quiz
+        if submission.student_id and work:
+            students.setdefault(work.title, set()).add(submission.student_id)
+    for title, student_ids in students.items():
+        notify_students(student_ids, f'Your submission for "{title}" has been graded.')
+
+
+def unread_count(user):
+    return NotificationCounter.objects.filter(user=user).values_list('unread', flat=True).first() or 0
+
+
+def read_up_to(user):
+    return NotificationCounter.objects.filter(user=user).values_list('read_up_to', flat=True).first() or 0
+
+
+def unread_notifications(user, watermark):
+    return Notification.objects.filter(user=user, id__gt=watermark, is_read=False)
+
+
+def _locked_counter(user):
+    counter, _ = NotificationCounter.objects.select_for_update().get_or_create(user=user)
+    return counter
+
+
+def mark_all_read(user):
+    """Marks all of the user's notifications read in constant time."""
+    with transaction.atomic():
+        counter = _locked_counter(user)
+        latest = Notification.objects.filter(user=user).order_by('-id').values_list('id', flat=True).first()
+        counter.read_up_to = max(counter.read_up_to, latest or 0)
+        counter.unread = 0
+        counter.save(update_fields=['read_up_to', 'unread'])
+
+
+def mark_read(user, notification_id):
+    """Marks one notification read. Returns False if it was not an unread notification of the user."""
+    with transaction.atomic():
+        counter = _locked_counter(user)
+        marked = unread_notifications(user, counter.read_up_to).filter(id=notification_id).update(is_read=True)
+        if marked:
+            NotificationCounter.objects.filter(user=user, unread__gt=0).update(unread=F('unread') - 1)
+    return bool(marked)
@@ -0,0 +1,222 @@
+# backend/users/outbox.py
+"""
+Transactional email outbox.
+
+Views add messages to the OutboxEmail table and return; dispatch_outbox_task
+sends them in batches over one reused connection per provider, paced by
+the provider's throughput limit. Failed sends are retried with backoff up
+to EMAIL_OUTBOX_MAX_ATTEMPTS, and a dedupe key keeps a message from being
+queued twice. Once a message is sent or given up its bodies are cleared,
+since credential and password reset emails carry secrets.
+
+Providers are configured in EMAIL_OUTBOX_PROVIDERS. Point a provider's
+BACKEND at Django's console or file-based backend to run it offline.
+"""
+
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboxEmail
+from .rate_limit import RateLimiter, RedisBucketStore, MemoryBucketStore
+
+
+def _to_row(message, dedupe_key=None, provider='default'):
+    html_body = None
+    for content, mimetype in getattr(message, 'alternatives', []):
+        if mimetype == 'text/html':
+            html_body = content
+    return OutboxEmail(
+        provider=provider,
+        dedupe_key=dedupe_key,
+        subject=message.subject,
+        from_email=message.from_email or settings.FROM_EMAIL,
+        to=list(message.to),
+        body=message.body,
+        html_body=html_body,
+    )
+
+
+def enqueue_messages(messages, dedupe_keys=None, provider='default'):
+    """
+    Adds EmailMessage objects to the outbox in one insert and schedules a
+    dispatch once the current transaction commits. Messages whose dedupe
+    key is already in the outbox are skipped.
+    """
+    if not messages:
+        return
+    dedupe_keys = dedupe_keys or [None] * len(messages)
+    OutboxEmail.objects.bulk_create(
+        [_to_row(message, key, provider) for message, key in zip(messages, dedupe_keys)],
+        ignore_conflicts=True,
+    )
+    transaction.on_commit(lambda: schedule_outbox_dispatch(provider))
+
+
+def enqueue_message(message, dedupe_key=None, provider='default'):
+    """Queues a single message; the drop-in replacement for message.send()."""
+    enqueue_messages([message], [dedupe_key], provider)
+
+
+def schedule_outbox_dispatch(provider='default', countdown=0):
+    from .tasks import dispatch_outbox_task
+
+    dispatch_outbox_task.apply_async(args=[provider], countdown=countdown)
+
+
+def provider_config(provider):
+    config = settings.EMAIL_OUTBOX_PROVIDERS[provider]
+    return {
+        'BACKEND': config.get('BACKEND') or settings.EMAIL_BACKEND,
+        'OPTIONS': config.get('OPTIONS', {}),
+        'RATE_PER_MINUTE': config.get('RATE_PER_MINUTE'),
+        'BATCH_SIZE': config.get('BATCH_SIZE', 100),
+    }
+
+
+_limiters = {}
+
+
+def get_outbox_limiter(provider):
+    """Returns the shared throughput limiter of a provider, or None if it has no limit."""
+    rate = provider_config(provider)['RATE_PER_MINUTE']
+    if not rate:
+        return None
+    if provider not in _limiters:
+        if settings.EMAIL_OUTBOX_RATE_LIMIT_BACKEND == 'memory':
+            store = MemoryBucketStore()
+        else:
+            store = RedisBucketStore(settings.CELERY_BROKER_URL, f'outbox:{provider}:rate')
+        # Only the request bucket matters for email; the token bucket never runs dry
+        _limiters[provider] = RateLimiter(store, requests_per_minute=rate, tokens_per_minute=rate)
+    return _limiters[provider]
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter, in seconds, after `attempts` failed sends."""
+    ceiling = min(settings.EMAIL_OUTBOX_BACKOFF_CAP, settings.EMAIL_OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1))
+    return random.uniform(ceiling / 2, ceiling)
+
+
+def claim_batch(provider, size):
+    """
+    Claims up to `size` due messages for this dispatcher. Claimed rows are
+    marked 'sending' with a lease; if the dispatcher dies they become due
+    again once the lease runs out.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            OutboxEmail.objects
+            .filter(provider=provider, status__in=['pending', 'sending'], next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')
+            .select_for_update(skip_locked=True)[:size]
+        )
+        OutboxEmail.objects.filter(id__in=[email.id for email in batch]).update(
+            status='sending',
+            next_attempt_at=now + timedelta(seconds=settings.EMAIL_OUTBOX_CLAIM_TIMEOUT),
+        )
+    return batch
+
+
+def _to_message(email, connection):
+    message = EmailMultiAlternatives(
+        subject=email.subject,
+        body=email.body,
+        from_email=email.from_email,
+        to=email.to,
+        connection=connection,
+    )
+    if email.html_body:
+        message.attach_alternative(email.html_body, "text/html")
+    return message
+
+
+def _clear_bodies(email):
+    # Credential and reset emails carry secrets; keep only the envelope once finished
+    email.body = ''
+    email.html_body = None
+
+
+def dispatch(provider='default'):
+    """
+    Sends one batch for a provider. Returns (sent, retry_in): retry_in is
+    the number of seconds until the next dispatch is useful, or None when
+    nothing is left to do.
+    """
+    config = provider_config(provider)
+    limiter = get_outbox_limiter(provider)
+    batch = claim_batch(provider, config['BATCH_SIZE'])
+    if not batch:
+        return 0, None
+
+    sent = []
+    failed = []
+    released = []
+    retry_in = 0
+    connection = get_connection(config['BACKEND'], fail_silently=False, **config['OPTIONS'])
+    try:
+        connection.open()
+    except Exception as e:
+        # The provider is unreachable: the whole batch backs off like a failed send
+        for email in batch:
+            email.last_error = str(e)
+        failed = batch
+    else:
+        try:
+            for index, email in enumerate(batch):
+                wait = limiter.try_acquire(0) if limiter else 0
+                if wait:
+                    # Over the provider's limit: hand the rest back for later
+                    released = batch[index:]
+                    retry_in = wait
+                    break
+                try:
+                    connection.send_messages([_to_message(email, connection)])
+                except Exception as e:
+                    email.last_error = str(e)
+                    failed.append(email)
+                else:
+                    sent.append(email)
+        finally:
+            connection.close()
+
+    now = timezone.now()
+    for email in sent:
+        email.status = 'sent'
+        email.sent_at = now
+        email.attempts += 1
+        _clear_bodies(email)
+    for email in failed:
+        email.attempts += 1
+        if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+            email.status = 'failed'
+            _clear_bodies(email)
+        else:
+            email.status = 'pending'
+            email.next_attempt_at = now + timedelta(seconds=retry_delay(email.attempts))
+    for email in released:
+        email.status = 'pending'
+        email.next_attempt_at = now
+
+    OutboxEmail.objects.bulk_update(
+        sent + failed + released,
+        ['status', 'sent_at', 'attempts', 'last_error', 'next_attempt_at', 'body', 'html_body'],
+    )
+
+    if not retry_in:
+        following = (
+            OutboxEmail.objects
+            .filter(provider=provider, status__in=['pending', 'sending'])
+            .order_by('next_attempt_at')
+            .values_list('next_attempt_at', flat=True)
+            .first()
+        )
+        if following is None:
+            return len(sent), None
+        retry_in = max(0, (following - now).total_seconds())
+    return len(sent), retry_in
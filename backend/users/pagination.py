@@ -0,0 +1,66 @@
+# backend/users/pagination.py
+
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Default pagination for list endpoints: keyset (cursor) pages over a
+    stable ordering, so deep pages cost the same as the first one.
+
+    Views pick their ordering with a `cursor_ordering` attribute, e.g.
+    ('-submitted_at', '-id'). A total is only computed when asked for:
+
+    ?count=exact     exact COUNT(*)
+    ?count=estimate  count capped at `count_cap` rows, cheap on large tables
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = '-id'
+    count_query_param = 'count'
+    count_cap = 10000
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, 'cursor_ordering', None)
+        if ordering is None:
+            return super().get_ordering(request, queryset, view)
+        if isinstance(ordering, str):
+            return (ordering,)
+        return tuple(ordering)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count, self.count_is_exact = self.get_count(queryset, request)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_count(self, queryset, request):
+        mode = request.query_params.get(self.count_query_param)
+        if mode == 'exact':
+            return queryset.count(), True
+        if mode == 'estimate':
+            # Counting a bounded subquery stops scanning after count_cap rows
+            count = queryset.order_by().values('pk')[:self.count_cap + 1].count()
+            if count > self.count_cap:
+                return self.count_cap, False
+            return count, True
+        return None, None
+
+    def get_paginated_response(self, data):
+        payload = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+        if self.count is not None:
+            payload['count'] = self.count
+            payload['count_is_exact'] = self.count_is_exact
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties'].update({
+            'count': {'type': 'integer', 'example': 123},
+            'count_is_exact': {'type': 'boolean'},
+        })
+        return response_schema
@@ -0,0 +1,185 @@
+# backend/users/provisioning.py
+"""
+Bulk account provisioning.
+
+Password hashing (PBKDF2 by default) dominates the cost of creating
+accounts, so passwords are hashed across a pool of processes and the
+resulting rows are inserted with bulk_create. Used by the bulk importer
+and by the batch forms of CreateUserView and CreateAdminView.
+"""
+
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.mail import EmailMultiAlternatives
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Lower
+from django.utils.crypto import get_random_string
+
+from .email_rendering import render_email_batch
+from .models import User, Admin, Teacher, Student
+from .outbox import enqueue_messages
+
+
+PROFILE_MODELS = {'admin': Admin, 'teacher': Teacher, 'student': Student}
+EMAIL_PATTERN = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+PASSWORD_LENGTH = 12
+
+_executor = None
+
+
+def hash_workers():
+    return settings.PASSWORD_HASH_WORKERS or os.cpu_count() or 1
+
+
+def get_hash_executor():
+    """Returns the process pool used for hashing, started on first use."""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=hash_workers())
+    return _executor
+
+
+def hash_passwords(passwords):
+    """
+    Hashes passwords with the configured hasher, in parallel when there are
+    enough of them to be worth sending to the pool. Order is preserved.
+    """
+    if len(passwords) < settings.PASSWORD_HASH_PARALLEL_MIN:
+        return [make_password(password) for password in passwords]
+    # A few chunks per worker keeps them all busy without per-item overhead
+    chunksize = max(1, len(passwords) // (hash_workers() * 4))
+    return list(get_hash_executor().map(make_password, passwords, chunksize=chunksize))
+
+
+def existing_emails(emails):
+    """
+    Returns those of the given lowercased emails that an account already
+    uses, whatever its case; MySQL's collation treats them as duplicates.
+    """
+    return set(
+        User.objects.annotate(email_lower=Lower('email'))
+        .filter(email_lower__in=emails)
+        .values_list('email_lower', flat=True)
+    )
+
+
+def _insert(institution, specs, passwords):
+    hashes = hash_passwords(passwords)
+    emails = [email for _, email, _ in specs]
+    with transaction.atomic():
+        User.objects.bulk_create([
+            User(
+                username=email.split('@')[0],
+                email=email,
+                password=password_hash,
+                user_role=role,
+                institution=institution,
+            )
+            for (_, email, role), password_hash in zip(specs, hashes)
+        ])
+        # Re-read rather than rely on bulk_create setting pks, which MySQL does not
+        by_email = User.objects.in_bulk(emails, field_name='email')
+        users = [by_email[email] for email in emails]
+        for role, model in PROFILE_MODELS.items():
+            model.objects.bulk_create([
+                model(user=user, institution=institution)
+                for user in users if user.user_role == role
+            ])
+    return users
+
+
+def create_accounts(institution, specs):
+    """
+    Creates accounts and their role profiles for already validated specs,
+    a list of (row, email, role). Returns (accounts, errors) where accounts
+    is a list of (user, password) and errors lists the rows whose email
+    was taken by someone else in the meantime.
+    """
+    passwords = [get_random_string(length=PASSWORD_LENGTH) for _ in specs]
+    errors = []
+    try:
+        users = _insert(institution, specs, passwords)
+    except IntegrityError:
+        existing = existing_emails([email for _, email, _ in specs])
+        kept = [(spec, password) for spec, password in zip(specs, passwords) if spec[1] not in existing]
+        errors = [
+            {'row': row, 'email': email, 'error': "A user with this email already exists."}
+            for row, email, _ in specs if email in existing
+        ]
+        specs = [spec for spec, _ in kept]
+        passwords = [password for _, password in kept]
+        users = _insert(institution, specs, passwords)
+    return list(zip(users, passwords)), errors
+
+
+def provision_accounts(institution, entries, roles):
+    """
+    Validates and creates a batch of accounts. `entries` is a list of dicts
+    with 'email' and 'user_role'; only `roles` are accepted. Returns
+    (accounts, errors) with one error dict per rejected entry, where 'row'
+    is the entry's index in the batch.
+    """
+    errors = []
+    specs = []
+    seen = set()
+    for row, entry in enumerate(entries):
+        email = str(entry.get('email') or '').strip().lower()
+        role = str(entry.get('user_role') or '').strip().lower()
+        if not EMAIL_PATTERN.match(email):
+            error = "Invalid email address."
+        elif role not in roles:
+            error = "Invalid user role"
+        elif email in seen:
+            error = "Duplicate email in batch."
+        else:
+            error = None
+        seen.add(email)
+        if error:
+            errors.append({'row': row, 'email': email, 'error': error})
+        else:
+            specs.append((row, email, role))
+
+    existing = existing_emails([email for _, email, _ in specs])
+    errors.extend(
+        {'row': row, 'email': email, 'error': "A user with this email already exists."}
+        for row, email, _ in specs if email in existing
+    )
+    specs = [spec for spec in specs if spec[1] not in existing]
+
+    accounts, insert_errors = create_accounts(institution, specs) if specs else ([], [])
+    errors = sorted(errors + insert_errors, key=lambda error: error['row'])
+    return accounts, errors
+
+
+def send_credentials(accounts, from_email, template, subject):
+    """
+    Queues an email with its login details for each new account.
+    `template` is the template path without extension, e.g.
+    'admin/create_new_user'; `subject` may use {user_role}.
+    """
+    contexts = [
+        {
+            "username": user.username,
+            "email": user.email,
+            "password": password,
+            "user_role": user.user_role
+        }
+        for user, password in accounts
+    ]
+    bodies = render_email_batch(template, contexts)
+    subjects = {role: subject.format(user_role=role.capitalize()) for role in PROFILE_MODELS}
+    messages = []
+    for (user, _), (text_body, html_body) in zip(accounts, bodies):
+        message = EmailMultiAlternatives(
+            subject=subjects[user.user_role],
+            from_email=from_email,
+            to=[user.email],
+            body=text_body,
+        )
+        message.attach_alternative(html_body, "text/html")
+        messages.append(message)
+    enqueue_messages(messages, dedupe_keys=[f'credentials:{user.pk}' for user, _ in accounts])
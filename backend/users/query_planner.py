@@ -0,0 +1,173 @@
+# backend/users/query_planner.py
+
+from rest_framework import serializers, relations
+
+from . import models as user_models
+
+
+# Model methods used as serializer field sources, mapped to the relation
+# path they read from. The methods themselves go through these relations
+# so that prefetched results are reused instead of re-queried.
+METHOD_RELATIONS = {
+    (user_models.Course, 'students'): 'courseenrollment_set',
+    (user_models.Course, 'assessments'): 'assessment_set',
+    (user_models.CourseEnrollment, 'assessments'): 'course__assessment_set',
+    (user_models.CourseEnrollment, 'quizzes'): 'course__quizzes',
+}
+
+# Relations each model's __str__ reads, needed when it is rendered through
+# a StringRelatedField.
+STR_RELATIONS = {
+    user_models.Manager: ['user'],
+    user_models.Admin: ['user'],
+    user_models.Teacher: ['user'],
+    user_models.Student: ['user'],
+    user_models.CourseEnrollment: ['student__user', 'course'],
+    user_models.CourseMaterial: ['course'],
+    user_models.Submission: ['student__user'],
+}
+
+_plan_cache = {}
+
+
+class QueryPlan:
+    """
+    The select_related/prefetch_related lookups needed to serialize a model
+    without lazy per-row queries.
+    """
+
+    def __init__(self):
+        self.select_related = set()
+        self.prefetch_related = set()
+
+    def add(self, path, to_many):
+        if to_many:
+            self.prefetch_related.add(path)
+        else:
+            self.select_related.add(path)
+
+    def apply(self, queryset):
+        if self.select_related:
+            queryset = queryset.select_related(*sorted(self.select_related))
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*sorted(self.prefetch_related))
+        return queryset
+
+
+def _relation_steps(model, attr):
+    """
+    Resolve a single source attribute on a model into relation steps.
+
+    Returns a list of (name, to_many, related_model) tuples, or None when the
+    attribute is not a relation.
+    """
+    alias = METHOD_RELATIONS.get((model, attr))
+    if alias is not None:
+        steps = []
+        for name in alias.split('__'):
+            step = _relation_steps(model, name)
+            steps.extend(step)
+            model = step[-1][2]
+        return steps
+
+    for field in model._meta.get_fields():
+        if not field.is_relation:
+            continue
+        if field.auto_created and not field.concrete:
+            # Reverse relation, reached through its accessor name
+            if field.get_accessor_name() != attr:
+                continue
+            to_many = field.one_to_many or field.many_to_many
+        else:
+            if field.name != attr:
+                continue
+            to_many = field.many_to_many
+        return [(attr, to_many, field.related_model)]
+    return None
+
+
+def _resolve_source(model, source_attrs):
+    steps = []
+    for attr in source_attrs:
+        step = _relation_steps(model, attr)
+        if step is None:
+            return None
+        steps.extend(step)
+        model = step[-1][2]
+    return steps
+
+
+def _walk(serializer, model, prefix, to_many, plan):
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*':
+            continue
+
+        steps = _resolve_source(model, field.source_attrs)
+        if not steps:
+            continue
+
+        path = prefix + [name for name, _, _ in steps]
+        path_to_many = to_many or any(many for _, many, _ in steps)
+        related_model = steps[-1][2]
+
+        if not to_many:
+            # Join the single-valued part of the path up front
+            for index, (_, many, _) in enumerate(steps):
+                if many:
+                    break
+                plan.add('__'.join(prefix + [name for name, _, _ in steps[:index + 1]]), False)
+
+        if isinstance(field, serializers.ListSerializer):
+            field = field.child
+
+        if isinstance(field, serializers.BaseSerializer):
+            plan.add('__'.join(path), path_to_many)
+            _walk(field, related_model, path, path_to_many, plan)
+        elif isinstance(field, relations.ManyRelatedField):
+            plan.add('__'.join(path), True)
+            if isinstance(field.child_relation, relations.StringRelatedField):
+                for extra in STR_RELATIONS.get(related_model, []):
+                    plan.add('__'.join(path + [extra]), True)
+        elif isinstance(field, relations.StringRelatedField):
+            plan.add('__'.join(path), path_to_many)
+            for extra in STR_RELATIONS.get(related_model, []):
+                plan.add('__'.join(path + [extra]), path_to_many)
+        elif isinstance(field, relations.RelatedField) and not field.use_pk_only_optimization():
+            plan.add('__'.join(path), path_to_many)
+
+
+def get_query_plan(serializer):
+    """
+    Build (and cache) the query plan for a serializer instance by walking its
+    field tree, including nested serializers generated by Meta.depth.
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+
+    meta = getattr(serializer, 'Meta', None)
+    # Sparse fieldsets change the field tree, so they are part of the key
+    key = (type(serializer), getattr(meta, 'depth', 0), tuple(serializer.fields))
+    plan = _plan_cache.get(key)
+    if plan is None:
+        plan = QueryPlan()
+        _walk(serializer, meta.model, [], False, plan)
+        _plan_cache[key] = plan
+    return plan
+
+
+def apply_query_plan(queryset, serializer):
+    return get_query_plan(serializer).apply(queryset)
+
+
+class QueryPlanMixin:
+    """
+    Generic view mixin that applies the serializer's query plan to the list
+    queryset. Views with a custom get_object can call plan_queryset directly.
+    """
+
+    def plan_queryset(self, queryset):
+        serializer = self.get_serializer_class()(context=self.get_serializer_context())
+        return apply_query_plan(queryset, serializer)
+
+    def filter_queryset(self, queryset):
+        return self.plan_queryset(super().filter_queryset(queryset))
@@ -0,0 +1,260 @@
+# backend/users/quiz_sessions.py
+"""
+Server-side quiz sessions.
+
+start_session records when a student opens a quiz. For a timed quiz the
+session expires time_limit minutes later: submissions after expires_at
+(plus QUIZ_SESSION_GRACE_SECONDS for the request in flight) are refused,
+and at expiry the latest draft is submitted for the student.
+
+Deadlines are not one Celery ETA task per student. Every running timed
+session is a member of one Redis sorted set scored by its deadline, and a
+single expire_quiz_sessions_task ticks every QUIZ_SESSION_TICK seconds
+while the set is non-empty, popping whatever is due. Adding, removing and
+popping a session are O(log n), so tens of thousands of concurrent sessions
+cost one small sorted set and one task per tick.
+
+The sorted set is an index, not the record: every tick also sweeps the
+database for ACTIVE sessions past their deadline, so sessions whose entry
+was lost (a worker dying mid-batch, a failed auto-submit) still close.
+"""
+
+import logging
+import threading
+from datetime import timedelta
+
+import redis
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import QuizSession, Submission
+
+
+logger = logging.getLogger(__name__)
+
+class SessionClosed(Exception):
+    """The session has expired or was already submitted."""
+
+
+class RedisDeadlineStore:
+    """Session deadlines in a sorted set shared by every process."""
+
+    def __init__(self, url, prefix='quiz-sessions'):
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.key = f'{prefix}:deadlines'
+        self.tick_key = f'{prefix}:tick'
+
+    def add(self, session_id, deadline):
+        self.client.zadd(self.key, {session_id: deadline})
+
+    def remove(self, session_id):
+        self.client.zrem(self.key, session_id)
+
+    def claim_due(self, now, limit):
+        """Removes and returns up to `limit` sessions due by `now`; each is returned to one caller only."""
+        due = self.client.zrangebyscore(self.key, '-inf', now, start=0, num=limit)
+        if not due:
+            return []
+        pipe = self.client.pipeline()
+        for session_id in due:
+            pipe.zrem(self.key, session_id)
+        return [int(session_id) for session_id, removed in zip(due, pipe.execute()) if removed]
+
+    def count(self):
+        return self.client.zcard(self.key)
+
+    def claim_tick(self, ttl):
+        return bool(self.client.set(self.tick_key, 1, nx=True, ex=ttl))
+
+
+class MemoryDeadlineStore:
+    """The same deadlines in process memory, for a single process or tests."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._deadlines = {}
+
+    def add(self, session_id, deadline):
+        with self._lock:
+            self._deadlines[str(session_id)] = deadline
+
+    def remove(self, session_id):
+        with self._lock:
+            self._deadlines.pop(str(session_id), None)
+
+    def claim_due(self, now, limit):
+        with self._lock:
+            due = sorted(
+                (deadline, session_id) for session_id, deadline in self._deadlines.items() if deadline <= now
+            )[:limit]
+            for _, session_id in due:
+                del self._deadlines[session_id]
+        return [int(session_id) for _, session_id in due]
+
+    def count(self):
+        return len(self._deadlines)
+
+    def claim_tick(self, ttl):
+        return True
+
+
+_store = None
+
+
+def get_deadline_store():
+    """Returns the process-wide deadline store configured from settings."""
+    global _store
+    if _store is None:
+        if settings.QUIZ_SESSION_SCHEDULER_BACKEND == 'memory':
+            _store = MemoryDeadlineStore()
+        else:
+            _store = RedisDeadlineStore(settings.CELERY_BROKER_URL)
+    return _store
+
+
+def schedule_tick():
+    """Makes sure an expiry tick is coming, without piling up one per caller."""
+    if get_deadline_store().claim_tick(settings.QUIZ_SESSION_TICK):
+        from .tasks import expire_quiz_sessions_task
+
+        expire_quiz_sessions_task.apply_async(countdown=settings.QUIZ_SESSION_TICK)
+
+
+def remaining_seconds(session, now=None):
+    if session.expires_at is None:
+        return None
+    return max(0, int((session.expires_at - (now or timezone.now())).total_seconds()))
+
+
+def _is_late(session, now):
+    grace = timedelta(seconds=settings.QUIZ_SESSION_GRACE_SECONDS)
+    return session.expires_at is not None and now > session.expires_at + grace
+
+
+def ensure_open(session, now=None):
+    """Raises SessionClosed unless the session still takes drafts and submissions."""
+    if session.status != 'ACTIVE' or _is_late(session, now or timezone.now()):
+        raise SessionClosed('This quiz session is closed.')
+
+
+def start_session(student, quiz):
+    """Starts the student's session on the quiz, or returns the one already started."""
+    session, created = QuizSession.objects.get_or_create(quiz=quiz, student=student)
+    if created and quiz.time_limit:
+        session.expires_at = session.started_at + timedelta(minutes=quiz.time_limit)
+        session.save(update_fields=['expires_at'])
+        get_deadline_store().add(session.id, session.expires_at.timestamp())
+        schedule_tick()
+    return session
+
+
+def save_draft(session, code):
+    """
+    Stores the student's latest code, to be submitted if time runs out. Only
+    the diff to the previous draft is written (see users/drafts.py).
+    """
+    from .drafts import get_draft, save_patch
+
+    ensure_open(session)
+    save_patch(get_draft(session.student, 'quiz', session.quiz.quiz_id), None, text=code)
+    session.draft_code = code
+    if session.expires_at is not None:
+        # Re-arms the tick chain if a tick was lost, e.g. to a broker restart
+        schedule_tick()
+
+
+def _close(session, code, status, now):
+    submission = None
+    if code is not None:
+        submission = Submission.objects.create(
+            student_id=session.student_id,
+            quiz_id=session.quiz_id,
+            submission_type='QUIZ',
+            submitted_code=code,
+        )
+    session.status = status
+    session.submission = submission
+    session.closed_at = now
+    session.save(update_fields=['status', 'submission', 'closed_at'])
+    return submission
+
+
+def submit_quiz(student, quiz, code):
+    """
+    Creates the student's quiz submission. Timed quizzes need a running
+    session and are refused after its deadline; untimed quizzes can be
+    submitted again as before. The caller queues grading.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        session = QuizSession.objects.select_for_update().filter(quiz=quiz, student=student).first()
+        if not quiz.time_limit:
+            if session is not None and session.status == 'ACTIVE':
+                return _close(session, code, 'SUBMITTED', now)
+            return Submission.objects.create(student=student, quiz=quiz, submission_type='QUIZ', submitted_code=code)
+        if session is None:
+            raise SessionClosed('Start the quiz before submitting it.')
+        ensure_open(session, now)
+        submission = _close(session, code, 'SUBMITTED', now)
+    get_deadline_store().remove(session.id)
+    # Other students' sessions may still be running on a lost tick chain
+    schedule_tick()
+    return submission
+
+
+def auto_submit(session_id, now=None):
+    """
+    Closes an expired session, submitting its draft if there is one.
+    Returns the closed session, or None if it was not due.
+    """
+    from .drafts import latest_text
+
+    now = now or timezone.now()
+    with transaction.atomic():
+        session = (
+            QuizSession.objects.select_for_update(of=('self',)).select_related('quiz')
+            .filter(id=session_id, status='ACTIVE').first()
+        )
+        if session is None or not _is_late(session, now):
+            return None
+        # Autosaved edits may not have been written through to draft_code yet
+        code = latest_text(session.student_id, 'quiz', session.quiz.quiz_id, default=session.draft_code)
+        if code:
+            _close(session, code, 'AUTO_SUBMITTED', now)
+        else:
+            _close(session, None, 'EXPIRED', now)
+    return session
+
+
+def overdue_sessions(cutoff):
+    return QuizSession.objects.filter(status='ACTIVE', expires_at__lt=cutoff)
+
+
+def expire_due_sessions(now=None, limit=None):
+    """Auto-submits sessions whose deadline and grace period have passed. Returns the number closed."""
+    from .tasks import enqueue_grading
+
+    now = now or timezone.now()
+    limit = limit or settings.QUIZ_SESSION_EXPIRE_BATCH
+    store = get_deadline_store()
+    # Submissions are accepted until the grace period is over, so the draft is not taken before then
+    cutoff = now - timedelta(seconds=settings.QUIZ_SESSION_GRACE_SECONDS)
+    due = store.claim_due(cutoff.timestamp(), limit)
+    # Sessions missing from the store because an earlier tick lost them
+    due += list(overdue_sessions(cutoff).exclude(id__in=due).order_by('expires_at').values_list('id', flat=True)[:limit])
+
+    closed = 0
+    for session_id in due:
+        try:
+            session = auto_submit(session_id, now)
+            if session is not None and session.submission is not None:
+                enqueue_grading(session.submission)
+        except Exception:
+            logger.exception("Auto-submitting quiz session %s failed", session_id)
+            # Try again on the next tick
+            store.add(session_id, cutoff.timestamp())
+            continue
+        if session is not None:
+            closed += 1
+    return closed
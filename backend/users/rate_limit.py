@@ -0,0 +1,191 @@
+# backend/users/rate_limit.py
+
+import random
+import threading
+import time
+
+import redis
+from django.conf import settings
+
+
+# Refills and takes from the request and token buckets in one atomic step.
+# Nothing is taken unless both buckets can pay; the reply is the number of
+# seconds to wait before retrying (as a string, Lua numbers are truncated).
+TAKE_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local function refill(key, capacity, rate)
+    local data = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(data[1]) or capacity
+    local ts = tonumber(data[2]) or now
+    return math.min(capacity, tokens + math.max(0, now - ts) * rate)
+end
+
+local request_capacity = tonumber(ARGV[1])
+local request_rate = tonumber(ARGV[2])
+local token_capacity = tonumber(ARGV[3])
+local token_rate = tonumber(ARGV[4])
+local cost = tonumber(ARGV[5])
+
+local requests = refill(KEYS[1], request_capacity, request_rate)
+local tokens = refill(KEYS[2], token_capacity, token_rate)
+
+local wait = 0
+if requests < 1 then
+    wait = math.max(wait, (1 - requests) / request_rate)
+end
+if tokens < cost then
+    wait = math.max(wait, (cost - tokens) / token_rate)
+end
+if wait == 0 then
+    requests = requests - 1
+    tokens = tokens - cost
+end
+
+redis.call('HSET', KEYS[1], 'tokens', requests, 'ts', now)
+redis.call('HSET', KEYS[2], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], 300)
+redis.call('EXPIRE', KEYS[2], 300)
+return tostring(wait)
+"""
+
+
+class RedisBucketStore:
+    """Token buckets shared by every worker through Redis."""
+
+    def __init__(self, url, prefix):
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._take = self.client.register_script(TAKE_SCRIPT)
+
+    def take(self, request_capacity, request_rate, token_capacity, token_rate, cost):
+        wait = self._take(
+            keys=[f'{self.prefix}:requests', f'{self.prefix}:tokens'],
+            args=[request_capacity, request_rate, token_capacity, token_rate, cost],
+        )
+        return float(wait)
+
+    def get_factor(self):
+        value = self.client.get(f'{self.prefix}:factor')
+        return float(value) if value is not None else 1.0
+
+    def set_factor(self, value):
+        self.client.set(f'{self.prefix}:factor', value, ex=3600)
+
+
+class MemoryBucketStore:
+    """Same buckets kept in process memory, for a single worker or tests."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._factor = 1.0
+
+    def _refill(self, name, capacity, rate, now):
+        tokens, ts = self._buckets.get(name, (capacity, now))
+        return min(capacity, tokens + max(0, now - ts) * rate)
+
+    def take(self, request_capacity, request_rate, token_capacity, token_rate, cost):
+        with self._lock:
+            now = time.monotonic()
+            requests = self._refill('requests', request_capacity, request_rate, now)
+            tokens = self._refill('tokens', token_capacity, token_rate, now)
+
+            wait = 0
+            if requests < 1:
+                wait = max(wait, (1 - requests) / request_rate)
+            if tokens < cost:
+                wait = max(wait, (cost - tokens) / token_rate)
+            if wait == 0:
+                requests -= 1
+                tokens -= cost
+
+            self._buckets['requests'] = (requests, now)
+            self._buckets['tokens'] = (tokens, now)
+            return wait
+
+    def get_factor(self):
+        return self._factor
+
+    def set_factor(self, value):
+        self._factor = value
+
+
+class RateLimiter:
+    """
+    Paces grading requests to the provider's requests-per-minute and
+    tokens-per-minute quotas.
+
+    Each request takes one unit from the request bucket and its estimated
+    token count from the token bucket. The refill rate adapts (AIMD): it is
+    halved whenever the provider still answers with a rate-limit error and
+    creeps back up with every success, so throughput settles just under the
+    real quota instead of oscillating into error storms.
+    """
+
+    decrease = 0.5
+    increase = 0.05
+    min_factor = 0.1
+
+    def __init__(self, store, requests_per_minute, tokens_per_minute):
+        self.store = store
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+
+    def try_acquire(self, tokens):
+        """Takes capacity for one request. Returns 0, or the seconds to wait."""
+        factor = self.store.get_factor()
+        tokens = min(tokens, self.tokens_per_minute)
+        return self.store.take(
+            self.requests_per_minute,
+            self.requests_per_minute * factor / 60,
+            self.tokens_per_minute,
+            self.tokens_per_minute * factor / 60,
+            tokens,
+        )
+
+    def on_success(self):
+        factor = self.store.get_factor()
+        if factor < 1.0:
+            self.store.set_factor(min(1.0, factor + self.increase))
+
+    def on_rate_limited(self):
+        factor = self.store.get_factor()
+        self.store.set_factor(max(self.min_factor, factor * self.decrease))
+
+
+def backoff_delay(attempt, retry_after=None):
+    """
+    Exponential backoff with full jitter for the given retry attempt
+    (0-based). A Retry-After hint from the provider takes precedence.
+    """
+    if retry_after:
+        return retry_after
+    ceiling = min(settings.AI_GRADING_BACKOFF_CAP, settings.AI_GRADING_BACKOFF_BASE * 2 ** attempt)
+    return random.uniform(0, ceiling)
+
+
+def estimate_tokens(request):
+    """Rough token estimate for a chat completion request (~4 chars a token)."""
+    prompt_chars = sum(len(message['content']) for message in request['messages'])
+    return prompt_chars // 4 + request.get('max_tokens', 0)
+
+
+_limiter = None
+
+
+def get_rate_limiter():
+    """Returns the process-wide limiter configured from settings."""
+    global _limiter
+    if _limiter is None:
+        if settings.AI_GRADING_RATE_LIMIT_BACKEND == 'memory':
+            store = MemoryBucketStore()
+        else:
+            store = RedisBucketStore(settings.AI_GRADING_RATE_LIMIT_REDIS_URL, 'ai-grade:rate')
+        _limiter = RateLimiter(
+            store,
+            settings.AI_GRADING_REQUESTS_PER_MINUTE,
+            settings.AI_GRADING_TOKENS_PER_MINUTE,
+        )
+    return _limiter
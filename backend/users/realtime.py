@@ -0,0 +1,90 @@
+# backend/users/realtime.py
+"""
+Grading status pushed over WebSockets.
+
+Clients connect to ws/grading/?token=<access token> (see users/consumers.py).
+A student joins their own group and a teacher joins one group per course
+they teach. refresh_gradebook calls publish_submission_status for every
+submission created or graded, so the student and the course's teacher hear
+about PENDING -> GRADED as it happens instead of polling the scores
+endpoint.
+
+Publishing is best-effort: grading never fails because the channel layer is
+unreachable.
+"""
+
+import logging
+from urllib.parse import parse_qs
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.middleware import BaseMiddleware
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import AccessToken
+
+
+logger = logging.getLogger(__name__)
+
+STATUS_EVENT = 'submission.status'
+
+
+def student_group(student_id):
+    return f'grading.student.{student_id}'
+
+
+def course_group(course_id):
+    return f'grading.course.{course_id}'
+
+
+def publish_submission_status(attempts):
+    """
+    Sends each attempt row (as read by refresh_gradebook) to its student's
+    group and its course's group.
+    """
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    for row in attempts:
+        course_id = row['assessment__course_id'] or row['quiz__course_id']
+        event = {
+            'type': STATUS_EVENT,
+            'submission': {
+                'submission_id': row['id'],
+                'student_id': row['student_id'],
+                'course_id': course_id,
+                'assessment_id': row['assessment_id'],
+                'quiz_id': row['quiz_id'],
+                'status': row['grading_status'],
+                'score': row['score'],
+            },
+        }
+        try:
+            async_to_sync(layer.group_send)(student_group(row['student_id']), event)
+            if course_id:
+                async_to_sync(layer.group_send)(course_group(course_id), event)
+        except Exception:
+            logger.warning('Could not publish status of submission %s', row['id'], exc_info=True)
+
+
+@database_sync_to_async
+def _user_for_token(token):
+    try:
+        user_id = AccessToken(token)['user_id']
+    except (TokenError, KeyError):
+        return AnonymousUser()
+    return get_user_model().objects.filter(id=user_id, is_active=True).first() or AnonymousUser()
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    Sets scope['user'] from a simplejwt access token in the query string,
+    since browsers cannot send an Authorization header with a WebSocket.
+    """
+
+    async def __call__(self, scope, receive, send):
+        token = parse_qs(scope.get('query_string', b'').decode()).get('token')
+        scope = dict(scope, user=await _user_for_token(token[0]) if token else AnonymousUser())
+        return await super().__call__(scope, receive, send)
@@ -0,0 +1,10 @@
+# backend/users/routing.py
+
+from django.urls import path
+
+from .consumers import GradingStatusConsumer
+
+
+websocket_urlpatterns = [
+    path('ws/grading/', GradingStatusConsumer.as_asgi()),
+]
@@ -0,0 +1,241 @@
+# backend/users/sandbox.py
+"""
+Runs submitted code against instructor test cases, offline.
+
+Code runs in forked children of a pool of warm worker interpreters (see
+users/sandbox_worker.py), so each run costs a fork rather than a Python
+start-up. Each run gets rlimits, a fresh session and an empty environment,
+and unless SANDBOX_ISOLATION is off it also runs as SANDBOX_UID in an empty
+network namespace, chrooted into its scratch directory. A run that cannot
+be isolated is reported as an internal_error, never run without it.
+
+Students can read a submission's test_results, so a hidden test case's
+result keeps only whether it passed and its points; its name, output and
+errors would give away the hidden input.
+"""
+
+import hashlib
+import json
+import os
+import queue
+import select
+import subprocess
+import sys
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .service import normalize_code, _count
+
+
+TEST_RUN_CACHE_PREFIX = 'test-run'
+TEST_RUN_CACHE_HITS = f'{TEST_RUN_CACHE_PREFIX}:hits'
+TEST_RUN_CACHE_MISSES = f'{TEST_RUN_CACHE_PREFIX}:misses'
+
+# Outcomes that depend on machine load rather than the code; never cached
+UNSTABLE_STATUSES = {'timeout', 'internal_error'}
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sandbox_worker.py')
+
+
+class SandboxError(Exception):
+    pass
+
+
+class SandboxWorker:
+    """One warm interpreter that executes jobs sent to it one at a time."""
+
+    def __init__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, '-I', '-S', WORKER_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            env={},
+            text=True,
+            bufsize=1,
+            close_fds=True,
+        )
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def run(self, job, timeout):
+        self.process.stdin.write(json.dumps(job) + '\n')
+        self.process.stdin.flush()
+        ready, _, _ = select.select([self.process.stdout], [], [], timeout)
+        if not ready:
+            raise SandboxError("Sandbox worker did not answer in time.")
+        line = self.process.stdout.readline()
+        if not line:
+            raise SandboxError("Sandbox worker exited.")
+        return json.loads(line)
+
+    def close(self):
+        if self.alive():
+            self.process.kill()
+        self.process.wait()
+
+
+class SandboxPool:
+    """
+    A fixed number of pre-started workers shared by the threads of one
+    process. A worker that fails is replaced rather than reused.
+    """
+
+    def __init__(self, size=None):
+        self.size = size or settings.SANDBOX_POOL_SIZE
+        self._idle = queue.Queue()
+        for _ in range(self.size):
+            self._idle.put(SandboxWorker())
+
+    def run(self, code, stdin='', cpu_time=None, memory=None, wall_time=None, output_limit=None):
+        """
+        Runs `code` with `stdin` as its input. Returns a dict with status
+        ('ok', 'error', 'timeout', 'cpu_limit', 'memory_limit' or
+        'output_limit'), exit_code, stdout, stderr and duration in seconds.
+        """
+        job = {
+            'code': code,
+            'stdin': stdin,
+            'cpu_time': cpu_time or settings.SANDBOX_CPU_TIME_LIMIT,
+            'memory': memory or settings.SANDBOX_MEMORY_LIMIT,
+            'wall_time': wall_time or settings.SANDBOX_WALL_TIME_LIMIT,
+            'output_limit': output_limit or settings.SANDBOX_OUTPUT_LIMIT,
+            'isolate': settings.SANDBOX_ISOLATION,
+            'uid': settings.SANDBOX_UID,
+            'gid': settings.SANDBOX_GID,
+        }
+        worker = self._idle.get()
+        try:
+            if not worker.alive():
+                worker = SandboxWorker()
+            result = worker.run(job, timeout=job['wall_time'] + 5)
+        except (SandboxError, OSError, ValueError):
+            worker.close()
+            worker = SandboxWorker()
+            raise
+        finally:
+            self._idle.put(worker)
+        return result
+
+    def close(self):
+        while not self._idle.empty():
+            self._idle.get_nowait().close()
+
+
+def outputs_match(actual, expected):
+    """Compares program output, ignoring trailing whitespace on each line and at the end."""
+    def normalize(text):
+        return [line.rstrip() for line in (text or '').rstrip().splitlines()]
+    return normalize(actual) == normalize(expected)
+
+
+def test_cases_for(submission):
+    """The test cases of the assessment or quiz a submission answers."""
+    if submission.submission_type == 'ASSESSMENT' and submission.assessment:
+        return list(submission.assessment.test_cases.all())
+    if submission.submission_type == 'QUIZ' and submission.quiz:
+        return list(submission.quiz.test_cases.all())
+    return []
+
+
+def run_test_cases(code, test_cases, pool=None):
+    """
+    Runs `code` once per test case. Returns a list of result dicts, one per
+    test case, in order.
+    """
+    pool = pool or get_sandbox_pool()
+    results = []
+    for test_case in test_cases:
+        run = pool.run(code, stdin=test_case.stdin)
+        passed = run['status'] == 'ok' and outputs_match(run['stdout'], test_case.expected_output)
+        result = {
+            'test_case_id': test_case.id,
+            'passed': passed,
+            'points': test_case.points if passed else 0,
+            'max_points': test_case.points,
+            'status': run['status'],
+            'is_hidden': test_case.is_hidden,
+        }
+        if not test_case.is_hidden:
+            result.update(name=test_case.name, stdout=run['stdout'], stderr=run['stderr'], duration=run['duration'])
+        results.append(result)
+    return results
+
+
+def test_suite_fingerprint(test_cases):
+    """
+    A version hash of a test suite: changes whenever a test case is added,
+    removed or edited, or the sandbox limits change.
+    """
+    payload = json.dumps({
+        # Bumped when the stored result format changes
+        'format': 2,
+        'tests': [
+            [test_case.id, test_case.name, test_case.stdin, test_case.expected_output,
+             test_case.points, test_case.is_hidden]
+            for test_case in test_cases
+        ],
+        'limits': [
+            settings.SANDBOX_CPU_TIME_LIMIT, settings.SANDBOX_WALL_TIME_LIMIT,
+            settings.SANDBOX_MEMORY_LIMIT, settings.SANDBOX_OUTPUT_LIMIT,
+        ],
+    })
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def test_run_cache_key(code, test_cases):
+    code_digest = hashlib.sha256(normalize_code(code).encode('utf-8')).hexdigest()
+    return f'{TEST_RUN_CACHE_PREFIX}:{code_digest}:{test_suite_fingerprint(test_cases)}'
+
+
+def cached_run_test_cases(code, test_cases, pool=None):
+    """
+    Same as run_test_cases, but reuses the results of an earlier run of the
+    same normalized code against the same version of the test suite, so
+    re-grading and identical submissions from other students skip the
+    sandbox. Editing the tests changes the key, which retires old results.
+    """
+    key = test_run_cache_key(code, test_cases)
+    results = cache.get(key)
+    _count(TEST_RUN_CACHE_HITS if results is not None else TEST_RUN_CACHE_MISSES)
+    if results is not None:
+        return results
+
+    results = run_test_cases(code, test_cases, pool)
+    if not any(result['status'] in UNSTABLE_STATUSES for result in results):
+        cache.set(key, results, timeout=settings.TEST_RUN_CACHE_TTL)
+    return results
+
+
+def test_run_cache_stats():
+    """Returns the test run cache hit/miss counters."""
+    counters = cache.get_many([TEST_RUN_CACHE_HITS, TEST_RUN_CACHE_MISSES])
+    return {
+        'hits': counters.get(TEST_RUN_CACHE_HITS, 0),
+        'misses': counters.get(TEST_RUN_CACHE_MISSES, 0),
+    }
+
+
+def score_test_results(results, max_score):
+    """Scales the points earned to the assessment's max_score."""
+    total = sum(result['max_points'] for result in results)
+    if not total:
+        return 0.0
+    earned = sum(result['points'] for result in results)
+    return round(earned / total * (max_score or 100), 2)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_sandbox_pool():
+    """Returns this process's warm pool, starting it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SandboxPool()
+    return _pool
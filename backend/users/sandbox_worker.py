@@ -0,0 +1,203 @@
+# backend/users/sandbox_worker.py
+"""
+Warm sandbox worker, started by users/sandbox.py as a separate interpreter.
+
+It reads one JSON job per line on stdin and writes one JSON result per line
+on stdout. Each job runs in a forked child, so the cost of starting Python
+is paid once per worker rather than once per run. Before the submitted
+code is executed the child gets its own session, an empty environment and
+rlimits for CPU time, address space, file size and process count. When the
+job asks for isolation (the default, which needs the worker to start as
+root) the child also moves into a network namespace with no interfaces,
+chroots into its scratch directory and drops to an unprivileged uid and gid,
+so it can neither reach the network nor read the server's files.
+
+Nothing can be imported from inside the chroot, so the standard modules in
+PRELOAD_MODULES are imported once by the worker and inherited by every run.
+
+This module must not import Django or anything from the project.
+"""
+
+import io
+import json
+import os
+import resource
+import shutil
+import signal
+import sys
+import tempfile
+import time
+import traceback
+
+
+EXIT_MEMORY = 120
+EXIT_INTERNAL = 121
+
+PRELOAD_MODULES = [
+    'array', 'bisect', 'collections', 'copy', 'dataclasses', 'datetime', 'decimal', 'enum',
+    'fractions', 'functools', 'heapq', 'itertools', 'json', 'math', 'operator', 'random',
+    're', 'statistics', 'string', 'textwrap', 'time', 'typing',
+]
+
+
+def _limit(kind, value):
+    try:
+        resource.setrlimit(kind, (value, value))
+    except (ValueError, OSError):
+        pass
+
+
+def _isolate(job):
+    """Cuts the child off from the network and the filesystem and drops root."""
+    os.unshare(os.CLONE_NEWNET)
+    os.chroot('.')
+    os.chdir('/')
+    os.setgroups([])
+    os.setgid(job['gid'])
+    os.setuid(job['uid'])
+    if os.getuid() == 0 or os.geteuid() == 0:
+        raise OSError('The sandbox is still running as root.')
+
+
+def _child(job, workdir):
+    os.setsid()
+    os.chdir(workdir)
+    os.environ.clear()
+    # Python ignores SIGXFSZ; restore it so oversized output ends the run
+    signal.signal(signal.SIGXFSZ, signal.SIG_DFL)
+
+    stdin = os.open('stdin', os.O_RDONLY)
+    stdout = os.open('stdout', os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    stderr = os.open('stderr', os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    os.dup2(stdin, 0)
+    os.dup2(stdout, 1)
+    os.dup2(stderr, 2)
+    os.closerange(3, 1024)
+
+    # The worker's own streams are bound to the job channel; rebuild them
+    sys.stdin = io.TextIOWrapper(io.FileIO(0, 'r', closefd=False), encoding='utf-8')
+    sys.stdout = io.TextIOWrapper(io.FileIO(1, 'w', closefd=False), encoding='utf-8', write_through=True)
+    sys.stderr = io.TextIOWrapper(io.FileIO(2, 'w', closefd=False), encoding='utf-8', write_through=True)
+
+    if job.get('isolate', True):
+        try:
+            _isolate(job)
+        except OSError as e:
+            # Never run the code without the isolation it asked for
+            sys.stderr.write(f'Sandbox isolation failed: {e}\n')
+            os._exit(EXIT_INTERNAL)
+
+    cpu = int(job['cpu_time'])
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+    _limit(resource.RLIMIT_AS, job['memory'])
+    _limit(resource.RLIMIT_FSIZE, job['output_limit'])
+    _limit(resource.RLIMIT_NPROC, 0)
+    _limit(resource.RLIMIT_CORE, 0)
+
+    status = 0
+    try:
+        code = compile(job['code'], '<submission>', 'exec')
+        exec(code, {'__name__': '__main__', '__builtins__': __builtins__})
+    except SystemExit as e:
+        status = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except MemoryError:
+        status = EXIT_MEMORY
+    except BaseException as e:
+        # Leave this module's frame out of the traceback the student sees
+        traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+        status = 1
+
+    try:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    except BaseException:
+        pass
+    os._exit(status)
+
+
+def _read(path, limit):
+    if not os.path.exists(path):
+        return ''
+    with open(path, 'rb') as f:
+        return f.read(limit).decode('utf-8', errors='replace')
+
+
+def _wait(pid, deadline):
+    """Waits for the child until the deadline. Returns its status, or None."""
+    while True:
+        finished, status = os.waitpid(pid, os.WNOHANG)
+        if finished:
+            return status
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(0.001)
+
+
+def run(job):
+    workdir = tempfile.mkdtemp(prefix='sandbox-')
+    try:
+        with open(os.path.join(workdir, 'stdin'), 'w') as f:
+            f.write(job.get('stdin') or '')
+
+        started = time.monotonic()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _child(job, workdir)
+            finally:
+                os._exit(EXIT_INTERNAL)
+
+        status = _wait(pid, started + job['wall_time'])
+        duration = time.monotonic() - started
+        if status is None:
+            try:
+                os.killpg(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            os.waitpid(pid, 0)
+            verdict, exit_code = 'timeout', None
+        elif os.WIFSIGNALED(status):
+            sig = os.WTERMSIG(status)
+            exit_code = -sig
+            if sig in (signal.SIGXCPU, signal.SIGKILL):
+                verdict = 'cpu_limit'
+            elif sig == signal.SIGXFSZ:
+                verdict = 'output_limit'
+            else:
+                verdict = 'error'
+        else:
+            exit_code = os.WEXITSTATUS(status)
+            if exit_code == 0:
+                verdict = 'ok'
+            elif exit_code == EXIT_MEMORY:
+                verdict = 'memory_limit'
+            elif exit_code == EXIT_INTERNAL:
+                verdict = 'internal_error'
+            else:
+                verdict = 'error'
+
+        return {
+            'status': verdict,
+            'exit_code': exit_code,
+            'stdout': _read(os.path.join(workdir, 'stdout'), job['output_limit']),
+            'stderr': _read(os.path.join(workdir, 'stderr'), job['output_limit']),
+            'duration': round(duration, 4),
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    for name in PRELOAD_MODULES:
+        __import__(name)
+    for line in sys.stdin:
+        try:
+            result = run(json.loads(line))
+        except Exception as e:
+            result = {'status': 'internal_error', 'exit_code': None, 'stdout': '', 'stderr': str(e), 'duration': 0}
+        sys.stdout.write(json.dumps(result) + '\n')
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,340 @@
+# backend/users/scheduling.py
+"""
+Priority tiers and per-institution fair queuing for grading.
+
+Submissions are not sent straight to Celery. They wait in a virtual queue per
+(tier, institution) and a dispatcher moves them onto the tier's Celery queue
+with deficit round robin, only as fast as that queue drains. One
+institution's deadline burst therefore waits behind its own backlog instead
+of in front of everyone else's.
+
+Tiers map to separate Celery queues (GRADING_QUEUES), so timed quizzes can
+have dedicated workers:
+
+    celery -A core worker -Q grading-priority
+    celery -A core worker -Q grading,celery
+"""
+
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import redis
+from django.conf import settings
+
+from .models import Course
+
+
+PRIORITY = 'priority'
+STANDARD = 'standard'
+TIERS = [PRIORITY, STANDARD]
+
+
+def tier_for(submission):
+    """Timed quiz submissions are graded ahead of everything else."""
+    if submission.submission_type == 'QUIZ' and submission.quiz and submission.quiz.time_limit:
+        return PRIORITY
+    return STANDARD
+
+
+def institution_for(submission):
+    work = submission.quiz if submission.submission_type == 'QUIZ' else submission.assessment
+    if work is None:
+        return None
+    return Course.objects.filter(id=work.course_id).values_list('institution_id', flat=True).first()
+
+
+# Drops a tenant from the ring only if its queue is still empty, in one step,
+# so a concurrent push cannot land between the check and the removal
+DEACTIVATE_IF_EMPTY = """
+if redis.call('LLEN', KEYS[1]) > 0 then
+    return 0
+end
+redis.call('LREM', KEYS[2], 0, ARGV[1])
+redis.call('SREM', KEYS[3], ARGV[1])
+redis.call('HDEL', KEYS[4], ARGV[1])
+return 1
+"""
+
+
+class RedisQueueStore:
+    """Virtual queues shared by every web and worker process through Redis."""
+
+    def __init__(self, url, prefix='grading'):
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self._deactivate_if_empty = self.client.register_script(DEACTIVATE_IF_EMPTY)
+
+    def _key(self, tier, *parts):
+        return ':'.join([self.prefix, tier, *parts])
+
+    def push(self, tier, tenant, payload, front=False):
+        pipe = self.client.pipeline()
+        if front:
+            pipe.lpush(self._key(tier, 'q', tenant), payload)
+        else:
+            pipe.rpush(self._key(tier, 'q', tenant), payload)
+        pipe.sadd(self._key(tier, 'active'), tenant)
+        added = pipe.execute()[1]
+        if added:
+            self.client.rpush(self._key(tier, 'ring'), tenant)
+
+    def head(self, tier):
+        return self.client.lindex(self._key(tier, 'ring'), 0)
+
+    def rotate(self, tier):
+        key = self._key(tier, 'ring')
+        self.client.lmove(key, key, 'LEFT', 'RIGHT')
+
+    def pop(self, tier, tenant):
+        return self.client.lpop(self._key(tier, 'q', tenant))
+
+    def deactivate_if_empty(self, tier, tenant):
+        keys = [self._key(tier, 'q', tenant), self._key(tier, 'ring'), self._key(tier, 'active'), self._key(tier, 'deficit')]
+        return bool(self._deactivate_if_empty(keys=keys, args=[tenant]))
+
+    def get_deficit(self, tier, tenant):
+        return float(self.client.hget(self._key(tier, 'deficit'), tenant) or 0)
+
+    def set_deficit(self, tier, tenant, value):
+        self.client.hset(self._key(tier, 'deficit'), tenant, value)
+
+    def depth(self, tier):
+        tenants = self.client.smembers(self._key(tier, 'active'))
+        pipe = self.client.pipeline()
+        for tenant in tenants:
+            pipe.llen(self._key(tier, 'q', tenant))
+        return sum(pipe.execute()), len(tenants)
+
+    def broker_depth(self, queue):
+        # Celery's Redis transport keeps each queue as a list named after it
+        return self.client.llen(queue)
+
+    def record_wait(self, tier, seconds):
+        key = self._key(tier, 'stats')
+        pipe = self.client.pipeline()
+        pipe.hincrby(key, 'dispatched', 1)
+        pipe.hincrbyfloat(key, 'wait_total', seconds)
+        pipe.execute()
+        # Running maximum; a lost race only under-reports a concurrent peak
+        if seconds > float(self.client.hget(key, 'wait_max') or 0):
+            self.client.hset(key, 'wait_max', seconds)
+
+    def stats(self, tier):
+        return self.client.hgetall(self._key(tier, 'stats'))
+
+    def claim_kick(self, ttl):
+        return bool(self.client.set(f'{self.prefix}:kick', 1, nx=True, ex=ttl))
+
+    def release_kick(self):
+        self.client.delete(f'{self.prefix}:kick')
+
+    @contextmanager
+    def dispatch_lock(self):
+        lock = self.client.lock(f'{self.prefix}:dispatch-lock', timeout=60)
+        acquired = lock.acquire(blocking=False)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                lock.release()
+
+
+class MemoryQueueStore:
+    """The same queues in process memory, for a single process or tests."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queues = defaultdict(deque)
+        self._rings = defaultdict(deque)
+        self._deficits = defaultdict(float)
+        self._stats = defaultdict(lambda: defaultdict(float))
+        self.broker = defaultdict(int)
+        self._ring_lock = threading.Lock()
+        self._kick_lock = threading.Lock()
+        self._kick_until = 0.0
+
+    def push(self, tier, tenant, payload, front=False):
+        with self._ring_lock:
+            if front:
+                self._queues[tier, tenant].appendleft(payload)
+            else:
+                self._queues[tier, tenant].append(payload)
+            if tenant not in self._rings[tier]:
+                self._rings[tier].append(tenant)
+
+    def head(self, tier):
+        ring = self._rings[tier]
+        return ring[0] if ring else None
+
+    def rotate(self, tier):
+        self._rings[tier].rotate(-1)
+
+    def pop(self, tier, tenant):
+        queue = self._queues[tier, tenant]
+        return queue.popleft() if queue else None
+
+    def deactivate_if_empty(self, tier, tenant):
+        with self._ring_lock:
+            if self._queues[tier, tenant]:
+                return False
+            if tenant in self._rings[tier]:
+                self._rings[tier].remove(tenant)
+            self._deficits.pop((tier, tenant), None)
+            return True
+
+    def get_deficit(self, tier, tenant):
+        return self._deficits[tier, tenant]
+
+    def set_deficit(self, tier, tenant, value):
+        self._deficits[tier, tenant] = value
+
+    def depth(self, tier):
+        tenants = self._rings[tier]
+        return sum(len(self._queues[tier, tenant]) for tenant in tenants), len(tenants)
+
+    def broker_depth(self, queue):
+        return self.broker[queue]
+
+    def record_wait(self, tier, seconds):
+        stats = self._stats[tier]
+        stats['dispatched'] += 1
+        stats['wait_total'] += seconds
+        stats['wait_max'] = max(stats['wait_max'], seconds)
+
+    def stats(self, tier):
+        return dict(self._stats[tier])
+
+    def claim_kick(self, ttl):
+        with self._kick_lock:
+            now = time.monotonic()
+            if now < self._kick_until:
+                return False
+            self._kick_until = now + ttl
+            return True
+
+    def release_kick(self):
+        self._kick_until = 0.0
+
+    @contextmanager
+    def dispatch_lock(self):
+        acquired = self._lock.acquire(blocking=False)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self._lock.release()
+
+
+class GradingScheduler:
+    """
+    Deficit round robin over institutions, per tier.
+
+    Every visit tops an institution's deficit up by quantum * weight and
+    sends that many of its submissions. Weights come from
+    GRADING_INSTITUTION_WEIGHTS (default 1), so an institution can be given
+    a larger share without ever starving the rest.
+    """
+
+    quantum = 1
+
+    def __init__(self, store, send):
+        self.store = store
+        self.send = send
+
+    def weight(self, tenant):
+        return settings.GRADING_INSTITUTION_WEIGHTS.get(str(tenant), 1)
+
+    def submit(self, submission):
+        tier = tier_for(submission)
+        tenant = institution_for(submission) or 'none'
+        self.store.push(tier, str(tenant), f'{submission.id}:{time.time()}')
+        return tier
+
+    def dispatch(self):
+        """
+        Moves queued submissions onto the Celery queues, keeping each one
+        at most GRADING_DISPATCH_HIGH_WATER deep. Returns the number sent
+        per tier, or None when another dispatcher is running.
+        """
+        with self.store.dispatch_lock() as acquired:
+            if not acquired:
+                return None
+            sent = {}
+            for tier in TIERS:
+                queue = settings.GRADING_QUEUES[tier]
+                budget = settings.GRADING_DISPATCH_HIGH_WATER - self.store.broker_depth(queue)
+                sent[tier] = self._dispatch_tier(tier, queue, budget)
+            return sent
+
+    def _dispatch_tier(self, tier, queue, budget):
+        sent = 0
+        while sent < budget:
+            tenant = self.store.head(tier)
+            if tenant is None:
+                break
+
+            deficit = self.store.get_deficit(tier, tenant) + self.quantum * self.weight(tenant)
+            while deficit >= 1 and sent < budget:
+                payload = self.store.pop(tier, tenant)
+                if payload is None:
+                    break
+                submission_id, enqueued_at = payload.split(':', 1)
+                try:
+                    self.send(int(submission_id), queue)
+                except Exception:
+                    # Still the tenant's next submission; the broker may be back on the next run
+                    self.store.push(tier, tenant, payload, front=True)
+                    raise
+                self.store.record_wait(tier, max(0.0, time.time() - float(enqueued_at)))
+                sent += 1
+                deficit -= 1
+
+            if not self.store.deactivate_if_empty(tier, tenant):
+                self.store.set_deficit(tier, tenant, deficit)
+                self.store.rotate(tier)
+        return sent
+
+    def has_backlog(self):
+        return any(self.store.depth(tier)[0] for tier in TIERS)
+
+    def metrics(self):
+        """Queue depth and dispatch wait time per tier."""
+        metrics = {}
+        for tier in TIERS:
+            depth, tenants = self.store.depth(tier)
+            stats = self.store.stats(tier)
+            dispatched = int(float(stats.get('dispatched', 0)))
+            wait_total = float(stats.get('wait_total', 0))
+            metrics[tier] = {
+                'queue': settings.GRADING_QUEUES[tier],
+                'depth': depth,
+                'institutions': tenants,
+                'broker_depth': self.store.broker_depth(settings.GRADING_QUEUES[tier]),
+                'dispatched': dispatched,
+                'avg_wait_seconds': wait_total / dispatched if dispatched else 0.0,
+                'max_wait_seconds': float(stats.get('wait_max', 0)),
+            }
+        return metrics
+
+
+def send_to_celery(submission_id, queue):
+    from .tasks import grade_submission_task
+
+    grade_submission_task.apply_async(args=[submission_id], queue=queue)
+
+
+_scheduler = None
+
+
+def get_scheduler():
+    """Returns the process-wide scheduler configured from settings."""
+    global _scheduler
+    if _scheduler is None:
+        if settings.GRADING_SCHEDULER_BACKEND == 'memory':
+            store = MemoryQueueStore()
+        else:
+            store = RedisQueueStore(settings.CELERY_BROKER_URL)
+        _scheduler = GradingScheduler(store, send_to_celery)
+    return _scheduler
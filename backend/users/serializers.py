@@ -5,6 +5,9 @@ from importlib import import_module
 from rest_framework import serializers
 
 from . import models as user_models
+from .loaders import StudentScoreLoader
+from .metrics import TimedSerializerMixin
+from .quiz_sessions import remaining_seconds
 
 
 def get_serializer(app_label, serializer_name):
@@ -21,15 +24,67 @@ def get_serializer(app_label, serializer_name):
             f"Could not import serializers module from {app_label}")
 
 
+# Every serializer here reports its rendering time to the request metrics
+class ModelSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    pass
 
-class UserSerializer(serializers.ModelSerializer):
+
+class Serializer(TimedSerializerMixin, serializers.Serializer):
+    pass
+
+
+class SparseFieldsetMixin:
+    """
+    Lets clients shape a top-level serializer through the query string:
+
+    ?fields=a,b  only render the listed fields
+    ?expand=x,y  add the optional relations declared in Meta.expandable_fields
+
+    Meta.expandable_fields maps a field name to (serializer_name, kwargs);
+    the serializer is resolved lazily with get_serializer().
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        params = self._sparse_params()
+
+        expand = self._split_param(params.get('expand'))
+        expandable = getattr(self.Meta, 'expandable_fields', {})
+        for name, (serializer_name, kwargs) in expandable.items():
+            if name in expand:
+                fields[name] = get_serializer('users', serializer_name)(**kwargs)
+
+        only = self._split_param(params.get('fields'))
+        if only:
+            fields = {name: field for name, field in fields.items() if name in only or name in expand}
+        return fields
+
+    def _sparse_params(self):
+        # Only the serializer the view renders reads the query string,
+        # nested serializers keep their declared shape.
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        request = self.context.get('request')
+        if parent is not None or request is None or request.method not in ('GET', 'HEAD'):
+            return {}
+        return getattr(request, 'query_params', {})
+
+    @staticmethod
+    def _split_param(value):
+        if not value:
+            return set()
+        return {name.strip() for name in value.split(',') if name.strip()}
+
+
+class UserSerializer(SparseFieldsetMixin, ModelSerializer):
     institution = serializers.StringRelatedField(many=False)
     class Meta:
         model = user_models.User
         fields = ['id', 'email', 'username', 'user_role','institution']
         read_only_fields = ['id', 'user_role']
         
-class AdminSerializer(serializers.ModelSerializer):
+class AdminSerializer(SparseFieldsetMixin, ModelSerializer):
     user = UserSerializer()
     institution = serializers.StringRelatedField(many=False)
     
@@ -67,7 +122,7 @@ class AdminSerializer(serializers.ModelSerializer):
 #         admin = user_models.Admin.objects.create(user=user, institution=institution)
 #         return admin
 
-class AssessmentSerializer(serializers.ModelSerializer):
+class AssessmentSerializer(SparseFieldsetMixin, ModelSerializer):
     due_date = serializers.DateTimeField(format="%Y-%m-%d %H:%M:%S")
     time_remaining = serializers.SerializerMethodField()
     is_overdue = serializers.SerializerMethodField()
@@ -93,7 +148,7 @@ class AssessmentSerializer(serializers.ModelSerializer):
             self.Meta.depth = 3
 
 
-class QuizSerializer(serializers.ModelSerializer):
+class QuizSerializer(SparseFieldsetMixin, ModelSerializer):
     ai_feedback = serializers.CharField(read_only=True)
     instructor_feedback = serializers.CharField(read_only=True)
 
@@ -110,15 +165,16 @@ class QuizSerializer(serializers.ModelSerializer):
             self.Meta.depth = 3
 
 
-class PlayGroundSerializer(serializers.ModelSerializer):
+class PlayGroundSerializer(SparseFieldsetMixin, ModelSerializer):
 
     class Meta:
         model = user_models.PlayGround
         fields = '__all__'
 
 
-class CourseSerializer(serializers.ModelSerializer):
-    students = serializers.StringRelatedField(many=True)
+class CourseSerializer(SparseFieldsetMixin, ModelSerializer):
+    # Read the enrollments through the relation so prefetched rows are reused
+    students = serializers.StringRelatedField(many=True, source='courseenrollment_set')
     assessments = AssessmentSerializer(many=True)
     quizzes = QuizSerializer(many=True)
     institution = serializers.StringRelatedField()
@@ -136,7 +192,15 @@ class CourseSerializer(serializers.ModelSerializer):
         else:
             self.Meta.depth = 3
 
-class StudentSerializer(serializers.ModelSerializer):
+class StudentListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    # Primes the score loader with the whole page before any row is rendered
+    def to_representation(self, data):
+        students = list(data.all() if hasattr(data, 'all') else data)
+        self.context.setdefault('score_loader', StudentScoreLoader()).prime(students)
+        return super().to_representation(students)
+
+
+class StudentSerializer(SparseFieldsetMixin, ModelSerializer):
     user = UserSerializer(many=False)
     courses = CourseSerializer(many=True, read_only=True)
     assessments = AssessmentSerializer(many=True, read_only=True)
@@ -147,10 +211,11 @@ class StudentSerializer(serializers.ModelSerializer):
     class Meta:
         model = user_models.Student
         fields = '__all__'
+        list_serializer_class = StudentListSerializer
 
     def get_scores(self, obj):
-        submissions = user_models.Submission.objects.filter(student=obj)
-        return SubmissionSerializer(submissions, many=True).data
+        loader = self.context.get('score_loader') or StudentScoreLoader()
+        return SubmissionScoreSerializer(loader.load(obj), many=True).data
 
     def __init__(self, *args, **kwargs):
         super(StudentSerializer, self).__init__(*args, **kwargs)
@@ -165,7 +230,7 @@ class StudentSerializer(serializers.ModelSerializer):
 
 
 
-class CourseEnrollmentSerializer(serializers.ModelSerializer):
+class CourseEnrollmentSerializer(SparseFieldsetMixin, ModelSerializer):
     assessments = AssessmentSerializer(many=True)
     quizzes = QuizSerializer(many=True)
     student = serializers.StringRelatedField()
@@ -183,18 +248,132 @@ class CourseEnrollmentSerializer(serializers.ModelSerializer):
         else:
             self.Meta.depth = 3
             
-class CourseMaterialSerializer(serializers.ModelSerializer):
+# Summary serializers for list endpoints: flat rows without solutions, code
+# or depth-generated relations. Relations can be pulled in with ?expand=.
+
+class CourseSummarySerializer(SparseFieldsetMixin, ModelSerializer):
+    institution = serializers.StringRelatedField()
+    teacher = serializers.StringRelatedField()
+
+    class Meta:
+        model = user_models.Course
+        fields = ['course_id', 'title', 'image', 'institution', 'teacher', 'created_at']
+        expandable_fields = {
+            'assessments': ('AssessmentSummarySerializer', {'many': True, 'read_only': True}),
+            'quizzes': ('QuizSummarySerializer', {'many': True, 'read_only': True}),
+        }
+
+
+class AssessmentSummarySerializer(SparseFieldsetMixin, ModelSerializer):
+    due_date = serializers.DateTimeField(format="%Y-%m-%d %H:%M:%S")
+    time_remaining = serializers.SerializerMethodField()
+    is_overdue = serializers.SerializerMethodField()
+
+    class Meta:
+        model = user_models.Assessment
+        fields = ['assessment_id', 'title', 'max_score', 'due_date', 'time_remaining', 'is_overdue']
+        expandable_fields = {
+            'course': ('CourseSummarySerializer', {'read_only': True}),
+        }
+
+    def get_time_remaining(self, obj):
+        return obj.time_remaining()
+
+    def get_is_overdue(self, obj):
+        return obj.is_overdue()
+
+
+class QuizSummarySerializer(SparseFieldsetMixin, ModelSerializer):
+
+    class Meta:
+        model = user_models.Quiz
+        fields = ['quiz_id', 'title', 'time_limit', 'max_score', 'show_scores']
+        expandable_fields = {
+            'course': ('CourseSummarySerializer', {'read_only': True}),
+        }
+
+
+class CourseEnrollmentSummarySerializer(SparseFieldsetMixin, ModelSerializer):
+    course = CourseSummarySerializer(read_only=True)
+    teacher = serializers.StringRelatedField()
+
+    class Meta:
+        model = user_models.CourseEnrollment
+        fields = ['enrollment_id', 'enrollment_date', 'is_enrolled', 'course', 'teacher']
+        expandable_fields = {
+            'assessments': ('AssessmentSummarySerializer', {'many': True, 'read_only': True}),
+            'quizzes': ('QuizSummarySerializer', {'many': True, 'read_only': True}),
+        }
+
+
+class CourseMaterialSerializer(SparseFieldsetMixin, ModelSerializer):
     class Meta:
         model = user_models.CourseMaterial
         fields = '__all__'
 
 
-class SubmissionSerializer(serializers.ModelSerializer):
+class SubmissionSerializer(SparseFieldsetMixin, ModelSerializer):
     class Meta:
         model = user_models.Submission
         fields = '__all__'
 
-class TeacherSerializer(serializers.ModelSerializer):
+
+class CodeTestCaseSerializer(ModelSerializer):
+    class Meta:
+        model = user_models.CodeTestCase
+        fields = ['id', 'name', 'stdin', 'expected_output', 'points', 'is_hidden', 'order']
+
+
+class UserImportJobSerializer(ModelSerializer):
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = user_models.UserImportJob
+        fields = ['job_id', 'status', 'total_rows', 'processed_rows', 'created_count', 'progress', 'errors', 'created_at', 'finished_at']
+
+    def get_progress(self, obj):
+        # Percentage of rows processed so far; total_rows also counts blank lines
+        if obj.status == 'completed':
+            return 100
+        if not obj.total_rows:
+            return 0
+        return round(min(obj.processed_rows, obj.total_rows) * 100 / obj.total_rows)
+
+
+class GradebookEntrySerializer(ModelSerializer):
+    student_name = serializers.CharField(source='student.user.username', read_only=True)
+    work_type = serializers.SerializerMethodField()
+    work_id = serializers.SerializerMethodField()
+    title = serializers.SerializerMethodField()
+
+    class Meta:
+        model = user_models.GradebookEntry
+        fields = [
+            'student', 'student_name', 'work_type', 'work_id', 'title', 'attempts', 'graded_attempts',
+            'best_score', 'latest_score', 'status', 'latest_submission', 'last_submitted_at',
+        ]
+
+    def get_work_type(self, obj):
+        return 'ASSESSMENT' if obj.assessment_id else 'QUIZ'
+
+    def get_work_id(self, obj):
+        return obj.assessment.assessment_id if obj.assessment_id else obj.quiz.quiz_id
+
+    def get_title(self, obj):
+        return obj.assessment.title if obj.assessment_id else obj.quiz.title
+
+
+class SubmissionScoreSerializer(Serializer):
+    # Compact score summary built from StudentScoreLoader rows (no code bodies)
+    submission_id = serializers.IntegerField()
+    submission_type = serializers.CharField()
+    assessment_id = serializers.CharField(allow_null=True)
+    quiz_id = serializers.CharField(allow_null=True)
+    score = serializers.FloatField(allow_null=True)
+    grading_status = serializers.CharField()
+    submitted_at = serializers.DateTimeField()
+
+class TeacherSerializer(SparseFieldsetMixin, ModelSerializer):
     user = UserSerializer()
     courses = CourseSerializer(many=True)
     enrolled_students = CourseEnrollmentSerializer(many=True)
@@ -204,14 +383,14 @@ class TeacherSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class InstitutionSerializer(serializers.ModelSerializer):
+class InstitutionSerializer(SparseFieldsetMixin, ModelSerializer):
     institution = serializers.StringRelatedField(many=False)
 
     class Meta:
         model = user_models.Institution
         fields = '__all__'
 
-class ManagerSerializer(serializers.ModelSerializer):
+class ManagerSerializer(SparseFieldsetMixin, ModelSerializer):
     user = UserSerializer()
     institution = InstitutionSerializer()
 
@@ -236,7 +415,7 @@ class ManagerSerializer(serializers.ModelSerializer):
         return instance
 
 
-class InstitutionManagerSerializer(serializers.Serializer):
+class InstitutionManagerSerializer(Serializer):
     # Institution fields
     name = serializers.CharField(max_length=255)
     logo = serializers.ImageField(required=False, allow_null=True)
@@ -279,12 +458,39 @@ class InstitutionManagerSerializer(serializers.Serializer):
 
         return institution
 
-class FeedbackSerializer(serializers.ModelSerializer):
+class FeedbackSerializer(ModelSerializer):
     class Meta:
         model = user_models.Feedback
         fields = '__all__'
 
-class IssueReportSerializer(serializers.ModelSerializer):
+class IssueReportSerializer(ModelSerializer):
     class Meta:
         model = user_models.IssueReport
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+class NotificationSerializer(ModelSerializer):
+    # Read if marked on its own or covered by the user's mark-all-read watermark
+    is_read = serializers.SerializerMethodField()
+
+    class Meta:
+        model = user_models.Notification
+        fields = ['id', 'message', 'is_read', 'created_at']
+
+    def get_is_read(self, obj):
+        return obj.is_read or obj.id <= self.context.get('read_up_to', 0)
+
+
+class QuizSessionSerializer(ModelSerializer):
+    quiz_id = serializers.CharField(source='quiz.quiz_id', read_only=True)
+    time_limit = serializers.IntegerField(source='quiz.time_limit', read_only=True)
+    remaining_seconds = serializers.SerializerMethodField()
+
+    class Meta:
+        model = user_models.QuizSession
+        fields = [
+            'quiz_id', 'time_limit', 'status', 'started_at', 'expires_at', 'remaining_seconds',
+            'draft_code', 'draft_saved_at', 'submission', 'closed_at',
+        ]
+
+    def get_remaining_seconds(self, obj):
+        return remaining_seconds(obj)
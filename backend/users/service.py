@@ -1,26 +1,54 @@
 # backend/users/services.py
 
+import openai
 from openai import OpenAI
 import os
+import json
+import hashlib
 from django.conf import settings
+from django.core.cache import cache
 
+from .rate_limit import get_rate_limiter, estimate_tokens
 
-def perform_ai_grading(submitted_code, instructor_solution, grading_parameters=None):
-    """
-    Grades the submitted code using OpenAI's GPT-4.
 
-    Parameters:
-        submitted_code (str): The code submitted by the student.
-        instructor_solution (str): The expected solution provided by the instructor.
-        grading_parameters (dict, optional): Additional parameters for grading.
+GRADING_CACHE_PREFIX = 'ai-grade'
+GRADING_CACHE_HITS = f'{GRADING_CACHE_PREFIX}:hits'
+GRADING_CACHE_MISSES = f'{GRADING_CACHE_PREFIX}:misses'
 
-    Returns:
-        tuple: (score (float), feedback (str))
+
+GRADING_MODEL = "gpt-3.5-turbo"  # Use "gpt-4" if available
+
+# Provider errors worth retrying later; anything else fails the grading
+TRANSIENT_PROVIDER_ERRORS = (openai.APIConnectionError, openai.InternalServerError)
+
+
+class TransientGradingError(Exception):
     """
-    client = OpenAI(api_key=settings.OPENAI_API_KEY)
-    if not client:
-        raise ValueError("OpenAI API key not set. Please set the OPENAI_API_KEY environment variable.")
+    The grading provider is rate limiting or temporarily unavailable. The
+    caller should retry after backing off, see rate_limit.backoff_delay.
+    """
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
 
+def provider_retry_after(error):
+    """Returns the provider's Retry-After hint in seconds, if it sent one."""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+def build_grading_request(submitted_code, instructor_solution, grading_parameters=None):
+    """
+    Builds the chat completion arguments for grading a submission. Shared by
+    the synchronous grader and the batched grading worker.
+    """
     prompt = f"""
     You are an academic grading assistant.
 
@@ -46,24 +74,61 @@ def perform_ai_grading(submitted_code, instructor_solution, grading_parameters=N
     Feedback: <detailed feedback>
     """
 
+    return {
+        "model": GRADING_MODEL,
+        "messages": [
+            {"role": "system", "content": "You are an academic grading assistant."},
+            {"role": "user", "content": prompt}
+        ],
+        "max_tokens": 500,
+        "temperature": 0.3,  # Lower temperature for more deterministic output
+        "top_p": 1,
+        "n": 1,
+        "stop": None,
+    }
+
+
+def perform_ai_grading(submitted_code, instructor_solution, grading_parameters=None):
+    """
+    Grades the submitted code using OpenAI's GPT-4.
+
+    Parameters:
+        submitted_code (str): The code submitted by the student.
+        instructor_solution (str): The expected solution provided by the instructor.
+        grading_parameters (dict, optional): Additional parameters for grading.
+
+    Returns:
+        tuple: (score (float), feedback (str))
+
+    Raises:
+        TransientGradingError: The shared rate limit or the provider refused
+            the request, or the provider was unavailable; nothing was graded
+            and the call can be retried after e.retry_after seconds.
+    """
+    client = OpenAI(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL, max_retries=0)
+    if not client:
+        raise ValueError("OpenAI API key not set. Please set the OPENAI_API_KEY environment variable.")
+
+    request = build_grading_request(submitted_code, instructor_solution, grading_parameters)
+    limiter = get_rate_limiter()
+    # Never sleep here: this runs in request threads. The caller retries instead.
+    wait = limiter.try_acquire(estimate_tokens(request))
+    if wait:
+        raise TransientGradingError("The grading rate limit is reached.", retry_after=wait)
+
     try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",  # Use "gpt-4" if available
-            messages=[
-                {"role": "system", "content": "You are an academic grading assistant."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=500,
-            temperature=0.3,  # Lower temperature for more deterministic output
-            top_p=1,
-            n=1,
-            stop=None
-        )
+        response = client.chat.completions.create(**request)
+    except openai.RateLimitError as e:
+        limiter.on_rate_limited()
+        raise TransientGradingError(str(e), provider_retry_after(e))
+    except TRANSIENT_PROVIDER_ERRORS as e:
+        raise TransientGradingError(str(e), provider_retry_after(e))
     except Exception as e:
         print(f"OpenAI API Error: {e}")
         return None, "AI grading failed due to an internal error."
 
-    ai_output = response.choices[0].text.strip()
+    limiter.on_success()
+    ai_output = response.choices[0].message.content.strip()
 
     # Parse the AI response
     score, feedback = parse_ai_response(ai_output)
@@ -103,3 +168,92 @@ def parse_ai_response(ai_output):
         feedback = "Unable to parse AI feedback."
 
     return score, feedback
+
+
+def normalize_code(code):
+    """
+    Normalizes source text so that formatting-only differences (line endings,
+    trailing whitespace, surrounding blank lines) hash to the same value.
+    """
+    if not code:
+        return ''
+    lines = code.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    return '\n'.join(line.rstrip() for line in lines).strip('\n')
+
+
+def grading_cache_key(submitted_code, instructor_solution, grading_parameters=None):
+    """
+    Builds the cache key for a grading request from a hash of the normalized
+    (submitted_code, instructor_solution, grading_parameters) triple.
+
+    Editing an assessment's solution or parameters changes the key, so stale
+    results are never served for the new version and simply expire.
+    """
+    payload = json.dumps(
+        [normalize_code(submitted_code), normalize_code(instructor_solution), grading_parameters],
+        sort_keys=True,
+        default=str,
+    )
+    digest = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    return f'{GRADING_CACHE_PREFIX}:{digest}'
+
+
+def _count(key):
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # The counter was evicted between add() and incr()
+        cache.set(key, 1, timeout=None)
+
+
+def get_cached_grade(submitted_code, instructor_solution, grading_parameters=None):
+    """
+    Returns the cached (score, feedback) for the triple, or None on a miss.
+    Hits and misses are counted, see grading_cache_stats().
+    """
+    result = cache.get(grading_cache_key(submitted_code, instructor_solution, grading_parameters))
+    _count(GRADING_CACHE_HITS if result is not None else GRADING_CACHE_MISSES)
+    return tuple(result) if result is not None else None
+
+
+def cache_grade(submitted_code, instructor_solution, grading_parameters, score, feedback):
+    # Failed gradings are not cached so they are retried next time
+    if score is None:
+        return
+    cache.set(
+        grading_cache_key(submitted_code, instructor_solution, grading_parameters),
+        (score, feedback),
+        timeout=settings.AI_GRADING_CACHE_TTL,
+    )
+
+
+def cached_ai_grading(submitted_code, instructor_solution, grading_parameters=None):
+    """
+    Same contract as perform_ai_grading, but returns a previously computed
+    result for an identical submission/solution/parameters triple without
+    calling the grading provider.
+
+    Returns:
+        tuple: (score (float), feedback (str))
+    """
+    cached = get_cached_grade(submitted_code, instructor_solution, grading_parameters)
+    if cached is not None:
+        return cached
+
+    score, feedback = perform_ai_grading(
+        submitted_code=submitted_code,
+        instructor_solution=instructor_solution,
+        grading_parameters=grading_parameters
+    )
+    cache_grade(submitted_code, instructor_solution, grading_parameters, score, feedback)
+    return score, feedback
+
+
+def grading_cache_stats():
+    """Returns the grading cache hit/miss counters."""
+    counters = cache.get_many([GRADING_CACHE_HITS, GRADING_CACHE_MISSES])
+    return {
+        'hits': counters.get(GRADING_CACHE_HITS, 0),
+        'misses': counters.get(GRADING_CACHE_MISSES, 0),
+    }
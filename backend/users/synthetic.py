@@ -0,0 +1,165 @@
+# backend/users/synthetic.py
+"""
+Synthetic institution data for load testing and benchmarks.
+
+generate_institution builds one institution with its admin, teachers,
+students, courses, enrollments, assessments, quizzes and submissions using
+bulk_create in batches, so tens of thousands of rows take seconds. All
+accounts share the password SYNTHETIC_PASSWORD, hashed once. Output is
+reproducible for a given seed.
+"""
+
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from .gradebook import rebuild_gradebook
+from .models import (
+    Institution, User, Admin, Teacher, Student, Course, CourseEnrollment, Assessment, Quiz, Submission, CodeBlob,
+)
+
+
+SYNTHETIC_PASSWORD = 'synthetic-pass'
+BATCH_SIZE = 2000
+
+SOLUTIONS = [
+    'def add(a, b):\n    return a + b\n',
+    'def is_even(n):\n    return n % 2 == 0\n',
+    'def reverse(s):\n    return s[::-1]\n',
+    'def total(values):\n    return sum(values)\n',
+    'n = int(input())\nprint(n * n)\n',
+]
+TOPICS = ['Loops', 'Recursion', 'Strings', 'Lists', 'Dictionaries', 'Sorting', 'Classes', 'Files', 'Functions', 'Errors']
+
+
+def _bulk_create(model, objects):
+    return model.objects.bulk_create(objects, batch_size=BATCH_SIZE)
+
+
+def _attempt(rng, solution):
+    """A plausible student attempt: mostly the solution, sometimes broken."""
+    roll = rng.random()
+    if roll < 0.6:
+        return solution
+    if roll < 0.85:
+        return solution.replace('return', '# TODO\n    return', 1)
+    return solution[: rng.randint(1, len(solution))]
+
+
+def generate_institution(name, students=2000, teachers=50, courses=100, assessments_per_course=5,
+                         quizzes_per_course=3, submissions=20000, enrollments_per_student=4, seed=0):
+    """
+    Creates a synthetic institution and returns it. Every student enrolls in
+    `enrollments_per_student` courses and submissions go to assessments and
+    quizzes of courses the student is enrolled in.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    password = make_password(SYNTHETIC_PASSWORD)
+    slug = name.lower().replace(' ', '-')
+
+    def users(role, count):
+        return [
+            User(
+                username=f'{slug}-{role}{index}',
+                email=f'{role}{index}@{slug}.example.com',
+                password=password,
+                user_role=role,
+                institution=institution,
+            )
+            for index in range(count)
+        ]
+
+    with transaction.atomic():
+        institution = Institution.objects.create(name=name)
+
+        _bulk_create(User, users('admin', 1) + users('teacher', teachers) + users('student', students))
+        # Re-read rather than rely on bulk_create setting pks, which MySQL does not
+        accounts = list(User.objects.filter(institution=institution).order_by('id').values_list('id', 'user_role'))
+        _bulk_create(Admin, [Admin(user_id=pk, institution=institution) for pk, role in accounts if role == 'admin'])
+        _bulk_create(Teacher, [Teacher(user_id=pk, institution=institution) for pk, role in accounts if role == 'teacher'])
+        _bulk_create(Student, [Student(user_id=pk, institution=institution) for pk, role in accounts if role == 'student'])
+        teacher_ids = list(Teacher.objects.filter(institution=institution).order_by('id').values_list('id', flat=True))
+        student_ids = list(Student.objects.filter(institution=institution).order_by('id').values_list('id', flat=True))
+
+        _bulk_create(Course, [
+            Course(
+                institution=institution,
+                teacher_id=teacher_ids[index % len(teacher_ids)],
+                title=f'{TOPICS[index % len(TOPICS)]} {index}',
+                description=f'Synthetic course {index}',
+                enrollment_code=f'{index:06d}',
+            )
+            for index in range(courses)
+        ])
+        course_rows = list(Course.objects.filter(institution=institution).order_by('id').values_list('id', 'teacher_id'))
+        course_teacher = dict(course_rows)
+        course_ids = [pk for pk, _ in course_rows]
+
+        enrolled = {}
+        enrollments = []
+        for student_id in student_ids:
+            picked = rng.sample(course_ids, min(enrollments_per_student, len(course_ids)))
+            enrolled[student_id] = picked
+            enrollments.extend(
+                CourseEnrollment(course_id=course_id, student_id=student_id, teacher_id=course_teacher[course_id], is_enrolled=True)
+                for course_id in picked
+            )
+        _bulk_create(CourseEnrollment, enrollments)
+
+        _bulk_create(Assessment, [
+            Assessment(
+                course_id=course_id,
+                teacher_id=course_teacher[course_id],
+                title=f'Assessment {number}',
+                question_area='Implement the function described above.',
+                instructor_solution=SOLUTIONS[(course_id + number) % len(SOLUTIONS)],
+                use_ai_grading=True,
+                due_date=now + timedelta(days=rng.randint(-30, 30)),
+            )
+            for course_id in course_ids for number in range(assessments_per_course)
+        ])
+        _bulk_create(Quiz, [
+            Quiz(
+                course_id=course_id,
+                teacher_id=course_teacher[course_id],
+                title=f'Quiz {number}',
+                question_area='Answer in code.',
+                instructor_solution=SOLUTIONS[(course_id + number) % len(SOLUTIONS)],
+                time_limit=rng.choice([None, 15, 30]),
+            )
+            for course_id in course_ids for number in range(quizzes_per_course)
+        ])
+        course_assessments = {}
+        for pk, course_id, solution in Assessment.objects.filter(course__institution=institution).values_list('id', 'course_id', 'instructor_solution'):
+            course_assessments.setdefault(course_id, []).append(('ASSESSMENT', pk, solution))
+        for pk, course_id, solution in Quiz.objects.filter(course__institution=institution).values_list('id', 'course_id', 'instructor_solution'):
+            course_assessments.setdefault(course_id, []).append(('QUIZ', pk, solution))
+
+        rows = []
+        for _ in range(submissions):
+            student_id = rng.choice(student_ids)
+            course_id = rng.choice(enrolled[student_id])
+            if course_id not in course_assessments:
+                continue
+            kind, work_id, solution = rng.choice(course_assessments[course_id])
+            graded = rng.random() < 0.8
+            rows.append(Submission(
+                student_id=student_id,
+                teacher_id=course_teacher[course_id],
+                assessment_id=work_id if kind == 'ASSESSMENT' else None,
+                quiz_id=work_id if kind == 'QUIZ' else None,
+                submission_type=kind,
+                submitted_code=_attempt(rng, solution),
+                grading_status='GRADED' if graded else 'PENDING',
+                score=round(rng.uniform(30, 100), 1) if graded else None,
+                is_viewed=graded and rng.random() < 0.5,
+            ))
+        CodeBlob.objects.attach(rows)
+        _bulk_create(Submission, rows)
+        for course in Course.objects.filter(institution=institution):
+            rebuild_gradebook(course)
+    return institution
@@ -1,18 +1,38 @@
 # backend/users/tasks.py
 
 from celery import shared_task
-from .models import Submission
-from .service import perform_ai_grading
+from django.conf import settings
+from .models import Submission, UserImportJob, Course, QuizSession, CodeDraft
+from .service import cached_ai_grading, TransientGradingError
+from .rate_limit import backoff_delay
+from .sandbox import test_cases_for, cached_run_test_cases, score_test_results
+from .gradebook import save_submission, refresh_gradebook
+from .notifications import notify_course, notify_graded
 
 
-@shared_task
-def grade_submission_task(submission_id):
+@shared_task(bind=True)
+def grade_submission_task(self, submission_id):
     try:
-        submission = Submission.objects.get(id=submission_id)
+        submission = Submission.objects.select_related('code_blob').get(id=submission_id)
     except Submission.DoesNotExist:
         return "Submission does not exist."
 
     try:
+        # Test cases, where the instructor wrote any, grade without the AI
+        test_cases = test_cases_for(submission)
+        if test_cases:
+            work = submission.assessment if submission.submission_type == 'ASSESSMENT' else submission.quiz
+            results = cached_run_test_cases(submission.submitted_code, test_cases)
+            submission.test_results = results
+            # The sandbox failed rather than the student; retry instead of scoring it 0
+            if any(result['status'] == 'internal_error' for result in results):
+                raise TransientGradingError("The sandbox could not run the test cases.")
+            submission.score = score_test_results(results, work.max_score)
+            submission.grading_status = 'GRADED'
+            save_submission(submission)
+            notify_graded([submission])
+            return "Graded against test cases."
+
         if submission.submission_type == 'ASSESSMENT' and submission.assessment:
             instructor_solution = submission.assessment.instructor_solution
             grading_parameters = submission.assessment.ai_grading_parameters
@@ -20,11 +40,11 @@ def grade_submission_task(submission_id):
             instructor_solution = submission.quiz.instructor_solution
             grading_parameters = submission.quiz.ai_grading_parameters
         else:
-            submission.grading_status = 'PENDING'
-            submission.save()
+            submission.grading_status = 'FAILED'
+            save_submission(submission)
             return "Invalid submission type."
 
-        ai_score, ai_feedback = perform_ai_grading(
+        ai_score, ai_feedback = cached_ai_grading(
             submitted_code=submission.submitted_code,
             instructor_solution=instructor_solution,
             grading_parameters=grading_parameters
@@ -32,11 +52,144 @@ def grade_submission_task(submission_id):
 
         submission.score = ai_score
         submission.ai_feedback = ai_feedback
+        if ai_score is None:
+            # Left for the teacher rather than "graded" with no score, as the grading worker does
+            submission.grading_status = 'FAILED'
+            save_submission(submission)
+            return "Grading failed."
+
         submission.grading_status = 'GRADED'
-        submission.save()
+        save_submission(submission)
+        notify_graded([submission])
         return "Grading completed successfully."
 
+    except TransientGradingError as e:
+        if self.request.retries >= settings.AI_GRADING_MAX_RETRIES:
+            submission.grading_status = 'FAILED'
+            # Tells the teacher why it has no score
+            submission.ai_feedback = f"Could not be graded automatically: {str(e)}"
+            save_submission(submission)
+            return f"Grading failed after {self.request.retries} retries: {str(e)}"
+        raise self.retry(
+            exc=e,
+            countdown=backoff_delay(self.request.retries, e.retry_after),
+            max_retries=settings.AI_GRADING_MAX_RETRIES,
+        )
+
     except Exception as e:
-        submission.grading_status = 'PENDING'
-        submission.save()
+        submission.grading_status = 'FAILED'
+        save_submission(submission)
         return f"Grading failed: {str(e)}"
+
+
+@shared_task
+def grade_pending_submissions_task():
+    # Imported here so the async client is only built in worker processes
+    from .grading_worker import get_worker
+
+    graded = get_worker().drain()
+    return f"Graded {graded} submission(s)."
+
+
+@shared_task
+def import_users_task(job_id):
+    from .importer import UserImporter
+
+    try:
+        job = UserImportJob.objects.select_related('institution').get(id=job_id)
+    except UserImportJob.DoesNotExist:
+        return "Import job does not exist."
+    job = UserImporter(job).run()
+    return f"Imported {job.created_count} of {job.total_rows} user(s)."
+
+
+@shared_task
+def notify_course_task(course_id, message):
+    course = Course.objects.filter(id=course_id).first()
+    if course is None:
+        return "Course does not exist."
+    sent = notify_course(course, message)
+    return f"Notified {sent} student(s)."
+
+
+@shared_task(bind=True)
+def expire_quiz_sessions_task(self):
+    from .quiz_sessions import expire_due_sessions, get_deadline_store, schedule_tick
+
+    try:
+        closed = expire_due_sessions()
+    finally:
+        # Keep ticking while any timed session is running, even after a failed tick
+        running = get_deadline_store().count() or QuizSession.objects.filter(
+            status='ACTIVE', expires_at__isnull=False).exists()
+        if not self.request.is_eager and running:
+            schedule_tick()
+    return f"Closed {closed} quiz session(s)."
+
+
+@shared_task
+def flush_draft_task(draft_id):
+    from .drafts import flush_draft
+
+    draft = CodeDraft.objects.filter(id=draft_id).first()
+    if draft is None:
+        return "Draft does not exist."
+    flush_draft(draft)
+    return f"Flushed draft {draft_id} at version {draft.version}."
+
+
+@shared_task(bind=True)
+def dispatch_outbox_task(self, provider='default'):
+    from .outbox import dispatch, schedule_outbox_dispatch
+
+    sent, retry_in = dispatch(provider)
+    # Run eagerly there is no broker to defer the next batch to
+    if retry_in is not None and not self.request.is_eager:
+        schedule_outbox_dispatch(provider, countdown=retry_in)
+    return f"Sent {sent} email(s)."
+
+
+@shared_task
+def dispatch_grading_task():
+    # Imported here to keep the scheduler's Redis client out of import time
+    from .scheduling import get_scheduler
+
+    scheduler = get_scheduler()
+    # This run is the one the kick asked for; later submissions need a new one
+    scheduler.store.release_kick()
+    try:
+        sent = scheduler.dispatch()
+    finally:
+        # Also when another dispatcher held the lock, which may have finished its pass before
+        # work arrived, or when sending failed and the submission went back on its queue
+        if scheduler.has_backlog():
+            schedule_dispatch(countdown=settings.GRADING_DISPATCH_INTERVAL)
+    return sent
+
+
+def schedule_dispatch(countdown=0):
+    """
+    Queues a dispatcher run unless one is already on its way. The kick is
+    held until that run starts, so submissions arriving later are picked up
+    by it or by the run it schedules.
+    """
+    from .scheduling import get_scheduler
+
+    if get_scheduler().store.claim_kick(ttl=max(1, countdown)):
+        dispatch_grading_task.apply_async(countdown=countdown)
+
+
+def enqueue_grading(submission):
+    """
+    Schedules grading for a new submission. In batch mode the submission is
+    left PENDING for the grading worker instead of getting its own task,
+    unless it is graded by test cases; otherwise it joins its institution's
+    fair queue for its priority tier.
+    """
+    refresh_gradebook([submission])
+    if settings.AI_GRADING_BATCH_MODE and not test_cases_for(submission):
+        return
+    from .scheduling import get_scheduler
+
+    get_scheduler().submit(submission)
+    schedule_dispatch()
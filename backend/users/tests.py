@@ -1,13 +1,29 @@
 # backend/users/tests.py
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.cache import cache
 from unittest.mock import patch
 from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
 from . import models as user_models
 from django.contrib.auth import get_user_model
+from django.db import IntegrityError, connection
+from django.db.models import F
+from django.utils import timezone
+from datetime import timedelta
+from django.test.utils import CaptureQueriesContext
 import uuid
+import io
+import os
+import tempfile
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 User = get_user_model()
 
@@ -171,3 +187,2334 @@ class AIGradingAPITestCase(TestCase):
         self.assertEqual(submission.ai_feedback,
                          "AI grading failed due to an internal error.")
         self.assertEqual(submission.grading_status, 'PENDING')
+
+
+class CourseQueryPlanTestCase(TestCase):
+    def setUp(self):
+        self.institution = user_models.Institution.objects.create(name='Query Plan Institution')
+        teacher_user = User.objects.create_user(
+            username='planteacher',
+            email=f"planteacher_{uuid.uuid4()}@example.com",
+            password='pass123',
+            user_role='teacher',
+            institution=self.institution
+        )
+        self.teacher = user_models.Teacher.objects.create(user=teacher_user, institution=self.institution)
+        self.client = APIClient()
+
+    def add_course(self, students=2):
+        course = user_models.Course.objects.create(
+            title=f'Course {uuid.uuid4()}',
+            institution=self.institution,
+            teacher=self.teacher
+        )
+        user_models.Assessment.objects.create(course=course, teacher=self.teacher, title='Assessment')
+        user_models.Quiz.objects.create(course=course, teacher=self.teacher, title='Quiz')
+        for _ in range(students):
+            student_user = User.objects.create_user(
+                username=f'student_{uuid.uuid4().hex[:8]}',
+                email=f"student_{uuid.uuid4()}@example.com",
+                password='pass123',
+                user_role='student',
+                institution=self.institution
+            )
+            student = user_models.Student.objects.create(user=student_user, institution=self.institution)
+            user_models.CourseEnrollment.objects.create(
+                course=course, student=student, teacher=self.teacher, is_enrolled=True)
+        return course
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(context.captured_queries)
+
+    def test_teacher_course_list_query_count_is_flat(self):
+        url = f'/api/teacher/{self.teacher.id}/course/'
+        self.add_course()
+        baseline = self.count_queries(url)
+
+        for _ in range(3):
+            self.add_course(students=4)
+
+        self.assertEqual(self.count_queries(url), baseline)
+
+    def test_student_course_list_query_count_is_flat(self):
+        course = self.add_course(students=1)
+        student = course.students().first().student
+        url = f'/api/students/{student.id}/course-list/'
+        baseline = self.count_queries(url)
+
+        for _ in range(3):
+            other = self.add_course(students=1)
+            user_models.CourseEnrollment.objects.create(
+                course=other, student=student, teacher=self.teacher, is_enrolled=True)
+
+        self.assertEqual(self.count_queries(url), baseline)
+
+
+class StudentScoreLoaderTestCase(TestCase):
+    def setUp(self):
+        self.institution = user_models.Institution.objects.create(name='Score Loader Institution')
+        teacher_user = User.objects.create_user(
+            username='loaderteacher',
+            email=f"loaderteacher_{uuid.uuid4()}@example.com",
+            password='pass123',
+            user_role='teacher',
+            institution=self.institution
+        )
+        teacher = user_models.Teacher.objects.create(user=teacher_user, institution=self.institution)
+        course = user_models.Course.objects.create(title='Loader Course', institution=self.institution, teacher=teacher)
+        self.assessment = user_models.Assessment.objects.create(course=course, teacher=teacher, title='Loader Assessment')
+
+        self.students = []
+        for index in range(3):
+            student_user = User.objects.create_user(
+                username=f'loaderstudent{index}',
+                email=f"loaderstudent{index}_{uuid.uuid4()}@example.com",
+                password='pass123',
+                user_role='student',
+                institution=self.institution
+            )
+            student = user_models.Student.objects.create(user=student_user, institution=self.institution)
+            user_models.Submission.objects.create(
+                student=student,
+                assessment=self.assessment,
+                submission_type='ASSESSMENT',
+                submitted_code='print("hello")',
+                score=80.0 + index,
+                grading_status='GRADED'
+            )
+            self.students.append(student)
+
+    def test_scores_for_a_page_use_one_query(self):
+        from .serializers import StudentSerializer
+
+        with CaptureQueriesContext(connection) as context:
+            data = StudentSerializer(user_models.Student.objects.all(), many=True).data
+
+        submission_queries = [q for q in context.captured_queries if 'FROM "users_submission"' in q['sql']]
+        self.assertEqual(len(submission_queries), 1)
+        self.assertEqual(len(data), 3)
+        for row, student in zip(data, self.students):
+            self.assertEqual(len(row['scores']), 1)
+            score = row['scores'][0]
+            self.assertEqual(score['assessment_id'], self.assessment.assessment_id)
+            self.assertEqual(score['grading_status'], 'GRADED')
+            self.assertNotIn('submitted_code', score)
+
+    def test_single_student_scores(self):
+        from .serializers import StudentSerializer
+
+        data = StudentSerializer(self.students[0]).data
+        self.assertEqual([score['score'] for score in data['scores']], [80.0])
+
+
+class SparseFieldsetTestCase(TestCase):
+    def setUp(self):
+        self.institution = user_models.Institution.objects.create(name='Sparse Institution')
+        teacher_user = User.objects.create_user(
+            username='sparseteacher',
+            email=f"sparseteacher_{uuid.uuid4()}@example.com",
+            password='pass123',
+            user_role='teacher',
+            institution=self.institution
+        )
+        teacher = user_models.Teacher.objects.create(user=teacher_user, institution=self.institution)
+        self.course = user_models.Course.objects.create(title='Sparse Course', institution=self.institution, teacher=teacher)
+        user_models.Assessment.objects.create(
+            course=self.course,
+            teacher=teacher,
+            title='Sparse Assessment',
+            instructor_solution='def add(a, b):\n    return a + b',
+            code_area='def add(a, b):\n    pass'
+        )
+        self.client = APIClient()
+        self.url = f'/api/teacher/assessment-list/{self.course.course_id}/'
+
+    def test_list_uses_summary_fields(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        row = response.data['results'][0]
+        self.assertEqual(row['title'], 'Sparse Assessment')
+        self.assertNotIn('instructor_solution', row)
+        self.assertNotIn('code_area', row)
+        self.assertNotIn('course', row)
+
+    def test_fields_param_trims_response(self):
+        response = self.client.get(self.url, {'fields': 'assessment_id,title'})
+        self.assertEqual(set(response.data['results'][0]), {'assessment_id', 'title'})
+
+    def test_expand_param_adds_relation(self):
+        response = self.client.get(self.url, {'fields': 'title', 'expand': 'course'})
+        row = response.data['results'][0]
+        self.assertEqual(set(row), {'title', 'course'})
+        self.assertEqual(row['course']['course_id'], self.course.course_id)
+
+
+class KeysetPaginationTestCase(TestCase):
+    def setUp(self):
+        self.institution = user_models.Institution.objects.create(name='Pagination Institution')
+        for index in range(5):
+            User.objects.create_user(
+                username=f'pageuser{index}',
+                email=f"pageuser{index}_{uuid.uuid4()}@example.com",
+                password='pass123',
+                user_role='student',
+                institution=self.institution
+            )
+        self.client = APIClient()
+        self.url = f'/api/admin/{self.institution.id}/teacher-student-list/'
+
+    def test_pages_follow_cursor(self):
+        response = self.client.get(self.url, {'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertNotIn('count', response.data)
+
+        seen = [row['id'] for row in response.data['results']]
+        next_url = response.data['next']
+        while next_url:
+            response = self.client.get(next_url)
+            seen.extend(row['id'] for row in response.data['results'])
+            next_url = response.data['next']
+
+        expected = list(User.objects.filter(institution=self.institution).order_by('-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_count_is_opt_in(self):
+        response = self.client.get(self.url, {'count': 'exact'})
+        self.assertEqual(response.data['count'], 5)
+        self.assertTrue(response.data['count_is_exact'])
+
+    def test_estimated_count_is_capped(self):
+        from .pagination import KeysetPagination
+
+        with patch.object(KeysetPagination, 'count_cap', 3):
+            response = self.client.get(self.url, {'count': 'estimate'})
+        self.assertEqual(response.data['count'], 3)
+        self.assertFalse(response.data['count_is_exact'])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'grading-cache-tests'}})
+class GradingCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @patch('users.service.perform_ai_grading')
+    def test_identical_submission_is_served_from_cache(self, mock_perform_ai_grading):
+        from .service import cached_ai_grading, grading_cache_stats
+
+        mock_perform_ai_grading.return_value = (90.0, "Good work.")
+        parameters = {"correctness": "Adds two numbers."}
+
+        first = cached_ai_grading('def add(a, b):\n    return a + b\n', 'def add(a, b): return a + b', parameters)
+        # Formatting-only differences hit the same entry
+        second = cached_ai_grading('def add(a, b):   \r\n    return a + b', 'def add(a, b): return a + b', parameters)
+
+        self.assertEqual(first, (90.0, "Good work."))
+        self.assertEqual(second, first)
+        self.assertEqual(mock_perform_ai_grading.call_count, 1)
+        self.assertEqual(grading_cache_stats(), {'hits': 1, 'misses': 1})
+
+    @patch('users.service.perform_ai_grading')
+    def test_changed_solution_or_parameters_miss(self, mock_perform_ai_grading):
+        from .service import cached_ai_grading
+
+        mock_perform_ai_grading.return_value = (70.0, "Partially correct.")
+        cached_ai_grading('print(1)', 'print(1)', {"a": 1})
+        cached_ai_grading('print(1)', 'print(2)', {"a": 1})
+        cached_ai_grading('print(1)', 'print(2)', {"a": 2})
+
+        self.assertEqual(mock_perform_ai_grading.call_count, 3)
+
+    @patch('users.service.perform_ai_grading')
+    def test_failed_grading_is_not_cached(self, mock_perform_ai_grading):
+        from .service import cached_ai_grading
+
+        mock_perform_ai_grading.return_value = (None, "AI grading failed due to an internal error.")
+        cached_ai_grading('print(1)', 'print(1)')
+        cached_ai_grading('print(1)', 'print(1)')
+
+        self.assertEqual(mock_perform_ai_grading.call_count, 2)
+
+
+class StubGradingHandler(BaseHTTPRequestHandler):
+    # Minimal OpenAI-compatible chat completions endpoint
+    in_flight = 0
+    max_in_flight = 0
+    requests = 0
+    rate_limited = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        cls = type(self)
+        with cls.lock:
+            cls.requests += 1
+            throttle = cls.rate_limited > 0
+            cls.rate_limited -= 1
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if throttle:
+            with cls.lock:
+                cls.in_flight -= 1
+            body = json.dumps({"error": {"message": "Rate limit reached", "type": "requests"}}).encode()
+            self.send_response(429)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        time.sleep(0.05)
+        body = json.dumps({
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "stub",
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": "Score: 88/100\nFeedback: Looks right."},
+            }],
+        }).encode()
+        with cls.lock:
+            cls.in_flight -= 1
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'grading-worker-tests'}})
+class GradingWorkerTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubGradingHandler)
+        cls.server_thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.server_thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        from .rate_limit import RateLimiter, MemoryBucketStore
+
+        cache.clear()
+        StubGradingHandler.requests = 0
+        StubGradingHandler.max_in_flight = 0
+        StubGradingHandler.rate_limited = 0
+        self.limiter = RateLimiter(MemoryBucketStore(), requests_per_minute=6000, tokens_per_minute=10000000)
+        limiter_patch = patch('users.rate_limit._limiter', self.limiter)
+        limiter_patch.start()
+        self.addCleanup(limiter_patch.stop)
+        institution = user_models.Institution.objects.create(name='Worker Institution')
+        teacher_user = User.objects.create_user(
+            username='workerteacher',
+            email=f"workerteacher_{uuid.uuid4()}@example.com",
+            password='pass123',
+            user_role='teacher',
+            institution=institution
+        )
+        teacher = user_models.Teacher.objects.create(user=teacher_user, institution=institution)
+        course = user_models.Course.objects.create(title='Worker Course', institution=institution, teacher=teacher)
+        self.assessment = user_models.Assessment.objects.create(
+            course=course, teacher=teacher, title='Worker Assessment',
+            instructor_solution='def add(a, b):\n    return a + b', use_ai_grading=True)
+        manual = user_models.Assessment.objects.create(course=course, teacher=teacher, title='Manual Assessment')
+
+        for index in range(6):
+            user_models.Submission.objects.create(
+                assessment=self.assessment, submission_type='ASSESSMENT',
+                submitted_code=f'def add(a, b):\n    return a + b  # {index}')
+        self.manual_submission = user_models.Submission.objects.create(
+            assessment=manual, submission_type='ASSESSMENT', submitted_code='print(1)')
+
+    def test_drain_grades_pending_batches_under_concurrency_cap(self):
+        from .grading_worker import GradingWorker
+
+        host, port = self.server.server_address
+        with override_settings(OPENAI_BASE_URL=f'http://{host}:{port}/v1'):
+            worker = GradingWorker(batch_size=4, concurrency=2)
+            try:
+                graded = worker.drain()
+            finally:
+                worker.close()
+
+        self.assertEqual(graded, 6)
+        self.assertEqual(StubGradingHandler.requests, 6)
+        self.assertLessEqual(StubGradingHandler.max_in_flight, 2)
+        submissions = user_models.Submission.objects.filter(assessment=self.assessment)
+        self.assertEqual(set(submissions.values_list('grading_status', flat=True)), {'GRADED'})
+        self.assertEqual(set(submissions.values_list('score', flat=True)), {88.0})
+
+        # Submissions without AI grading are left for the teacher
+        self.manual_submission.refresh_from_db()
+        self.assertEqual(self.manual_submission.grading_status, 'PENDING')
+
+    def test_ungradable_submissions_do_not_block_the_queue(self):
+        from .grading_worker import GradingWorker
+
+        # Older than everything else and never gradable: not linked to a quiz
+        poison = [
+            user_models.Submission.objects.create(
+                assessment=self.assessment, submission_type='QUIZ', submitted_code='print(2)')
+            for _ in range(2)
+        ]
+        user_models.Submission.objects.filter(id__in=[p.id for p in poison]).update(
+            submitted_at=timezone.now() - timedelta(days=1))
+
+        host, port = self.server.server_address
+        with override_settings(OPENAI_BASE_URL=f'http://{host}:{port}/v1'):
+            worker = GradingWorker(batch_size=2, concurrency=2)
+            try:
+                graded = worker.drain()
+            finally:
+                worker.close()
+
+        self.assertEqual(graded, 6)
+        self.assertEqual(
+            set(user_models.Submission.objects.filter(id__in=[p.id for p in poison]).values_list('grading_status', flat=True)),
+            {'FAILED'})
+
+    @override_settings(AI_GRADING_MAX_ATTEMPTS=2, AI_GRADING_RETRY_DELAY=0)
+    def test_failed_gradings_are_retried_then_left_for_the_teacher(self):
+        from .grading_worker import GradingWorker, GRADING_FAILED_FEEDBACK
+
+        worker = GradingWorker(batch_size=10, concurrency=2)
+        calls = []
+
+        async def fail_all(jobs):
+            calls.append(len(jobs))
+            return [(None, GRADING_FAILED_FEEDBACK)] * len(jobs)
+
+        try:
+            with patch.object(worker, '_grade_all', fail_all):
+                self.assertEqual(worker.drain(), 0)
+        finally:
+            worker.close()
+
+        self.assertEqual(calls, [6, 6])
+        submissions = user_models.Submission.objects.filter(assessment=self.assessment)
+        self.assertEqual(set(submissions.values_list('grading_status', flat=True)), {'FAILED'})
+        self.assertEqual(set(submissions.values_list('grading_attempts', flat=True)), {2})
+
+    def test_claimed_submissions_are_leased(self):
+        from .grading_worker import GradingWorker
+
+        worker = GradingWorker(batch_size=4)
+        try:
+            first = worker.claim_batch()
+            second = worker.claim_batch()
+            third = worker.claim_batch()
+        finally:
+            worker.close()
+
+        self.assertEqual((len(first), len(second), len(third)), (4, 2, 0))
+        self.assertFalse({s.id for s in first} & {s.id for s in second})
+
+    def test_results_are_dropped_once_the_lease_is_lost(self):
+        from .grading_worker import GradingWorker
+
+        worker = GradingWorker(batch_size=10)
+
+        def slow_grading(jobs):
+            # Meanwhile the lease ran out and another worker claimed the rows again
+            user_models.Submission.objects.filter(assessment=self.assessment).update(
+                grading_available_at=timezone.now() + timedelta(hours=1))
+
+            async def grades():
+                return [(75.0, "Late.")] * len(jobs)
+            return grades()
+
+        try:
+            batch = worker.claim_batch()
+            with patch.object(worker, '_grade_all', slow_grading), patch('users.grading_worker.notify_graded') as notify:
+                self.assertEqual(worker.grade_batch(batch), 0)
+        finally:
+            worker.close()
+
+        notify.assert_called_once_with([])
+        submissions = user_models.Submission.objects.filter(assessment=self.assessment)
+        self.assertEqual(set(submissions.values_list('grading_status', flat=True)), {'PENDING'})
+        self.assertEqual(set(submissions.values_list('score', flat=True)), {None})
+
+    @override_settings(AI_GRADING_BACKOFF_BASE=0)
+    def test_rate_limited_requests_are_retried(self):
+        from .grading_worker import GradingWorker
+
+        StubGradingHandler.rate_limited = 2
+        host, port = self.server.server_address
+        with override_settings(OPENAI_BASE_URL=f'http://{host}:{port}/v1'):
+            worker = GradingWorker(batch_size=10, concurrency=1)
+            try:
+                graded = worker.drain()
+            finally:
+                worker.close()
+
+        self.assertEqual(graded, 6)
+        self.assertEqual(StubGradingHandler.requests, 8)
+        # Each 429 halved the refill rate, successes only creep it back up
+        self.assertLess(self.limiter.store.get_factor(), 1.0)
+
+
+class RateLimiterTestCase(TestCase):
+    def test_request_bucket_paces_requests(self):
+        from .rate_limit import RateLimiter, MemoryBucketStore
+
+        limiter = RateLimiter(MemoryBucketStore(), requests_per_minute=2, tokens_per_minute=100000)
+        self.assertEqual(limiter.try_acquire(10), 0)
+        self.assertEqual(limiter.try_acquire(10), 0)
+        self.assertGreater(limiter.try_acquire(10), 0)
+
+    def test_token_bucket_paces_large_prompts(self):
+        from .rate_limit import RateLimiter, MemoryBucketStore
+
+        limiter = RateLimiter(MemoryBucketStore(), requests_per_minute=100, tokens_per_minute=1000)
+        self.assertEqual(limiter.try_acquire(800), 0)
+        wait = limiter.try_acquire(800)
+        # 600 missing tokens at 1000/minute
+        self.assertAlmostEqual(wait, 36, delta=1)
+
+    def test_rate_adapts_to_provider_errors(self):
+        from .rate_limit import RateLimiter, MemoryBucketStore
+
+        limiter = RateLimiter(MemoryBucketStore(), requests_per_minute=60, tokens_per_minute=1000)
+        limiter.on_rate_limited()
+        limiter.on_rate_limited()
+        self.assertEqual(limiter.store.get_factor(), 0.25)
+        limiter.on_success()
+        self.assertAlmostEqual(limiter.store.get_factor(), 0.3)
+
+    @patch('users.service.OpenAI')
+    def test_grading_is_refused_rather_than_waiting(self, mock_openai):
+        from .rate_limit import RateLimiter, MemoryBucketStore
+        from .service import perform_ai_grading, TransientGradingError
+
+        limiter = RateLimiter(MemoryBucketStore(), requests_per_minute=1, tokens_per_minute=100000)
+        limiter.try_acquire(10)
+        started = time.monotonic()
+        with patch('users.rate_limit._limiter', limiter):
+            with self.assertRaises(TransientGradingError) as raised:
+                perform_ai_grading('print(1)', 'print(1)')
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertGreater(raised.exception.retry_after, 0)
+        mock_openai.return_value.chat.completions.create.assert_not_called()
+
+
+class GradeSubmissionTaskTestCase(TestCase):
+    def setUp(self):
+        institution = user_models.Institution.objects.create(name='Task Institution')
+        teacher_user = User.objects.create_user(
+            username='taskteacher',
+            email=f"taskteacher_{uuid.uuid4()}@example.com",
+            password='pass123',
+            user_role='teacher',
+            institution=institution
+        )
+        teacher = user_models.Teacher.objects.create(user=teacher_user, institution=institution)
+        course = user_models.Course.objects.create(title='Task Course', institution=institution, teacher=teacher)
+        assessment = user_models.Assessment.objects.create(
+            course=course, teacher=teacher, title='Task Assessment', instructor_solution='print(1)', use_ai_grading=True)
+        self.submission = user_models.Submission.objects.create(
+            assessment=assessment, submission_type='ASSESSMENT', submitted_code='print(1)')
+
+    @patch('users.tasks.cached_ai_grading')
+    def test_failed_grading_is_left_for_the_teacher(self, mock_grading):
+        from .grading_worker import GradingWorker
+        from .tasks import grade_submission_task
+
+        mock_grading.return_value = (None, "AI grading failed due to an internal error.")
+        grade_submission_task(self.submission.id)
+
+        self.submission.refresh_from_db()
+        self.assertEqual(self.submission.grading_status, 'FAILED')
+        self.assertIsNone(self.submission.score)
+        # The same terminal state as the grading worker's, so the worker does not pick it up again
+        worker = GradingWorker()
+        try:
+            self.assertFalse(worker.pending_submissions().filter(id=self.submission.id).exists())
+        finally:
+            worker.close()
+
+    @override_settings(AI_GRADING_MAX_RETRIES=2, AI_GRADING_BACKOFF_BASE=0)
+    @patch('users.tasks.cached_ai_grading')
+    def test_transient_errors_are_retried(self, mock_grading):
+        from .service import TransientGradingError
+        from .tasks import grade_submission_task
+
+        mock_grading.side_effect = [TransientGradingError("429"), (75.0, "Fine.")]
+        grade_submission_task.apply(args=[self.submission.id])
+
+        self.submission.refresh_from_db()
+        self.assertEqual(mock_grading.call_count, 2)
+        self.assertEqual(self.submission.grading_status, 'GRADED')
+        self.assertEqual(self.submission.score, 75.0)
+
+
+# Dispatcher and grading tasks run inline rather than through a broker
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True, GRADING_SCHEDULER_BACKEND='memory')
+class GradingSchedulerTestCase(TestCase):
+    def setUp(self):
+        from .scheduling import GradingScheduler, MemoryQueueStore
+
+        self.sent = []
+        self.scheduler = GradingScheduler(
+            MemoryQueueStore(), lambda submission_id, queue: self.sent.append((submission_id, queue)))
+        scheduler_patch = patch('users.scheduling._scheduler', self.scheduler)
+        scheduler_patch.start()
+        self.addCleanup(scheduler_patch.stop)
+
+        self.courses = {}
+        for name in ['big', 'small']:
+            institution = user_models.Institution.objects.create(name=f'{name} institution')
+            teacher_user = User.objects.create_user(
+                username=f'{name}teacher',
+                email=f"{name}teacher_{uuid.uuid4()}@example.com",
+                password='pass123',
+                user_role='teacher',
+                institution=institution
+            )
+            teacher = user_models.Teacher.objects.create(user=teacher_user, institution=institution)
+            self.courses[name] = user_models.Course.objects.create(
+                title=f'{name} course', institution=institution, teacher=teacher)
+
+    def submit(self, name, count, time_limit=None):
+        course = self.courses[name]
+        if time_limit:
+            quiz = user_models.Quiz.objects.create(
+                course=course, title='Timed Quiz', time_limit=time_limit, use_ai_grading=True)
+            fields = {'quiz': quiz, 'submission_type': 'QUIZ'}
+        else:
+            assessment = user_models.Assessment.objects.create(
+                course=course, title='Assessment', use_ai_grading=True)
+            fields = {'assessment': assessment, 'submission_type': 'ASSESSMENT'}
+        submissions = []
+        for _ in range(count):
+            submission = user_models.Submission.objects.create(submitted_code='print(1)', **fields)
+            self.scheduler.submit(submission)
+            submissions.append(submission)
+        return submissions
+
+    def test_timed_quizzes_go_to_the_priority_queue(self):
+        quiz_submission = self.submit('small', 1, time_limit=30)[0]
+        assessment_submission = self.submit('big', 1)[0]
+
+        self.scheduler.dispatch()
+
+        self.assertEqual(self.sent, [
+            (quiz_submission.id, 'grading-priority'),
+            (assessment_submission.id, 'grading'),
+        ])
+
+    @override_settings(GRADING_DISPATCH_HIGH_WATER=4)
+    def test_a_burst_does_not_starve_other_institutions(self):
+        big = self.submit('big', 20)
+        small = self.submit('small', 2)
+
+        self.scheduler.dispatch()
+
+        self.assertEqual([submission_id for submission_id, _ in self.sent],
+                         [big[0].id, small[0].id, big[1].id, small[1].id])
+
+    @override_settings(GRADING_DISPATCH_HIGH_WATER=6)
+    def test_weights_set_each_institution_share(self):
+        big = self.submit('big', 10)
+        self.submit('small', 10)
+        weights = {str(self.courses['big'].institution_id): 2}
+
+        with self.settings(GRADING_INSTITUTION_WEIGHTS=weights):
+            self.scheduler.dispatch()
+
+        big_ids = {submission.id for submission in big}
+        self.assertEqual(sum(1 for submission_id, _ in self.sent if submission_id in big_ids), 4)
+
+    @override_settings(GRADING_DISPATCH_HIGH_WATER=5)
+    def test_dispatch_keeps_the_celery_queue_shallow(self):
+        self.submit('big', 10)
+        self.scheduler.store.broker['grading'] = 3
+
+        self.scheduler.dispatch()
+
+        self.assertEqual(len(self.sent), 2)
+        metrics = self.scheduler.metrics()
+        self.assertEqual(metrics['standard']['depth'], 8)
+        self.assertEqual(metrics['standard']['institutions'], 1)
+        self.assertEqual(metrics['standard']['dispatched'], 2)
+        self.assertEqual(metrics['priority']['depth'], 0)
+
+    def test_submissions_during_a_pending_kick_are_dispatched(self):
+        from .tasks import dispatch_grading_task, schedule_dispatch
+
+        first, second = self.submit('big', 2)
+        with patch('users.tasks.dispatch_grading_task.apply_async') as apply_async:
+            schedule_dispatch()
+            # The kick is held until the dispatcher runs
+            schedule_dispatch()
+            self.assertEqual(apply_async.call_count, 1)
+
+            dispatch_grading_task()
+            self.assertEqual(self.sent, [(first.id, 'grading'), (second.id, 'grading')])
+
+            third = self.submit('small', 1)[0]
+            schedule_dispatch()
+            self.assertEqual(apply_async.call_count, 2)
+            dispatch_grading_task()
+        self.assertEqual(self.sent[-1], (third.id, 'grading'))
+
+    @override_settings(GRADING_DISPATCH_HIGH_WATER=1)
+    def test_dispatcher_reschedules_itself_while_work_remains(self):
+        from .tasks import dispatch_grading_task
+
+        self.submit('big', 2)
+        with patch('users.tasks.dispatch_grading_task.apply_async') as apply_async:
+            dispatch_grading_task()
+            self.assertEqual(apply_async.call_count, 1)
+            dispatch_grading_task()
+            self.assertEqual(apply_async.call_count, 1)
+        self.assertEqual(len(self.sent), 2)
+
+    def test_a_submission_is_kept_when_sending_it_fails(self):
+        from .tasks import dispatch_grading_task
+
+        first, second = self.submit('big', 2)
+        with patch.object(self.scheduler, 'send', side_effect=ConnectionError("broker down")), \
+                patch('users.tasks.dispatch_grading_task.apply_async') as apply_async:
+            with self.assertRaises(ConnectionError):
+                dispatch_grading_task()
+            # The failed run still asks for another one
+            self.assertEqual(apply_async.call_count, 1)
+
+        self.assertEqual(self.scheduler.metrics()['standard']['depth'], 2)
+        self.scheduler.dispatch()
+        self.assertEqual(self.sent, [(first.id, 'grading'), (second.id, 'grading')])
+
+    def test_a_push_racing_deactivation_keeps_its_tenant(self):
+        from .scheduling import STANDARD
+
+        store = self.scheduler.store
+        store.push(STANDARD, 'late', '1:0')
+        store.pop(STANDARD, 'late')
+        # The dispatcher saw the queue empty, then a push landed before it deactivated the tenant
+        store.push(STANDARD, 'late', '2:0')
+        self.assertFalse(store.deactivate_if_empty(STANDARD, 'late'))
+        self.assertEqual(store.head(STANDARD), 'late')
+
+        store.pop(STANDARD, 'late')
+        self.assertTrue(store.deactivate_if_empty(STANDARD, 'late'))
+        self.assertIsNone(store.head(STANDARD))
+
+    @patch('users.tasks.cached_ai_grading')
+    def test_enqueued_submissions_are_dispatched_and_graded(self, mock_grading):
+        from .scheduling import send_to_celery
+        from .tasks import enqueue_grading
+
+        mock_grading.return_value = (90.0, "Good.")
+        self.scheduler.send = send_to_celery
+        course = self.courses['small']
+        quiz = user_models.Quiz.objects.create(
+            course=course, title='Timed Quiz', time_limit=10, use_ai_grading=True)
+        submission = user_models.Submission.objects.create(
+            quiz=quiz, submission_type='QUIZ', submitted_code='print(1)')
+
+        enqueue_grading(submission)
+
+        submission.refresh_from_db()
+        self.assertEqual(submission.grading_status, 'GRADED')
+        self.assertFalse(self.scheduler.has_backlog())
+        self.assertEqual(self.scheduler.metrics()['priority']['dispatched'], 1)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'sandbox-tests'}})
+class SandboxTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from .sandbox import SandboxPool
+
+        super().setUpClass()
+        cls.pool = SandboxPool(size=2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        pool_patch = patch('users.sandbox._pool', self.pool)
+        pool_patch.start()
+        self.addCleanup(pool_patch.stop)
+
+        institution = user_models.Institution.objects.create(name='Sandbox Institution')
+        teacher_user = User.objects.create_user(
+            username='sandboxteacher',
+            email=f"sandboxteacher_{uuid.uuid4()}@example.com",
+            password='pass123',
+            user_role='teacher',
+            institution=institution
+        )
+        teacher = user_models.Teacher.objects.create(user=teacher_user, institution=institution)
+        course = user_models.Course.objects.create(title='Sandbox Course', institution=institution, teacher=teacher)
+        self.assessment = user_models.Assessment.objects.create(
+            course=course, teacher=teacher, title='Add Two Numbers', use_ai_grading=True, max_score=50)
+        user_models.CodeTestCase.objects.create(
+            assessment=self.assessment, name='small', stdin='1\n2\n', expected_output='3\n', order=1)
+        user_models.CodeTestCase.objects.create(
+            assessment=self.assessment, name='large', stdin='1000\n2000\n', expected_output='3000', order=2, is_hidden=True)
+
+    def test_runs_code_with_stdin(self):
+        result = self.pool.run("a = int(input())\nprint(a * 2)", stdin='21\n')
+        self.assertEqual(result['status'], 'ok')
+        self.assertEqual(result['stdout'], '42\n')
+
+    def test_limits_are_enforced(self):
+        self.assertEqual(self.pool.run("while True:\n    pass", cpu_time=1)['status'], 'cpu_limit')
+        self.assertEqual(self.pool.run("import time\ntime.sleep(5)", wall_time=0.5)['status'], 'timeout')
+        self.assertEqual(self.pool.run("x = bytearray(512 * 1024 * 1024)")['status'], 'memory_limit')
+        self.assertEqual(self.pool.run("while True:\n    print('x' * 1000)")['status'], 'output_limit')
+
+        result = self.pool.run("raise ValueError('boom')")
+        self.assertEqual(result['status'], 'error')
+        self.assertIn('ValueError: boom', result['stderr'])
+        self.assertNotIn('sandbox_worker', result['stderr'])
+
+    def test_runs_do_not_see_the_server_environment(self):
+        result = self.pool.run("import os\nprint(dict(os.environ))")
+        self.assertEqual(result['stdout'].strip(), '{}')
+
+    def test_runs_are_isolated_from_the_server(self):
+        from django.conf import settings
+
+        result = self.pool.run("import os\nprint(os.getuid(), os.getgid())")
+        self.assertEqual(result['stdout'].split(), [str(settings.SANDBOX_UID), str(settings.SANDBOX_GID)])
+
+        result = self.pool.run(f"print(open({str(settings.BASE_DIR / 'core' / 'settings.py')!r}).read())")
+        self.assertEqual(result['status'], 'error')
+        self.assertEqual(result['stdout'], '')
+
+        result = self.pool.run("import socket\nsocket.create_connection(('1.1.1.1', 80), timeout=1)")
+        self.assertEqual(result['status'], 'error')
+        self.assertRegex(result['stderr'], 'ModuleNotFoundError|OSError')
+
+    @patch('users.tasks.cached_ai_grading')
+    def test_submissions_with_test_cases_are_graded_without_the_ai(self, mock_grading):
+        from .tasks import grade_submission_task
+
+        passing = user_models.Submission.objects.create(
+            assessment=self.assessment, submission_type='ASSESSMENT',
+            submitted_code="print(int(input()) + int(input()))")
+        partial = user_models.Submission.objects.create(
+            assessment=self.assessment, submission_type='ASSESSMENT',
+            submitted_code="a = int(input())\nprint(3 if a == 1 else 0)")
+
+        grade_submission_task(passing.id)
+        grade_submission_task(partial.id)
+
+        mock_grading.assert_not_called()
+        passing.refresh_from_db()
+        partial.refresh_from_db()
+        self.assertEqual(passing.grading_status, 'GRADED')
+        self.assertEqual(passing.score, 50)
+        self.assertEqual(partial.score, 25)
+        self.assertEqual([result['passed'] for result in partial.test_results], [True, False])
+        # The hidden case's input must not come back to the student through its output
+        hidden = partial.test_results[1]
+        self.assertEqual(set(hidden), {'test_case_id', 'passed', 'points', 'max_points', 'status', 'is_hidden'})
+
+    @patch('users.tasks.notify_graded')
+    def test_sandbox_failures_are_not_scored(self, mock_notify):
+        from django.conf import settings
+        from . import sandbox
+        from .tasks import grade_submission_task
+
+        submission = user_models.Submission.objects.create(
+            assessment=self.assessment, submission_type='ASSESSMENT',
+            submitted_code="print(int(input()) + int(input()))")
+        failed = {'status': 'internal_error', 'passed': False, 'points': 0, 'max_points': 1}
+        with patch.object(sandbox, 'run_test_cases', return_value=[failed, failed]) as run:
+            grade_submission_task.apply(args=[submission.id])
+
+        self.assertEqual(run.call_count, settings.AI_GRADING_MAX_RETRIES + 1)
+        mock_notify.assert_not_called()
+        submission.refresh_from_db()
+        self.assertEqual(submission.grading_status, 'FAILED')
+        self.assertIsNone(submission.score)
+        self.assertIn('sandbox', submission.ai_feedback)
+
+    def test_teacher_adds_test_cases(self):
+        client = APIClient()
+        url = f'/api/teacher/assessment/{self.assessment.assessment_id}/test-cases/'
+
+        response = client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        other_user = User.objects.create_user(
+            username='othersandboxteacher', email='othersandboxteacher@example.com', password='pass123', user_role='teacher')
+        user_models.Teacher.objects.create(user=other_user)
+        client.force_authenticate(user=other_user)
+        response = client.post(url, {'name': 'zero', 'stdin': '0\n0\n', 'expected_output': '0'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        client.force_authenticate(user=self.assessment.teacher.user)
+        response = client.post(url, {'name': 'zero', 'stdin': '0\n0\n', 'expected_output': '0'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = client.get(url)
+        self.assertEqual([test_case['name'] for test_case in response.data['results']], ['zero', 'small', 'large'])
+
+    def test_identical_code_reuses_test_results_until_tests_change(self):
+        from . import sandbox
+        from .sandbox import cached_run_test_cases, test_run_cache_stats, test_cases_for
+
+        submission = user_models.Submission(assessment=self.assessment, submission_type='ASSESSMENT')
+        code = "print(int(input()) + int(input()))"
+
+        with patch.object(sandbox, 'run_test_cases', wraps=sandbox.run_test_cases) as run:
+            first = cached_run_test_cases(code, test_cases_for(submission))
+            # Another student's copy differing only in whitespace
+            second = cached_run_test_cases(code + "   \r\n\n", test_cases_for(submission))
+            self.assertEqual(run.call_count, 1)
+            self.assertEqual(second, first)
+
+            test_case = self.assessment.test_cases.get(name='large')
+            test_case.expected_output = '2999'
+            test_case.save()
+            third = cached_run_test_cases(code, test_cases_for(submission))
+            self.assertEqual(run.call_count, 2)
+
+        self.assertEqual([result['passed'] for result in third], [True, False])
+        self.assertEqual(test_run_cache_stats(), {'hits': 1, 'misses': 2})
+
+
+class BulkUserImportTestCase(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        # The import and outbox tasks run inline rather than through a broker
+        media_patch = override_settings(
+            MEDIA_ROOT=media.name, USER_IMPORT_CHUNK_SIZE=3, EMAIL_OUTBOX_RATE_LIMIT_BACKEND='memory',
+            CELERY_TASK_ALWAYS_EAGER=True)
+        media_patch.enable()
+        self.addCleanup(media_patch.disable)
+
+        self.institution = user_models.Institution.objects.create(name='Import Institution')
+        admin_user = User.objects.create_user(
+            username='importadmin',
+            email='importadmin@example.com',
+            password='pass123',
+            user_role='admin',
+            institution=self.institution
+        )
+        user_models.Admin.objects.create(user=admin_user, institution=self.institution)
+        User.objects.create_user(username='taken', email='taken@example.com', password='pass123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=admin_user)
+
+    def upload(self, name, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/admin/bulk-file-upload/', {
+                'institution_id': self.institution.id,
+                'file': SimpleUploadedFile(name, content),
+            }, format='multipart')
+
+    def test_csv_import_runs_as_a_job(self):
+        rows = [
+            'Email,User-Role',
+            'ada@example.com,Student',
+            ' Grace@Example.com ,teacher',
+            'ada@example.com,student',
+            'taken@example.com,student',
+            'not-an-email,student',
+            'linus@example.com,janitor',
+            '',
+            'alan@example.com,student',
+        ]
+        response = self.upload('users.csv', '\n'.join(rows).encode())
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        job = user_models.UserImportJob.objects.get(job_id=response.data['job_id'])
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(job.created_count, 3)
+        self.assertEqual(job.processed_rows, 7)
+        self.assertEqual(
+            [(error['row'], error['error']) for error in job.errors],
+            [
+                (4, "Duplicate email in file."),
+                (5, "A user with this email already exists."),
+                (6, "Invalid email address."),
+                (7, "User role must be teacher or student."),
+            ],
+        )
+        self.assertTrue(user_models.Teacher.objects.filter(user__email='grace@example.com').exists())
+        self.assertEqual(user_models.Student.objects.filter(institution=self.institution).count(), 2)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         ['ada@example.com', 'alan@example.com', 'grace@example.com'])
+
+        created = User.objects.get(email='ada@example.com')
+        self.assertEqual(created.username, 'ada')
+        self.assertTrue(created.has_usable_password())
+
+        progress = self.client.get(f'/api/admin/import-jobs/{job.job_id}/')
+        self.assertEqual(progress.data['progress'], 100)
+        self.assertEqual(len(progress.data['errors']), 4)
+
+    def test_xlsx_import(self):
+        import openpyxl
+
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.append(['email', 'user-role'])
+        for number in range(5):
+            sheet.append([f'student{number}@example.com', 'student'])
+        content = io.BytesIO()
+        workbook.save(content)
+
+        response = self.upload('users.xlsx', content.getvalue())
+
+        job = user_models.UserImportJob.objects.get(job_id=response.data['job_id'])
+        self.assertEqual((job.status, job.total_rows, job.created_count), ('completed', 5, 5))
+
+    def test_missing_columns_are_rejected_up_front(self):
+        response = self.upload('users.csv', b'email\nada@example.com\n')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(user_models.UserImportJob.objects.exists())
+
+
+@override_settings(PASSWORD_HASH_WORKERS=2, PASSWORD_HASH_PARALLEL_MIN=2)
+class AccountProvisioningTestCase(TestCase):
+    def setUp(self):
+        self.addCleanup(self.shutdown_pool)
+        self.institution = user_models.Institution.objects.create(name='Provisioning Institution')
+        manager_user = User.objects.create_user(
+            username='manager', email='manager@example.com', password='pass123',
+            user_role='manager', institution=self.institution)
+        user_models.Manager.objects.create(user=manager_user, institution=self.institution)
+        admin_user = User.objects.create_user(
+            username='provadmin', email='provadmin@example.com', password='pass123',
+            user_role='admin', institution=self.institution)
+        self.admin = user_models.Admin.objects.create(user=admin_user, institution=self.institution)
+        self.client = APIClient()
+
+    def shutdown_pool(self):
+        from . import provisioning
+
+        if provisioning._executor is not None:
+            provisioning._executor.shutdown()
+            provisioning._executor = None
+
+    def test_passwords_are_hashed_in_parallel_in_order(self):
+        from django.contrib.auth.hashers import check_password
+        from .provisioning import hash_passwords
+
+        passwords = [f'password-{number}' for number in range(10)]
+        hashes = hash_passwords(passwords)
+
+        self.assertEqual(len(hashes), 10)
+        for password, password_hash in zip(passwords, hashes):
+            self.assertTrue(check_password(password, password_hash))
+
+    def test_create_users_in_a_batch(self):
+        response = self.client.post('/api/admin/create-user/', {
+            'institution_id': self.institution.id,
+            'admin_id': self.admin.id,
+            'users': [
+                {'email': 'one@example.com', 'user_role': 'student'},
+                {'email': 'two@example.com', 'user_role': 'teacher'},
+                {'email': 'provadmin@example.com', 'user_role': 'student'},
+                {'email': 'three@example.com', 'user_role': 'manager'},
+                {'email': 'ONE@example.com', 'user_role': 'student'},
+            ],
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([user['email'] for user in response.data['created_users']], ['one@example.com', 'two@example.com'])
+        self.assertEqual([(error['row'], error['error']) for error in response.data['errors']], [
+            (2, "A user with this email already exists."),
+            (3, "Invalid user role"),
+            (4, "Duplicate email in batch."),
+        ])
+        self.assertTrue(user_models.Student.objects.filter(user__email='one@example.com').exists())
+        self.assertTrue(user_models.Teacher.objects.filter(user__email='two@example.com').exists())
+        # Handlers only queue the credential emails
+        self.assertEqual(len(mail.outbox), 0)
+        queued = user_models.OutboxEmail.objects.order_by('id')
+        self.assertEqual([email.to for email in queued], [['one@example.com'], ['two@example.com']])
+        self.assertEqual(queued[0].from_email, 'provadmin@example.com')
+
+    def test_accounts_do_not_rely_on_bulk_create_returning_ids(self):
+        from django.db import connection
+        from .provisioning import provision_accounts
+
+        # MySQL does not set primary keys on bulk-created objects
+        with patch.object(connection.features, 'can_return_rows_from_bulk_insert', False):
+            accounts, errors = provision_accounts(self.institution, [
+                {'email': 'alpha@example.com', 'user_role': 'student'},
+                {'email': 'beta@example.com', 'user_role': 'teacher'},
+            ], roles={'student', 'teacher'})
+
+        self.assertEqual(errors, [])
+        self.assertEqual([user.email for user, _ in accounts], ['alpha@example.com', 'beta@example.com'])
+        self.assertTrue(all(user.pk for user, _ in accounts))
+        self.assertTrue(user_models.Student.objects.filter(user__email='alpha@example.com').exists())
+        self.assertTrue(user_models.Teacher.objects.filter(user__email='beta@example.com').exists())
+
+    def test_existing_emails_match_in_any_case(self):
+        from .provisioning import create_accounts, provision_accounts
+
+        User.objects.create_user(username='mixed', email='Mixed.Case@Example.com', password='pass123')
+
+        accounts, errors = provision_accounts(self.institution, [
+            {'email': 'mixed.case@example.com', 'user_role': 'student'},
+        ], roles={'student'})
+        self.assertEqual((accounts, [error['error'] for error in errors]), ([], ["A user with this email already exists."]))
+
+        # The same account created between the check and the insert, as a case-insensitive unique index reports it
+        with patch('users.provisioning._insert', side_effect=[IntegrityError('Duplicate entry'), []]) as insert:
+            accounts, errors = create_accounts(self.institution, [(0, 'mixed.case@example.com', 'student')])
+        self.assertEqual(insert.call_args.args[1], [])
+        self.assertEqual([(error['row'], error['email']) for error in errors], [(0, 'mixed.case@example.com')])
+
+    def test_create_admins_in_a_batch(self):
+        response = self.client.post('/api/manager/create-admin/', {
+            'institution_id': self.institution.id,
+            'users': [{'email': 'head@example.com'}, {'email': 'deputy@example.com'}],
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(user_models.Admin.objects.filter(institution=self.institution).count(), 3)
+        self.assertEqual(
+            sorted(email.to[0] for email in user_models.OutboxEmail.objects.all()),
+            ['deputy@example.com', 'head@example.com'])
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    # Stands in for a provider that is down
+    def send_messages(self, email_messages):
+        raise ConnectionError("provider unavailable")
+
+
+class UnreachableEmailBackend(BaseEmailBackend):
+    # Stands in for a provider whose server refuses connections
+    def open(self):
+        raise ConnectionRefusedError("connection refused")
+
+    def send_messages(self, email_messages):
+        raise AssertionError("send_messages called without a connection")
+
+
+OUTBOX_PROVIDERS = {
+    'default': {'BACKEND': 'django.core.mail.backends.locmem.EmailBackend', 'RATE_PER_MINUTE': 2},
+    'down': {'BACKEND': 'users.tests.FailingEmailBackend'},
+    'unreachable': {'BACKEND': 'users.tests.UnreachableEmailBackend'},
+}
+
+
+@override_settings(EMAIL_OUTBOX_PROVIDERS=OUTBOX_PROVIDERS, EMAIL_OUTBOX_RATE_LIMIT_BACKEND='memory', EMAIL_OUTBOX_MAX_ATTEMPTS=2)
+class EmailOutboxTestCase(TestCase):
+    def setUp(self):
+        limiter_patch = patch('users.outbox._limiters', {})
+        limiter_patch.start()
+        self.addCleanup(limiter_patch.stop)
+        self.user = User.objects.create_user(username='forgetful', email='forgetful@example.com', password='pass123')
+
+    def queue(self, count, provider='default'):
+        from django.core.mail import EmailMultiAlternatives
+        from .outbox import enqueue_messages
+
+        messages = []
+        for number in range(count):
+            message = EmailMultiAlternatives(subject=f'Hello {number}', body='Text', to=[f'user{number}@example.com'])
+            message.attach_alternative('<p>Text</p>', 'text/html')
+            messages.append(message)
+        enqueue_messages(messages, dedupe_keys=[f'hello:{number}' for number in range(count)], provider=provider)
+
+    def test_password_reset_only_queues_the_email(self):
+        response = self.client.get('/api/user/forgot-password/forgetful@example.com/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(mail.outbox), 0)
+        email = user_models.OutboxEmail.objects.get()
+        self.assertEqual((email.to, email.subject, email.status), (['forgetful@example.com'], "Password Reset Email", 'pending'))
+        self.assertIn('<', email.html_body)
+
+    def test_dedupe_key_queues_a_message_once(self):
+        self.queue(2)
+        self.queue(2)
+
+        self.assertEqual(user_models.OutboxEmail.objects.count(), 2)
+
+    def test_dispatch_respects_the_provider_rate(self):
+        from .outbox import dispatch
+
+        self.queue(3)
+        sent, retry_in = dispatch('default')
+
+        self.assertEqual(sent, 2)
+        self.assertGreater(retry_in, 0)
+        self.assertEqual([message.subject for message in mail.outbox], ['Hello 0', 'Hello 1'])
+        self.assertEqual(mail.outbox[0].alternatives[0][0], '<p>Text</p>')
+        self.assertEqual(
+            list(user_models.OutboxEmail.objects.order_by('id').values_list('status', flat=True)),
+            ['sent', 'sent', 'pending'])
+        # Only messages still waiting keep their bodies
+        self.assertEqual(
+            list(user_models.OutboxEmail.objects.order_by('id').values_list('body', 'html_body')),
+            [('', None), ('', None), ('Text', '<p>Text</p>')])
+
+    def test_failed_sends_are_retried_then_given_up(self):
+        from django.utils import timezone
+        from .outbox import dispatch
+
+        self.queue(1, provider='down')
+        sent, retry_in = dispatch('down')
+
+        email = user_models.OutboxEmail.objects.get()
+        self.assertEqual((sent, email.status, email.attempts), (0, 'pending', 1))
+        self.assertIn('provider unavailable', email.last_error)
+        self.assertGreater(email.next_attempt_at, timezone.now())
+        self.assertGreater(retry_in, 0)
+
+        # Nothing is due until the backoff has passed
+        self.assertEqual(dispatch('down')[0], 0)
+        email.refresh_from_db()
+        self.assertEqual(email.attempts, 1)
+
+        user_models.OutboxEmail.objects.update(next_attempt_at=timezone.now())
+        dispatch('down')
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts, email.body), ('failed', 2, ''))
+
+    def test_unreachable_provider_backs_the_batch_off(self):
+        from django.utils import timezone
+        from .tasks import dispatch_outbox_task
+
+        self.queue(2, provider='unreachable')
+        with patch('users.outbox.schedule_outbox_dispatch') as schedule:
+            # Run as a worker would, so the task schedules its next run itself
+            result = dispatch_outbox_task.run('unreachable')
+
+        self.assertEqual(result, "Sent 0 email(s).")
+        schedule.assert_called_once()
+        self.assertGreater(schedule.call_args.kwargs['countdown'], 0)
+        for email in user_models.OutboxEmail.objects.all():
+            self.assertEqual((email.status, email.attempts), ('pending', 1))
+            self.assertIn('connection refused', email.last_error)
+            self.assertGreater(email.next_attempt_at, timezone.now())
+
+    def test_file_backend_delivers_offline(self):
+        from .outbox import dispatch
+
+        with tempfile.TemporaryDirectory() as directory:
+            providers = {'default': {'BACKEND': 'django.core.mail.backends.filebased.EmailBackend'}}
+            with self.settings(EMAIL_OUTBOX_PROVIDERS=providers, EMAIL_FILE_PATH=directory):
+                self.queue(2)
+                self.assertEqual(dispatch('default'), (2, None))
+                written = ''.join(open(os.path.join(directory, name)).read() for name in os.listdir(directory))
+
+        self.assertIn('Hello 0', written)
+        self.assertIn('Hello 1', written)
+
+
+class EmailRenderingTestCase(TestCase):
+    def contexts(self, count):
+        return [
+            {'username': f'user<{i}>', 'email': f'user{i}@example.com', 'password': f'pw&{i}', 'user_role': 'student'}
+            for i in range(count)
+        ]
+
+    def test_batch_matches_render_to_string(self):
+        from django.template.loader import render_to_string
+        from .email_rendering import render_email_batch
+
+        contexts = self.contexts(3)
+        for template in ['admin/create_new_user', 'manager/create_admin']:
+            bodies = render_email_batch(template, contexts)
+            self.assertEqual(bodies, [
+                (render_to_string(f'{template}.txt', context), render_to_string(f'{template}.html', context))
+                for context in contexts
+            ])
+        # Per-user fields are still escaped
+        self.assertIn('user&lt;0&gt;', bodies[0][1])
+
+    def test_tags_render_like_django(self):
+        from django.template import engines
+        from .email_rendering import CompiledEmailTemplate
+
+        source = 'Hi {{ name|upper }}!{% if items %}<ul>{% for i in items %}<li>{{ i }}</li>{% endfor %}</ul>{% endif %} Bye'
+        template = engines['django'].from_string(source)
+        compiled = CompiledEmailTemplate(template)
+        for context in [{'name': 'a<b', 'items': [1, 2]}, {'name': 'c', 'items': []}]:
+            self.assertEqual(compiled.render(context), template.render(context))
+        # Static runs are precomputed as plain strings
+        self.assertEqual(compiled.parts[0], 'Hi ')
+        self.assertEqual(compiled.parts[-1], ' Bye')
+
+    def test_template_is_compiled_once(self):
+        from django.template.loader import get_template
+        from .email_rendering import render_email_batch, _compiled
+
+        _compiled.cache_clear()
+        with override_settings(DEBUG=False), patch('users.email_rendering.get_template', wraps=get_template) as loader:
+            render_email_batch('admin/create_new_user', self.contexts(5))
+            render_email_batch('admin/create_new_user', self.contexts(5))
+        self.assertEqual(loader.call_count, 2)
+
+
+class IndexAuditTestCase(TestCase):
+    def setUp(self):
+        self.institution = user_models.Institution.objects.create(name='Index Institution')
+        teacher_user = User.objects.create_user(
+            username='indexteacher',
+            email=f"indexteacher_{uuid.uuid4()}@example.com",
+            password='pass123',
+            user_role='teacher',
+            institution=self.institution
+        )
+        self.teacher = user_models.Teacher.objects.create(user=teacher_user, institution=self.institution)
+        self.course = user_models.Course.objects.create(title='Index Course', institution=self.institution, teacher=self.teacher)
+        assessment = user_models.Assessment.objects.create(course=self.course, teacher=self.teacher, title='Index Assessment')
+        student_user = User.objects.create_user(
+            username='indexstudent',
+            email=f"indexstudent_{uuid.uuid4()}@example.com",
+            password='pass123',
+            user_role='student',
+            institution=self.institution
+        )
+        self.student = user_models.Student.objects.create(user=student_user, institution=self.institution)
+        user_models.CourseEnrollment.objects.create(course=self.course, student=self.student, teacher=self.teacher)
+        for grading_status in ['GRADED', 'PENDING']:
+            user_models.Submission.objects.create(
+                student=self.student,
+                assessment=assessment,
+                submission_type='ASSESSMENT',
+                submitted_code='print(1)',
+                grading_status=grading_status
+            )
+        self.client = APIClient()
+
+    def test_hot_views_use_indexes(self):
+        from rest_framework.test import APIRequestFactory
+        from .index_audit import unindexed_queries
+        from .views.teacher_views import TeacherScoresAPIView
+
+        urls = [
+            f'/api/students/{self.student.id}/scores/',
+            f'/api/teacher/{self.teacher.id}/enrolled-students/{self.course.course_id}/',
+            f'/api/teacher/{self.teacher.id}/course-detail/{self.course.course_id}/',
+        ]
+        for url in urls:
+            with unindexed_queries() as found:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK, url)
+            self.assertEqual(found, [], url)
+
+        # The teacher scores route has no teacher_id, so call the view directly
+        request = APIRequestFactory().get('/')
+        with unindexed_queries() as found:
+            response = TeacherScoresAPIView.as_view()(request, teacher_id=self.teacher.id, course_id=self.course.course_id)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(found, [])
+
+    def test_flags_filter_without_index(self):
+        from .index_audit import audit_queryset
+
+        self.assertEqual(
+            audit_queryset(user_models.Submission.objects.filter(is_viewed=False, grading_status='GRADED')),
+            [{'table': 'users_submission', 'columns': ['grading_status', 'is_viewed']}])
+        # A single-column foreign key index does not cover a second filter
+        self.assertEqual(
+            audit_queryset(user_models.Submission.objects.filter(teacher=self.teacher, grading_status='GRADED')),
+            [{'table': 'users_submission', 'columns': ['grading_status', 'teacher_id']}])
+        self.assertEqual(audit_queryset(user_models.Submission.objects.filter(student=self.student, grading_status='GRADED')), [])
+        self.assertEqual(audit_queryset(user_models.Submission.objects.filter(assessment__course=self.course, grading_status='PENDING')), [])
+        self.assertEqual(audit_queryset(user_models.Course.objects.filter(course_id='X', teacher=self.teacher)), [])
+
+
+@override_settings(QUERY_BUDGET_ENFORCE=True, QUERY_BUDGET_HEADERS=True)
+class QueryBudgetTestCase(TestCase):
+    def setUp(self):
+        self.institution = user_models.Institution.objects.create(name='Budget Institution')
+        teacher_user = User.objects.create_user(
+            username='budgetteacher',
+            email=f"budgetteacher_{uuid.uuid4()}@example.com",
+            password='pass123',
+            user_role='teacher',
+            institution=self.institution
+        )
+        self.teacher = user_models.Teacher.objects.create(user=teacher_user, institution=self.institution)
+        self.course = user_models.Course.objects.create(title='Budget Course', institution=self.institution, teacher=self.teacher)
+        assessment = user_models.Assessment.objects.create(course=self.course, teacher=self.teacher, title='Budget Assessment')
+        # Enough rows that per-row queries would blow the budgets
+        for index in range(12):
+            student_user = User.objects.create_user(
+                username=f'budgetstudent{index}',
+                email=f"budgetstudent{index}_{uuid.uuid4()}@example.com",
+                password='pass123',
+                user_role='student',
+                institution=self.institution
+            )
+            student = user_models.Student.objects.create(user=student_user, institution=self.institution)
+            user_models.CourseEnrollment.objects.create(course=self.course, student=student, teacher=self.teacher)
+            user_models.Submission.objects.create(
+                student=student,
+                assessment=assessment,
+                submission_type='ASSESSMENT',
+                submitted_code='print(1)',
+                grading_status='GRADED'
+            )
+        self.student = student
+        self.client = APIClient()
+
+    def test_hot_views_stay_within_budget(self):
+        urls = [
+            f'/api/students/{self.student.id}/scores/',
+            f'/api/students/{self.student.id}/course-list/',
+            f'/api/students/{self.student.id}/course-detail/{self.course.course_id}/',
+            f'/api/teacher/{self.teacher.id}/course/',
+            f'/api/teacher/{self.teacher.id}/course-detail/{self.course.course_id}/',
+            f'/api/teacher/{self.teacher.id}/enrolled-students/{self.course.course_id}/',
+        ]
+        for url in urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK, url)
+            self.assertEqual(response['X-Query-Repeated'], '0', url)
+            self.assertIn('X-Query-Time-Ms', response)
+
+    def test_budget_and_repeated_queries_are_enforced(self):
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+        from .middleware import QueryBudgetMiddleware, QueryBudgetExceeded
+
+        def per_row_view(request):
+            for submission in user_models.Submission.objects.all():
+                user_models.Student.objects.get(id=submission.student_id)
+            return HttpResponse('ok')
+
+        request = RequestFactory().get('/per-row/')
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'same query run 12 times'):
+            QueryBudgetMiddleware(per_row_view)(request)
+
+        with patch('users.middleware.view_budget', return_value=1):
+            with self.assertRaisesMessage(QueryBudgetExceeded, 'budget is 1'):
+                QueryBudgetMiddleware(lambda request: per_row_view(request) and HttpResponse())(request)
+
+        with self.settings(QUERY_BUDGET_ENFORCE=False), self.assertLogs('users.queries', 'WARNING') as logs:
+            response = QueryBudgetMiddleware(per_row_view)(request)
+        self.assertEqual(response['X-Query-Count'], '13')
+        self.assertEqual(response['X-Query-Repeated'], '12')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['queries'], 13)
+        self.assertEqual(record['repeated'][0]['count'], 12)
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        self.institution = user_models.Institution.objects.create(name='Metrics Institution')
+        student_user = User.objects.create_user(
+            username='metricsstudent',
+            email=f"metricsstudent_{uuid.uuid4()}@example.com",
+            password='pass123',
+            user_role='student',
+            institution=self.institution
+        )
+        self.student = user_models.Student.objects.create(user=student_user, institution=self.institution)
+        self.client = APIClient()
+
+    def sample(self, name, labels):
+        from prometheus_client import REGISTRY
+
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_requests_are_measured_per_route(self):
+        route = {'method': 'GET', 'route': 'api/students/<student_id>/scores/'}
+        before = self.sample('http_request_duration_seconds_count', {**route, 'status': '200'})
+        serializer_before = self.sample('http_request_serializer_seconds_count', route)
+
+        response = self.client.get(f'/api/students/{self.student.id}/scores/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(self.sample('http_request_duration_seconds_count', {**route, 'status': '200'}), before + 1)
+        self.assertEqual(self.sample('http_request_serializer_seconds_count', route), serializer_before + 1)
+        self.assertGreater(self.sample('http_request_db_seconds_sum', route), 0)
+        self.assertGreater(self.sample('http_response_size_bytes_sum', route), 0)
+
+        scrape = self.client.get('/api/metrics/')
+        self.assertEqual(scrape.status_code, status.HTTP_200_OK)
+        self.assertTrue(scrape['Content-Type'].startswith('text/plain'))
+        self.assertIn('http_request_duration_seconds_bucket{le="0.005",method="GET",route="api/students/<student_id>/scores/",status="200"}',
+                      scrape.content.decode())
+
+    def test_serializers_are_timed_without_patching_drf(self):
+        from rest_framework import serializers
+        from .metrics import TimedSerializerMixin
+        from .serializers import GradebookEntrySerializer, SubmissionScoreSerializer
+
+        self.assertEqual(serializers.Serializer.data.fget.__module__, 'rest_framework.serializers')
+        self.assertEqual(serializers.ListSerializer.data.fget.__module__, 'rest_framework.serializers')
+        self.assertTrue(issubclass(GradebookEntrySerializer, TimedSerializerMixin))
+        self.assertTrue(issubclass(SubmissionScoreSerializer, TimedSerializerMixin))
+
+        route = {'method': 'GET', 'route': 'api/students/<student_id>/playgrounds/'}
+        before = self.sample('http_request_serializer_seconds_sum', route)
+        user_models.PlayGround.objects.create(student=self.student, title='Timed', code_area='print(1)\n')
+        response = self.client.get(f'/api/students/{self.student.id}/playgrounds/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertGreater(self.sample('http_request_serializer_seconds_sum', route), before)
+
+    def test_grading_task_outcomes(self):
+        from .tasks import grade_submission_task
+
+        labels = {'task': 'users.tasks.grade_submission_task', 'outcome': 'success'}
+        before = self.sample('celery_tasks_total', labels)
+        grade_submission_task.apply(args=[0])
+        self.assertEqual(self.sample('celery_tasks_total', labels), before + 1)
+        self.assertGreater(self.sample('celery_task_duration_seconds_count', labels), 0)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_scrape_token(self):
+        self.assertEqual(self.client.get('/api/metrics/').status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'synthetic-tests'}})
+class SyntheticDataTestCase(TestCase):
+    def test_generated_institution_is_consistent(self):
+        from .synthetic import generate_institution, SYNTHETIC_PASSWORD
+
+        institution = generate_institution(
+            'Synthetic Test', students=30, teachers=3, courses=6, assessments_per_course=2,
+            quizzes_per_course=1, submissions=200, enrollments_per_student=2, seed=1)
+
+        self.assertEqual(user_models.Student.objects.filter(institution=institution).count(), 30)
+        self.assertEqual(user_models.Teacher.objects.filter(institution=institution).count(), 3)
+        self.assertEqual(user_models.Admin.objects.filter(institution=institution).count(), 1)
+        self.assertEqual(user_models.Course.objects.filter(institution=institution).count(), 6)
+        self.assertEqual(user_models.CourseEnrollment.objects.filter(course__institution=institution).count(), 60)
+        self.assertEqual(user_models.Quiz.objects.filter(course__institution=institution).count(), 6)
+        submissions = user_models.Submission.objects.filter(student__institution=institution)
+        self.assertEqual(submissions.count(), 200)
+        # Students only submit work for courses they are enrolled in
+        self.assertFalse(
+            submissions.filter(submission_type='ASSESSMENT')
+            .exclude(assessment__course__courseenrollment__student=F('student')).exists())
+        self.assertTrue(User.objects.get(email='student0@synthetic-test.example.com').check_password(SYNTHETIC_PASSWORD))
+
+    def test_benchmarks_run_and_compare(self):
+        from django.core.management import call_command
+        from .benchmarks import ENDPOINTS, latest_results, compare_results
+
+        call_command('generate_synthetic_data', name='Bench Test', students=20, teachers=2, courses=3,
+                     submissions=60, stdout=io.StringIO())
+
+        with tempfile.TemporaryDirectory() as directory:
+            output = io.StringIO()
+            call_command('run_benchmarks', institution='Bench Test', repeat=2, warmup=0, output_dir=directory, stdout=output)
+            results = latest_results(directory)
+
+            self.assertEqual(set(results['endpoints']), set(ENDPOINTS))
+            for name, result in results['endpoints'].items():
+                self.assertEqual(result['status'], 200, name)
+                self.assertGreater(result['queries'], 0, name)
+                self.assertGreater(result['peak_memory_kb'], 0, name)
+
+            call_command('run_benchmarks', institution='Bench Test', repeat=2, warmup=0, output_dir=directory,
+                         endpoint=['student-scores'], no_save=True, stdout=output)
+            self.assertIn('Compared with', output.getvalue())
+
+        slower = json.loads(json.dumps(results))
+        slower['endpoints']['student-scores']['queries'] *= 2
+        rows = {(name, metric): change for name, metric, _, _, change in compare_results(slower, results)}
+        self.assertEqual(rows[('student-scores', 'queries')], 100.0)
+        self.assertEqual(rows[('student-course-list', 'queries')], 0.0)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'gradebook-tests'}})
+class GradebookTestCase(TestCase):
+    def setUp(self):
+        self.institution = user_models.Institution.objects.create(name='Gradebook Institution')
+        teacher_user = User.objects.create_user(
+            username='gradebookteacher',
+            email=f"gradebookteacher_{uuid.uuid4()}@example.com",
+            password='pass123',
+            user_role='teacher',
+            institution=self.institution
+        )
+        self.teacher = user_models.Teacher.objects.create(user=teacher_user, institution=self.institution)
+        self.course = user_models.Course.objects.create(title='Gradebook Course', institution=self.institution, teacher=self.teacher)
+        self.assessment = user_models.Assessment.objects.create(
+            course=self.course, teacher=self.teacher, title='Gradebook Assessment', instructor_solution='print(1)')
+        self.quiz = user_models.Quiz.objects.create(course=self.course, teacher=self.teacher, title='Gradebook Quiz')
+        self.students = []
+        for index in range(2):
+            student_user = User.objects.create_user(
+                username=f'gradebookstudent{index}',
+                email=f"gradebookstudent{index}_{uuid.uuid4()}@example.com",
+                password='pass123',
+                user_role='student',
+                institution=self.institution
+            )
+            self.students.append(user_models.Student.objects.create(user=student_user, institution=self.institution))
+        self.client = APIClient()
+
+    def submit(self, student, work):
+        from .gradebook import refresh_gradebook
+
+        kind = 'ASSESSMENT' if isinstance(work, user_models.Assessment) else 'QUIZ'
+        submission = user_models.Submission.objects.create(
+            student=student, submission_type=kind, submitted_code='print(1)',
+            assessment=work if kind == 'ASSESSMENT' else None, quiz=work if kind == 'QUIZ' else None)
+        refresh_gradebook([submission])
+        return submission
+
+    @patch('users.tasks.cached_ai_grading')
+    def test_entries_follow_submissions_and_grading(self, mock_grading):
+        from .tasks import grade_submission_task
+
+        student = self.students[0]
+        first = self.submit(student, self.assessment)
+        entry = user_models.GradebookEntry.objects.get(student=student)
+        self.assertEqual((entry.attempts, entry.status, entry.best_score), (1, 'PENDING', None))
+
+        mock_grading.return_value = (80.0, "Good.")
+        grade_submission_task(first.id)
+        second = self.submit(student, self.assessment)
+        mock_grading.return_value = (60.0, "Worse.")
+        grade_submission_task(second.id)
+
+        entry.refresh_from_db()
+        self.assertEqual(entry.attempts, 2)
+        self.assertEqual(entry.graded_attempts, 2)
+        self.assertEqual(entry.best_score, 80.0)
+        self.assertEqual(entry.latest_score, 60.0)
+        self.assertEqual(entry.status, 'GRADED')
+        self.assertEqual(entry.latest_submission_id, second.id)
+
+        # A teacher's manual grade updates the same row
+        self.client.force_authenticate(self.teacher.user)
+        response = self.client.post(f'/api/submissions/{second.id}/grade/', {'score': 95}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        entry.refresh_from_db()
+        self.assertEqual((entry.best_score, entry.latest_score), (95.0, 95.0))
+        self.assertEqual(user_models.GradebookEntry.objects.count(), 1)
+
+    def test_gradebook_views_are_single_reads(self):
+        from .gradebook import rebuild_gradebook
+
+        for student in self.students:
+            self.submit(student, self.assessment)
+            self.submit(student, self.quiz)
+        user_models.Submission.objects.update(grading_status='GRADED', score=70)
+        rebuild_gradebook(self.course)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/teacher/courses/{self.course.course_id}/gradebook/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = response.data['results']
+        self.assertEqual(len(rows), 4)
+        self.assertEqual({row['work_id'] for row in rows}, {self.assessment.assessment_id, self.quiz.quiz_id})
+        self.assertEqual(rows[0]['best_score'], 70.0)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/students/{self.students[0].id}/gradebook/')
+        summary = response.data['courses'][0]
+        self.assertEqual(summary['course_id'], self.course.course_id)
+        self.assertEqual((summary['attempted'], summary['graded'], summary['average_best_score']), (2, 2, 70.0))
+
+        self.assertEqual(self.client.get('/api/students/0/gradebook/').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_rebuild_matches_incremental_updates(self):
+        from django.core.management import call_command
+
+        for student in self.students:
+            self.submit(student, self.assessment)
+            self.submit(student, self.assessment)
+            self.submit(student, self.quiz)
+        fields = ['student_id', 'work_key', 'attempts', 'best_score', 'status', 'latest_submission_id']
+        incremental = list(user_models.GradebookEntry.objects.order_by('student_id', 'work_key').values(*fields))
+
+        call_command('rebuild_gradebook', stdout=io.StringIO())
+        rebuilt = list(user_models.GradebookEntry.objects.order_by('student_id', 'work_key').values(*fields))
+        self.assertEqual(rebuilt, incremental)
+        self.assertEqual(len(rebuilt), 4)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'analytics-tests'}})
+class CourseAnalyticsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.institution = user_models.Institution.objects.create(name='Analytics Institution')
+        teacher_user = User.objects.create_user(
+            username='analyticsteacher',
+            email=f"analyticsteacher_{uuid.uuid4()}@example.com",
+            password='pass123',
+            user_role='teacher',
+            institution=self.institution
+        )
+        self.teacher = user_models.Teacher.objects.create(user=teacher_user, institution=self.institution)
+        self.course = user_models.Course.objects.create(title='Analytics Course', institution=self.institution, teacher=self.teacher)
+        self.due = timezone.now()
+        self.assessment = user_models.Assessment.objects.create(
+            course=self.course, teacher=self.teacher, title='Analytics Assessment', max_score=50, due_date=self.due)
+        self.quiz = user_models.Quiz.objects.create(course=self.course, teacher=self.teacher, title='Analytics Quiz')
+        self.students = []
+        for index in range(4):
+            student_user = User.objects.create_user(
+                username=f'analyticsstudent{index}',
+                email=f"analyticsstudent{index}_{uuid.uuid4()}@example.com",
+                password='pass123',
+                user_role='student',
+                institution=self.institution
+            )
+            self.students.append(user_models.Student.objects.create(user=student_user, institution=self.institution))
+        self.client = APIClient()
+
+    def submit(self, student, work, score=None, hours_before_due=1):
+        from .gradebook import save_submission
+
+        kind = 'ASSESSMENT' if isinstance(work, user_models.Assessment) else 'QUIZ'
+        submission = user_models.Submission(
+            student=student, submission_type=kind, submitted_code='print(1)',
+            assessment=work if kind == 'ASSESSMENT' else None, quiz=work if kind == 'QUIZ' else None,
+            grading_status='GRADED' if score is not None else 'PENDING', score=score)
+        save_submission(submission)
+        user_models.Submission.objects.filter(id=submission.id).update(
+            submitted_at=self.due - timedelta(hours=hours_before_due))
+        return submission
+
+    def test_item_statistics(self):
+        from .analytics import compute_course_analytics
+
+        # Assessment scores out of 50; the first student's best attempt counts
+        self.submit(self.students[0], self.assessment, 10, hours_before_due=24)
+        self.submit(self.students[0], self.assessment, 40, hours_before_due=2)
+        self.submit(self.students[1], self.assessment, 25, hours_before_due=-3)
+        self.submit(self.students[2], self.assessment, 50, hours_before_due=10)
+        self.submit(self.students[3], self.assessment, hours_before_due=-1)
+        self.submit(self.students[0], self.quiz, 90)
+
+        result = compute_course_analytics(self.course)
+        self.assertEqual((result['submissions'], result['students']), (6, 4))
+        items = {item['work_type']: item for item in result['items']}
+
+        assessment = items['ASSESSMENT']
+        self.assertEqual(assessment['work_id'], self.assessment.assessment_id)
+        self.assertEqual((assessment['submissions'], assessment['students'], assessment['graded']), (5, 4, 4))
+        self.assertEqual(assessment['late_rate'], 0.4)
+        self.assertEqual(assessment['on_time_rate'], 0.6)
+        scores = assessment['scores']
+        self.assertEqual(scores['count'], 3)
+        self.assertEqual((scores['min'], scores['median'], scores['max']), (50.0, 80.0, 100.0))
+        self.assertEqual(scores['percentiles']['p50'], 80.0)
+        self.assertEqual(sum(bucket['count'] for bucket in scores['distribution']), 3)
+        self.assertEqual(scores['distribution'][-1], {'range': '90-100', 'count': 1})
+        self.assertEqual(assessment['hours_before_due']['median'], 2.0)
+
+        quiz = items['QUIZ']
+        self.assertIsNone(quiz['late_rate'])
+        self.assertEqual(quiz['scores']['mean'], 90.0)
+
+    def test_endpoint_is_cached_until_a_new_grade(self):
+        from .gradebook import save_submission
+
+        submission = self.submit(self.students[0], self.assessment, hours_before_due=5)
+        url = f'/api/teacher/courses/{self.course.course_id}/analytics/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['scores']['count'], 0)
+
+        with self.assertNumQueries(1):
+            self.client.get(url)
+
+        submission.grading_status = 'GRADED'
+        submission.score = 45
+        save_submission(submission)
+        response = self.client.get(url)
+        self.assertEqual(response.data['scores']['count'], 1)
+        self.assertEqual(response.data['scores']['mean'], 90.0)
+
+        self.assertEqual(self.client.get('/api/teacher/courses/missing/analytics/').status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'push-tests'}},
+    ALLOWED_HOSTS=['localhost'],
+)
+class GradingStatusPushTestCase(TestCase):
+    def setUp(self):
+        self.institution = user_models.Institution.objects.create(name='Realtime Institution')
+        teacher_user = User.objects.create_user(
+            username='realtimeteacher',
+            email=f"realtimeteacher_{uuid.uuid4()}@example.com",
+            password='pass123',
+            user_role='teacher',
+            institution=self.institution
+        )
+        self.teacher = user_models.Teacher.objects.create(user=teacher_user, institution=self.institution)
+        self.course = user_models.Course.objects.create(title='Realtime Course', institution=self.institution, teacher=self.teacher)
+        self.assessment = user_models.Assessment.objects.create(course=self.course, teacher=self.teacher, title='Realtime Assessment')
+        self.students = []
+        for index in range(2):
+            student_user = User.objects.create_user(
+                username=f'realtimestudent{index}',
+                email=f"realtimestudent{index}_{uuid.uuid4()}@example.com",
+                password='pass123',
+                user_role='student',
+                institution=self.institution
+            )
+            self.students.append(user_models.Student.objects.create(user=student_user, institution=self.institution))
+
+    async def connect(self, user=None, token=None):
+        from channels.testing import WebsocketCommunicator
+        from rest_framework_simplejwt.tokens import AccessToken
+        from core.asgi import application
+
+        token = str(AccessToken.for_user(user)) if user else token
+        path = f'/ws/grading/?token={token}' if token else '/ws/grading/'
+        communicator = WebsocketCommunicator(application, path, headers=[(b'origin', b'http://localhost')])
+        connected, _ = await communicator.connect()
+        return communicator, connected
+
+    async def test_status_transitions_reach_student_and_teacher(self):
+        from asgiref.sync import sync_to_async
+        from .gradebook import save_submission
+        from .tasks import enqueue_grading
+
+        student, other = self.students
+        student_socket, connected = await self.connect(student.user)
+        self.assertTrue(connected)
+        other_socket, connected = await self.connect(other.user)
+        self.assertTrue(connected)
+        teacher_socket, connected = await self.connect(self.teacher.user)
+        self.assertTrue(connected)
+
+        def submit():
+            submission = user_models.Submission.objects.create(
+                student=student, assessment=self.assessment, submission_type='ASSESSMENT', submitted_code='print(1)')
+            with self.captureOnCommitCallbacks(execute=True), \
+                    patch('users.scheduling.get_scheduler'), patch('users.tasks.schedule_dispatch'):
+                enqueue_grading(submission)
+            return submission
+
+        def grade(submission):
+            submission.grading_status = 'GRADED'
+            submission.score = 88
+            with self.captureOnCommitCallbacks(execute=True):
+                save_submission(submission)
+
+        submission = await sync_to_async(submit)()
+        for socket in (student_socket, teacher_socket):
+            message = await socket.receive_json_from()
+            self.assertEqual((message['submission_id'], message['status']), (submission.id, 'PENDING'))
+
+        await sync_to_async(grade)(submission)
+        for socket in (student_socket, teacher_socket):
+            message = await socket.receive_json_from()
+            self.assertEqual(message['submission_id'], submission.id)
+            self.assertEqual((message['status'], message['score']), ('GRADED', 88.0))
+            self.assertEqual(message['course_id'], self.course.id)
+
+        # Other students hear nothing
+        self.assertTrue(await other_socket.receive_nothing())
+        for socket in (student_socket, other_socket, teacher_socket):
+            await socket.disconnect()
+
+    async def test_connections_require_a_valid_token(self):
+        _, connected = await self.connect()
+        self.assertFalse(connected)
+        _, connected = await self.connect(token='invalid')
+        self.assertFalse(connected)
+
+
+# The fan-out task runs inline rather than through a broker
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+class NotificationTestCase(TestCase):
+    def setUp(self):
+        self.institution = user_models.Institution.objects.create(name='Notification Institution')
+        teacher_user = User.objects.create_user(
+            username='notificationteacher',
+            email=f"notificationteacher_{uuid.uuid4()}@example.com",
+            password='pass123',
+            user_role='teacher',
+            institution=self.institution
+        )
+        self.teacher = user_models.Teacher.objects.create(user=teacher_user, institution=self.institution)
+        self.course = user_models.Course.objects.create(title='Notification Course', institution=self.institution, teacher=self.teacher)
+        self.students = []
+        for index in range(4):
+            student_user = User.objects.create_user(
+                username=f'notificationstudent{index}',
+                email=f"notificationstudent{index}_{uuid.uuid4()}@example.com",
+                password='pass123',
+                user_role='student',
+                institution=self.institution
+            )
+            student = user_models.Student.objects.create(user=student_user, institution=self.institution)
+            self.students.append(student)
+            # The last student is not enrolled
+            if index < 3:
+                user_models.CourseEnrollment.objects.create(
+                    course=self.course, student=student, teacher=self.teacher, is_enrolled=True)
+        self.client = APIClient()
+        self.assessment_data = {
+            'course_id': self.course.course_id, 'title': 'Loops', 'description': '', 'question_area': 'Write a loop.',
+            'instructor_solution': 'pass', 'use_ai_grading': False, 'ai_grading_parameters': '', 'max_score': 10,
+            'due_date': None,
+        }
+
+    def test_course_fan_out_and_counters(self):
+        from .notifications import notify_course, notify_users, unread_count
+
+        self.client.force_authenticate(self.teacher.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/teacher/create-assessment/', self.assessment_data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        enrolled = [student.user for student in self.students[:3]]
+        for user in enrolled:
+            self.assertEqual(unread_count(user), 1)
+            self.assertEqual(user.notifications.get().message, 'New assessment "Loops" in Notification Course.')
+        self.assertEqual(unread_count(self.students[3].user), 0)
+
+        # The fan-out costs the same number of statements however many students there are
+        with CaptureQueriesContext(connection) as small:
+            notify_users([user.id for user in enrolled[:1]], 'One')
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(notify_course(self.course, 'Everyone'), 3)
+        self.assertEqual(len(large), len(small) + 1)
+        self.assertEqual([unread_count(user) for user in enrolled], [3, 2, 2])
+
+    def test_broker_outage_does_not_fail_the_create(self):
+        self.client.force_authenticate(self.teacher.user)
+        with patch('users.tasks.notify_course_task.delay', side_effect=ConnectionError('broker down')), \
+                self.assertLogs(level='ERROR'), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/teacher/create-assessment/', self.assessment_data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(user_models.Assessment.objects.filter(title='Loops').exists())
+
+    def test_inbox_and_mark_read(self):
+        from .notifications import notify_users
+
+        user = self.students[0].user
+        other = self.students[1].user
+        for number in range(3):
+            notify_users([user.id, other.id], f'Message {number}')
+        self.client.force_authenticate(user)
+
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/notifications/?page_size=2')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['unread_count'], 3)
+        self.assertEqual([row['message'] for row in response.data['results']], ['Message 2', 'Message 1'])
+        self.assertIsNotNone(response.data['next'])
+
+        newest = response.data['results'][0]['id']
+        response = self.client.post(f'/api/notifications/{newest}/read/')
+        self.assertEqual(response.data['unread_count'], 2)
+        # Reading it twice changes nothing
+        response = self.client.post(f'/api/notifications/{newest}/read/')
+        self.assertEqual(response.data['unread_count'], 2)
+        response = self.client.get('/api/notifications/?unread=true')
+        self.assertEqual([row['message'] for row in response.data['results']], ['Message 1', 'Message 0'])
+
+        response = self.client.post('/api/notifications/read-all/')
+        self.assertEqual(response.data['unread_count'], 0)
+        notify_users([user.id], 'After')
+        response = self.client.get('/api/notifications/')
+        self.assertEqual(response.data['unread_count'], 1)
+        self.assertEqual([row['is_read'] for row in response.data['results']], [False, True, True, True])
+        self.assertEqual(self.client.get('/api/notifications/unread-count/').data['unread_count'], 1)
+
+        # Someone else's notification
+        theirs = other.notifications.first().id
+        self.assertEqual(self.client.post(f'/api/notifications/{theirs}/read/').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get('/api/notifications/unread-count/').data['unread_count'], 1)
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get('/api/notifications/unread-count/').data['unread_count'], 3)
+
+
+# Expiry ticks and grading run inline rather than through a broker
+@override_settings(
+    CELERY_TASK_ALWAYS_EAGER=True, QUIZ_SESSION_SCHEDULER_BACKEND='memory',
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'quiz-session-tests'}},
+)
+class QuizSessionTestCase(TestCase):
+    def setUp(self):
+        from .quiz_sessions import MemoryDeadlineStore
+
+        self.store = MemoryDeadlineStore()
+        patchers = [
+            patch('users.quiz_sessions._store', self.store),
+            patch('users.tasks.enqueue_grading'),
+            patch('users.views.student_views.enqueue_grading'),
+        ]
+        for patcher in patchers:
+            self.addCleanup(patcher.stop)
+        _, self.auto_graded, _ = [patcher.start() for patcher in patchers]
+
+        self.institution = user_models.Institution.objects.create(name='Quiz Session Institution')
+        teacher_user = User.objects.create_user(
+            username='sessionteacher',
+            email=f"sessionteacher_{uuid.uuid4()}@example.com",
+            password='pass123',
+            user_role='teacher',
+            institution=self.institution
+        )
+        self.teacher = user_models.Teacher.objects.create(user=teacher_user, institution=self.institution)
+        self.course = user_models.Course.objects.create(title='Session Course', institution=self.institution, teacher=self.teacher)
+        self.quiz = user_models.Quiz.objects.create(course=self.course, teacher=self.teacher, title='Timed Quiz', time_limit=30)
+        self.students = []
+        for index in range(3):
+            student_user = User.objects.create_user(
+                username=f'sessionstudent{index}',
+                email=f"sessionstudent{index}_{uuid.uuid4()}@example.com",
+                password='pass123',
+                user_role='student',
+                institution=self.institution
+            )
+            self.students.append(user_models.Student.objects.create(user=student_user, institution=self.institution))
+        self.client = APIClient()
+
+    def submit(self, student, quiz, code='print(1)'):
+        self.client.force_authenticate(student.user)
+        return self.client.post(
+            f'/api/students/{student.id}/courses/{self.course.course_id}/quizzes/',
+            {'quiz_id': quiz.quiz_id, 'submitted_code': code}, format='json')
+
+    def test_deadline_is_enforced_on_submit(self):
+        student = self.students[0]
+        self.assertEqual(self.submit(student, self.quiz).status_code, status.HTTP_403_FORBIDDEN)
+
+        response = self.client.post(f'/api/students/quizzes/{self.quiz.quiz_id}/session/')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['status'], 'ACTIVE')
+        self.assertGreater(response.data['remaining_seconds'], 29 * 60)
+        session = user_models.QuizSession.objects.get(student=student)
+        self.assertEqual(session.expires_at - session.started_at, timedelta(minutes=30))
+        self.assertEqual(self.store.count(), 1)
+
+        # Starting again returns the same session and timer
+        response = self.client.post(f'/api/students/quizzes/{self.quiz.quiz_id}/session/')
+        self.assertEqual(response.data['expires_at'], session.expires_at.isoformat().replace('+00:00', 'Z'))
+
+        response = self.client.put(f'/api/students/quizzes/{self.quiz.quiz_id}/session/', {'draft_code': 'x = 1'}, format='json')
+        self.assertEqual(response.data['draft_code'], 'x = 1')
+
+        response = self.submit(student, self.quiz, 'x = 2')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        session.refresh_from_db()
+        self.assertEqual(session.status, 'SUBMITTED')
+        self.assertEqual(session.submission.submitted_code, 'x = 2')
+        self.assertEqual(self.store.count(), 0)
+        self.assertEqual(self.submit(student, self.quiz).status_code, status.HTTP_403_FORBIDDEN)
+
+        # Past the deadline and its grace period
+        late = self.students[1]
+        self.client.force_authenticate(late.user)
+        self.client.post(f'/api/students/quizzes/{self.quiz.quiz_id}/session/')
+        user_models.QuizSession.objects.filter(student=late).update(expires_at=timezone.now() - timedelta(minutes=1))
+        response = self.client.put(f'/api/students/quizzes/{self.quiz.quiz_id}/session/', {'draft_code': 'y'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.submit(late, self.quiz).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_a_lost_tick_is_rearmed_by_draft_saves(self):
+        student = self.students[0]
+        self.client.force_authenticate(student.user)
+        with patch('users.tasks.expire_quiz_sessions_task.apply_async') as apply_async:
+            self.client.post(f'/api/students/quizzes/{self.quiz.quiz_id}/session/')
+            self.assertEqual(apply_async.call_count, 1)
+
+            # That tick never ran; the next autosave asks for another
+            self.client.put(f'/api/students/quizzes/{self.quiz.quiz_id}/session/', {'draft_code': 'x = 1'}, format='json')
+            self.assertEqual(apply_async.call_count, 2)
+
+    def test_beat_restarts_the_tick_chain(self):
+        from core.celery import app
+
+        self.assertEqual(app.conf.beat_schedule['expire-quiz-sessions']['task'], 'users.tasks.expire_quiz_sessions_task')
+
+    def test_expired_sessions_submit_their_draft(self):
+        from .quiz_sessions import start_session, save_draft, expire_due_sessions
+
+        with_draft, without_draft, later = self.students
+        sessions = [start_session(student, self.quiz) for student in (with_draft, without_draft)]
+        save_draft(sessions[0], 'print("draft")')
+        other_quiz = user_models.Quiz.objects.create(course=self.course, teacher=self.teacher, title='Long Quiz', time_limit=90)
+        start_session(later, other_quiz)
+        self.assertEqual(self.store.count(), 3)
+
+        expires_at = sessions[0].expires_at
+        # Within the grace period nothing is taken yet
+        with override_settings(QUIZ_SESSION_GRACE_SECONDS=10):
+            self.assertEqual(expire_due_sessions(now=expires_at + timedelta(seconds=5)), 0)
+            self.assertEqual(expire_due_sessions(now=expires_at + timedelta(seconds=11)), 2)
+
+        submitted = user_models.QuizSession.objects.get(student=with_draft)
+        self.assertEqual(submitted.status, 'AUTO_SUBMITTED')
+        self.assertEqual(submitted.submission.submitted_code, 'print("draft")')
+        self.auto_graded.assert_called_once_with(submitted.submission)
+        self.assertEqual(user_models.QuizSession.objects.get(student=without_draft).status, 'EXPIRED')
+        self.assertIsNone(user_models.QuizSession.objects.get(student=without_draft).submission)
+        self.assertEqual(user_models.QuizSession.objects.get(student=later).status, 'ACTIVE')
+        self.assertEqual(self.store.count(), 1)
+
+    def test_sessions_lost_from_the_deadline_store_still_expire(self):
+        from . import quiz_sessions
+        from .quiz_sessions import start_session, expire_due_sessions
+
+        first, second, _ = self.students
+        sessions = [start_session(student, self.quiz) for student in (first, second)]
+        expired = sessions[0].expires_at + timedelta(minutes=1)
+
+        # The first auto-submit fails; its deadline goes back into the store
+        with patch.object(quiz_sessions, 'auto_submit', side_effect=[RuntimeError('database went away'), None]), \
+                self.assertLogs('users.quiz_sessions', 'ERROR'):
+            self.assertEqual(expire_due_sessions(now=expired), 0)
+        self.assertEqual(self.store.count(), 1)
+
+        # A worker that died after claiming: the store no longer knows either session
+        self.store.claim_due(expired.timestamp(), 10)
+        self.assertEqual(self.store.count(), 0)
+        self.assertEqual(expire_due_sessions(now=expired), 2)
+        self.assertEqual(
+            set(user_models.QuizSession.objects.values_list('status', flat=True)), {'EXPIRED'})
+
+    def test_untimed_quizzes_can_be_resubmitted(self):
+        quiz = user_models.Quiz.objects.create(course=self.course, teacher=self.teacher, title='Practice Quiz')
+        student = self.students[0]
+        self.assertEqual(self.submit(student, quiz).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.submit(student, quiz).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(user_models.Submission.objects.filter(quiz=quiz).count(), 2)
+        self.assertEqual(self.store.count(), 0)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'draft-tests'}})
+class CodeDraftTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.institution = user_models.Institution.objects.create(name='Draft Institution')
+        student_user = User.objects.create_user(
+            username='draftstudent',
+            email=f"draftstudent_{uuid.uuid4()}@example.com",
+            password='pass123',
+            user_role='student',
+            institution=self.institution
+        )
+        self.student = user_models.Student.objects.create(user=student_user, institution=self.institution)
+        self.code = ''.join(f'def f{index}(x):\n    return x + {index}\n' for index in range(200))
+        self.playground = user_models.PlayGround.objects.create(student=self.student, title='Scratch', code_area=self.code)
+        self.url = f'/api/students/drafts/playground/{self.playground.playground_id}/'
+        self.client = APIClient()
+        self.client.force_authenticate(student_user)
+
+    def test_ops_round_trip(self):
+        from .drafts import apply_ops, diff_ops
+
+        pairs = [
+            ('', 'print(1)\n'),
+            ('a\nb\nc\n', 'a\nB\nc\nd\n'),
+            ('a\nb\nc', 'c'),
+            (self.code, self.code.replace('return x + 7\n', 'return x * 7\n').replace('def f150', 'def g150')),
+        ]
+        for old, new in pairs:
+            self.assertEqual(apply_ops(old, diff_ops(old, new)), new)
+        self.assertEqual(apply_ops('hello world', [[0, 5, 'goodbye'], [8, 5, 'moon']]), 'goodbye moon')
+
+    @override_settings(DRAFT_COMPACT_EVERY=3)
+    def test_autosave_stores_patches_and_compacts(self):
+        response = self.client.get(self.url)
+        self.assertEqual((response.data['version'], response.data['text']), (0, self.code))
+
+        position = self.code.index('return x + 5')
+        response = self.client.patch(self.url, {'base_version': 0, 'ops': [[position + 9, 1, '*']]}, format='json')
+        self.assertEqual(response.data['version'], 1)
+        expected = self.code[:position + 9] + '*' + self.code[position + 10:]
+        self.assertEqual(self.client.get(self.url).data['text'], expected)
+
+        # An editor still on version 0 has to rebase
+        response = self.client.patch(self.url, {'base_version': 0, 'ops': [[0, 0, '#']]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual((response.data['version'], response.data['text']), (1, expected))
+
+        # Full text is stored as the line diff
+        expected = expected.replace('def f100', 'def g100')
+        response = self.client.patch(self.url, {'base_version': 1, 'text': expected}, format='json')
+        self.assertEqual(response.data['version'], 2)
+        patch_row = user_models.DraftPatch.objects.get(version=2)
+        self.assertLess(len(json.dumps(patch_row.ops)), len(expected) / 100)
+
+        # The snapshot and code_area only change on compaction
+        self.playground.refresh_from_db()
+        self.assertEqual(self.playground.code_area, self.code)
+        response = self.client.patch(self.url, {'base_version': 2, 'ops': [[len(expected), 0, 'print(1)\n']]}, format='json')
+        self.assertEqual(response.data['version'], 3)
+        expected += 'print(1)\n'
+        self.playground.refresh_from_db()
+        self.assertEqual(self.playground.code_area, expected)
+        draft = user_models.CodeDraft.objects.get()
+        self.assertEqual((draft.snapshot, draft.snapshot_version), (expected, 3))
+        self.assertFalse(user_models.DraftPatch.objects.exists())
+
+        # Replaying from the snapshot gives the same text without the cache
+        cache.clear()
+        self.assertEqual(self.client.get(self.url).data['text'], expected)
+
+    def test_idle_drafts_are_written_through(self):
+        from .drafts import get_draft, save_patch
+        from .tasks import flush_draft_task
+
+        draft = get_draft(self.student, 'playground', self.playground.playground_id)
+        with patch('users.tasks.flush_draft_task.apply_async') as apply_async:
+            for text in ['print(1)\n', 'print(2)\n']:
+                with self.captureOnCommitCallbacks(execute=True):
+                    save_patch(draft, None, text=text)
+            # One flush per quiet period, not one per save
+            apply_async.assert_called_once_with(args=[draft.id], countdown=60)
+
+            self.playground.refresh_from_db()
+            self.assertEqual(self.playground.code_area, self.code)
+            flush_draft_task(draft.id)
+            self.playground.refresh_from_db()
+            self.assertEqual(self.playground.code_area, 'print(2)\n')
+
+            # Edits after the flush get a flush of their own
+            with self.captureOnCommitCallbacks(execute=True):
+                save_patch(draft, None, text='print(3)\n')
+            self.assertEqual(apply_async.call_count, 2)
+
+        # Listing the playgrounds does not wait for the flush
+        response = self.client.get(f'/api/students/{self.student.id}/playgrounds/')
+        self.assertEqual([row['code_area'] for row in response.data['results']], ['print(3)\n'])
+
+    def test_invalid_requests(self):
+        response = self.client.patch(self.url, {'base_version': 0, 'ops': [[len(self.code) + 1, 0, 'x']]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.patch(self.url, {'base_version': 0}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get('/api/students/drafts/playground/missing/').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(f'/api/students/drafts/notes/{self.playground.playground_id}/').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(user_models.DraftPatch.objects.exists())
+
+
+class CodeBlobTestCase(TestCase):
+    def setUp(self):
+        self.institution = user_models.Institution.objects.create(name='Blob Institution')
+        teacher_user = User.objects.create_user(
+            username='blobteacher',
+            email=f"blobteacher_{uuid.uuid4()}@example.com",
+            password='pass123',
+            user_role='teacher',
+            institution=self.institution
+        )
+        self.teacher = user_models.Teacher.objects.create(user=teacher_user, institution=self.institution)
+        self.course = user_models.Course.objects.create(title='Blob Course', institution=self.institution, teacher=self.teacher)
+        self.assessment = user_models.Assessment.objects.create(course=self.course, teacher=self.teacher, title='Blob Assessment')
+        self.students = []
+        for index in range(2):
+            student_user = User.objects.create_user(
+                username=f'blobstudent{index}',
+                email=f"blobstudent{index}_{uuid.uuid4()}@example.com",
+                password='pass123',
+                user_role='student',
+                institution=self.institution
+            )
+            self.students.append(user_models.Student.objects.create(user=student_user, institution=self.institution))
+        self.code = 'def total(values):\n    return sum(values)\n' * 40
+        self.client = APIClient()
+
+    def submit(self, student, code):
+        return user_models.Submission.objects.create(
+            student=student, assessment=self.assessment, submission_type='ASSESSMENT', submitted_code=code)
+
+    def test_identical_code_is_stored_once_and_compressed(self):
+        from .code_store import code_hash
+
+        submissions = [self.submit(student, self.code) for student in self.students]
+        submissions.append(self.submit(self.students[0], 'print(1)\n'))
+        self.assertEqual(user_models.CodeBlob.objects.count(), 2)
+        blob = user_models.CodeBlob.objects.get(hash=code_hash(self.code))
+        self.assertEqual(blob.size, len(self.code))
+        self.assertLess(len(bytes(blob.data)), len(self.code) / 10)
+        self.assertEqual({submission.code_blob_id for submission in submissions[:2]}, {blob.hash})
+
+        reloaded = user_models.Submission.objects.get(id=submissions[0].id)
+        self.assertEqual(reloaded.submitted_code, self.code)
+        reloaded.submitted_code = 'print(2)\n'
+        reloaded.save(update_fields=['score'])
+        reloaded.refresh_from_db()
+        self.assertEqual(reloaded.submitted_code, 'print(2)\n')
+
+        rows = [
+            user_models.Submission(student=self.students[1], assessment=self.assessment, submission_type='ASSESSMENT', submitted_code=self.code)
+            for _ in range(3)
+        ]
+        user_models.CodeBlob.objects.attach(rows)
+        user_models.Submission.objects.bulk_create(rows)
+        self.assertEqual(user_models.Submission.objects.filter(code_blob_id=blob.hash).count(), 4)
+        self.assertEqual(user_models.CodeBlob.objects.count(), 3)
+
+    def test_code_is_only_read_by_the_code_endpoint(self):
+        submission = self.submit(self.students[0], self.code)
+        user_models.Submission.objects.update(grading_status='GRADED', score=50)
+
+        self.client.force_authenticate(self.students[0].user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/students/{self.students[0].id}/scores/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(any('users_codeblob' in query['sql'] for query in queries.captured_queries))
+
+        url = f'/api/submissions/{submission.id}/code/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['submitted_code'], self.code)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.force_authenticate(self.teacher.user)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        self.client.force_authenticate(self.students[1].user)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_only_long_unused_blobs_are_pruned(self):
+        from django.core.management import call_command
+        from .code_store import code_hash
+
+        old = timezone.now() - timedelta(days=2)
+        submission = self.submit(self.students[0], self.code)
+        user_models.CodeBlob.objects.store('print(1)\n')
+        user_models.CodeBlob.objects.store('print(2)\n')
+        user_models.CodeBlob.objects.store('print(3)\n')
+        user_models.CodeBlob.objects.update(last_stored_at=old)
+        # Stored again just now, e.g. by a submission that is still being saved
+        user_models.CodeBlob.objects.store('print(3)\n')
+        user_models.CodeBlob.objects.filter(hash=code_hash('print(2)\n')).update(last_stored_at=timezone.now())
+
+        call_command('prune_code_blobs', stdout=io.StringIO())
+        self.assertEqual(
+            set(user_models.CodeBlob.objects.values_list('hash', flat=True)),
+            {submission.code_blob_id, code_hash('print(2)\n'), code_hash('print(3)\n')},
+        )
+
+        call_command('prune_code_blobs', grace=0, stdout=io.StringIO())
+        self.assertEqual(list(user_models.CodeBlob.objects.values_list('hash', flat=True)), [submission.code_blob_id])
+
+    def test_blobs_record_their_codec(self):
+        from .code_store import compress_code, decompress_code
+
+        self.assertEqual(compress_code('x'), ('none', b'x'))
+        with override_settings(CODE_BLOB_COMPRESSION='zstd'):
+            compression, data = compress_code(self.code)
+        # zlib stands in when zstandard is not installed
+        self.assertIn(compression, ('zstd', 'zlib'))
+        self.assertEqual(decompress_code(compression, data), self.code)
@@ -1,8 +1,11 @@
 from .views.institution_views import InstitutionManagerCreateView, CreateAdminView, AdminList, AdminDetail, ManagerProfileView
-from .views.admin_views import CreateUserView, TeacherStudentAPIView, TeacherStudentDetail, BulkAddUsersView
-from .views.teacher_views import TeacherProfileAPIView, TeacherCourseListAPIView, TeacherCourseDetailAPIView, TeacherStudentListAPIView, TeacherAssessmentListAPIView, TeacherQuizListAPIView, TeacherScoresAPIView, TeacherCourseCreateAPIView, TeacherAssessmentCreateAPIView, TeacherQuizCreateAPIView
-from .views.student_views import StudentAssignmentAPIView, StudentQuizAPIView, StudentScoresAPIView, StudentCourseDetailAPIView, StudentCourseListAPIView, StudentPlaygroundAPIView, StudentProfileAPIView, EnrollStudentsAPIView
-from .views.submission_views import ManualGradeAPIView, AIGradeAPIView
+from .views.admin_views import CreateUserView, TeacherStudentAPIView, TeacherStudentDetail, BulkAddUsersView, UserImportJobAPIView
+from .views.teacher_views import TeacherProfileAPIView, TeacherCourseListAPIView, TeacherCourseDetailAPIView, TeacherStudentListAPIView, TeacherAssessmentListAPIView, TeacherQuizListAPIView, TeacherScoresAPIView, TeacherCourseCreateAPIView, TeacherAssessmentCreateAPIView, TeacherQuizCreateAPIView, TeacherTestCaseListCreateAPIView, TeacherGradebookAPIView, TeacherCourseAnalyticsAPIView
+from .views.student_views import StudentAssignmentAPIView, StudentQuizAPIView, StudentScoresAPIView, StudentCourseDetailAPIView, StudentCourseListAPIView, StudentPlaygroundAPIView, StudentProfileAPIView, EnrollStudentsAPIView, StudentGradebookAPIView, StudentQuizSessionAPIView
+from .views.submission_views import ManualGradeAPIView, AIGradeAPIView, GradingQueueMetricsAPIView, SubmissionCodeAPIView
+from .views.metrics_views import MetricsView
+from .views.draft_views import CodeDraftAPIView
+from .views.notification_views import NotificationListAPIView, NotificationUnreadCountAPIView, NotificationMarkAllReadAPIView, NotificationMarkReadAPIView
 from django.urls import path
 
 urlpatterns = [
@@ -20,6 +23,7 @@ urlpatterns = [
     path('admin/<institution_id>/teacher-student-list/', TeacherStudentAPIView.as_view()), #checked ✅
     path('admin/<institution_id>/teacher-student-detail/', TeacherStudentDetail.as_view()), #checked ✅
     path('admin/bulk-file-upload/', BulkAddUsersView.as_view()),
+    path('admin/import-jobs/<job_id>/', UserImportJobAPIView.as_view(), name='user-import-job'),
     
     #Student
     path('students/<institution_id>/profile/<user_id>/', StudentProfileAPIView.as_view()),
@@ -30,6 +34,9 @@ urlpatterns = [
     path('students/<student_id>/courses/<course_id>/assignments/', StudentAssignmentAPIView.as_view(), name='student-assignments'),
     path('students/<student_id>/courses/<course_id>/quizzes/', StudentQuizAPIView.as_view(), name='student-quizzes'),
     path('students/<student_id>/scores/', StudentScoresAPIView.as_view(), name='student-scores'),
+    path('students/<student_id>/gradebook/', StudentGradebookAPIView.as_view(), name='student-gradebook'),
+    path('students/quizzes/<quiz_id>/session/', StudentQuizSessionAPIView.as_view(), name='student-quiz-session'),
+    path('students/drafts/<kind>/<object_id>/', CodeDraftAPIView.as_view(), name='student-code-draft'),
 
     # Teacher
     path('teacher/profile/<user_id>/', TeacherProfileAPIView.as_view()),
@@ -42,9 +49,22 @@ urlpatterns = [
     path('teacher/create-quiz/', TeacherQuizCreateAPIView.as_view()),
     path('teacher/quiz-list/<course_id>/',TeacherQuizListAPIView.as_view()),
     path('teacher/courses/<course_id>/scores/', TeacherScoresAPIView.as_view(), name='teacher-course-scores'),
+    path('teacher/courses/<course_id>/gradebook/', TeacherGradebookAPIView.as_view(), name='teacher-course-gradebook'),
+    path('teacher/courses/<course_id>/analytics/', TeacherCourseAnalyticsAPIView.as_view(), name='teacher-course-analytics'),
+    path('teacher/assessment/<assessment_id>/test-cases/', TeacherTestCaseListCreateAPIView.as_view(), name='assessment-test-cases'),
+    path('teacher/quiz/<quiz_id>/test-cases/', TeacherTestCaseListCreateAPIView.as_view(), name='quiz-test-cases'),
     
     
     # Submission
     path('submissions/<submission_id>/grade/', ManualGradeAPIView.as_view(), name='manual-grade'),
+    path('submissions/<submission_id>/code/', SubmissionCodeAPIView.as_view(), name='submission-code'),
     path('submissions/<teacher_id>/<submission_id>/ai-grade/', AIGradeAPIView.as_view(), name='ai-grade'),
+    path('grading/queues/', GradingQueueMetricsAPIView.as_view(), name='grading-queue-metrics'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+
+    # Notifications
+    path('notifications/', NotificationListAPIView.as_view(), name='notifications'),
+    path('notifications/unread-count/', NotificationUnreadCountAPIView.as_view(), name='notification-unread-count'),
+    path('notifications/read-all/', NotificationMarkAllReadAPIView.as_view(), name='notifications-read-all'),
+    path('notifications/<int:notification_id>/read/', NotificationMarkReadAPIView.as_view(), name='notification-read'),
 ]
@@ -2,8 +2,7 @@ from django.contrib.auth.password_validation import validate_password
 from django.utils.crypto import get_random_string
 from django.shortcuts import get_object_or_404
 from django.core.exceptions import ValidationError
-from django.core.mail import EmailMultiAlternatives, send_mail
-from django.template.loader import render_to_string
+from django.core.mail import EmailMultiAlternatives
 from django.conf import settings
 
 from rest_framework import generics, status
@@ -11,13 +10,13 @@ from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.parsers import MultiPartParser, FormParser
 
-from ..models import User, Teacher, Student, Institution, Admin
-from ..serializers import TeacherSerializer, StudentSerializer, UserSerializer
-
-import random
-import string
-import pandas as pd
-from io import BytesIO
+from ..models import User, Teacher, Student, Institution, Admin, UserImportJob
+from ..serializers import TeacherSerializer, StudentSerializer, UserSerializer, UserImportJobSerializer
+from ..importer import start_import, ImportFileError
+from ..provisioning import provision_accounts, send_credentials
+from ..outbox import enqueue_message
+from ..email_rendering import render_email
+from ..query_planner import QueryPlanMixin
 
 
 class CreateUserView(generics.CreateAPIView):
@@ -28,6 +27,10 @@ class CreateUserView(generics.CreateAPIView):
 
 
     def create(self, request, *args, **kwargs):
+        # A list under 'users' creates a batch of accounts in one go
+        if 'users' in request.data:
+            return self.create_batch(request)
+
         # Handle POST request to create a new user
         user_role = request.data['user_role']
         email = request.data['email']
@@ -91,8 +94,8 @@ class CreateUserView(generics.CreateAPIView):
 
         subject = f"Your {user_role.capitalize(
         )} Account for Institution Management System"
-        text_body = render_to_string('admin/create_new_user.txt', context)
-        html_body = render_to_string('admin/create_new_user.html', context)
+        text_body = render_email('admin/create_new_user.txt', context)
+        html_body = render_email('admin/create_new_user.html', context)
         message = EmailMultiAlternatives(
             subject=subject,
             from_email=admin_email,  # Use admin's email as the sender
@@ -101,17 +104,39 @@ class CreateUserView(generics.CreateAPIView):
         )
 
         message.attach_alternative(html_body, "text/html")
-        message.send()
+        enqueue_message(message, dedupe_key=f'credentials:{user.pk}')
 
         # Return the serialized user data
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    def create_batch(self, request):
+        # Expects {'users': [{'email': ..., 'user_role': ...}], 'admin_id': ..., 'institution_id': ...}
+        users = request.data['users']
+        institution = get_object_or_404(Institution, id=request.data.get('institution_id'))
+        admin = get_object_or_404(Admin, id=request.data.get('admin_id'), institution=institution)
+
+        if not isinstance(users, list) or not users:
+            return Response({'error': 'users must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+
+        accounts, errors = provision_accounts(institution, users, roles=['teacher', 'student'])
+        send_credentials(
+            accounts, admin.user.email, 'admin/create_new_user',
+            "Your {user_role} Account for Institution Management System",
+        )
+
+        return Response({
+            'created_users': UserSerializer([user for user, _ in accounts], many=True).data,
+            'errors': errors
+        }, status=status.HTTP_201_CREATED if accounts else status.HTTP_400_BAD_REQUEST)
+
 
 class BulkAddUsersView(generics.CreateAPIView):
-    # This view is for adding multiple users to the system from an Excel file
+    # This view is for adding multiple users to the system from a CSV or Excel file.
+    # The file is imported in the background; the response carries a job id
+    # whose progress can be followed at UserImportJobAPIView.
     # Only authenticated users can access this view
     permission_classes = [IsAuthenticated]
-    serializer_class = UserSerializer
+    serializer_class = UserImportJobSerializer
     # This line specifies the parser classes that the view will use to handle incoming requests.
     # MultiPartParser is used for handling file uploads, while FormParser is for processing form data.
     parser_classes = [MultiPartParser, FormParser]
@@ -119,99 +144,42 @@ class BulkAddUsersView(generics.CreateAPIView):
     def create(self, request, *args, **kwargs):
         # Handle POST request to create multiple users
         file = request.FILES.get('file')
-        institution_id = request.data['institution_id']
+        institution_id = request.data.get('institution_id')
 
         # Check if all required fields are provided
-        if not file:
+        if not file or not institution_id:
             return Response({'error': 'Missing required fields'}, status=status.HTTP_400_BAD_REQUEST)
 
+        if not file.name.lower().endswith(('.csv', '.xlsx')):
+            return Response({'error': 'File must be a .csv or .xlsx file'}, status=status.HTTP_400_BAD_REQUEST)
+
         # Verify if the institution exists
         try:
             institution = Institution.objects.get(id=institution_id)
         except Institution.DoesNotExist:
             return Response({'error': 'Invalid institution'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Read the Excel file
+        # Only the header is checked here; rows are validated by the import job
         try:
-            df = pd.read_excel(BytesIO(file.read()))
+            job = start_import(institution, file, created_by=request.user)
+        except ImportFileError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({'error': f'Error reading file: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Check if the Excel file has 'email' and 'user-role' columns
-        required_columns = ['email', 'user-role']
-        missing_columns = [col for col in required_columns if col not in df.columns]
-        if missing_columns:
-            return Response({'error': f'Excel file must contain {", ".join(missing_columns)} column(s)'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(UserImportJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
 
-        created_users = []
-        errors = []
 
-        # Get admin email
-        admin = get_object_or_404(Admin, institution=institution)
-        admin_email = admin.user.email
+class UserImportJobAPIView(generics.RetrieveAPIView):
+    # Progress and per-row errors of a bulk user import
+    permission_classes = [IsAuthenticated]
+    serializer_class = UserImportJobSerializer
 
-        # Iterate through each row in the Excel file
-        for _, row in df.iterrows():
-            email = row['email']
-            user_role = row['user-role'].lower()
-            # Generate a random password of 12 characters
-            password = ''.join(random.choices(
-                string.ascii_letters + string.digits, k=12))
-
-            try:
-                # Validate the generated password
-                validate_password(password)
-                # Create a new user
-                user = User.objects.create_user(
-                    username=email.split('@')[0],
-                    email=email,
-                    password=password,
-                    user_role=user_role,
-                    institution=institution
-                )
-
-                # Create a Teacher or Student object based on the user_role
-                if user_role == 'teacher':
-                    teacher = Teacher.objects.create(user=user, institution=institution)
-                    serializer = TeacherSerializer(teacher)
-                elif user_role == 'student':
-                    student = Student.objects.create(user=user, institution=institution)
-                    serializer = StudentSerializer(student)
-
-                # Send an email with the login credentials
-                context = {
-                    "username": user.username,
-                    "email": email,
-                    "password": password,
-                    "user_role": user_role
-                }
-
-                subject = f"Your {user_role.capitalize()} Account for Institution Management System"
-                text_body = render_to_string('admin/create_new_user.txt', context)
-                html_body = render_to_string('admin/create_new_user.html', context)
-                message = EmailMultiAlternatives(
-                    subject=subject,
-                    from_email=admin_email,
-                    to=[email],
-                    body=text_body,
-                )
-
-                message.attach_alternative(html_body, "text/html")
-                message.send()
-
-                # This line appends the newly created user object to the created_users list.
-                created_users.append(serializer.data)
-            except Exception as e:
-                errors.append(f"Error creating user {email}: {str(e)}")
-
-        # Return the list of created users and any errors encountered
-        return Response({
-            'created_users': created_users,
-            'errors': errors
-        }, status=status.HTTP_201_CREATED if created_users else status.HTTP_400_BAD_REQUEST)
+    def get_object(self):
+        return get_object_or_404(UserImportJob, job_id=self.kwargs['job_id'])
 
 
-class TeacherStudentAPIView(generics.ListAPIView):
+class TeacherStudentAPIView(QueryPlanMixin, generics.ListAPIView):
     serializer_class = UserSerializer
     # TODO: update permissions to IsOwnerOrAdmin
     permission_classes = [AllowAny]
@@ -228,13 +196,6 @@ class TeacherStudentAPIView(generics.ListAPIView):
         # else:
         return User.objects.filter(institution=institution)
 
-    def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response({
-            'count': queryset.count(),
-            'results': serializer.data
-        })
 class TeacherStudentDetail(generics.RetrieveUpdateDestroyAPIView):
     # TODO: update permissions to IsOwnerOrAdmin
     permission_classes = [AllowAny]
@@ -0,0 +1,57 @@
+from django.core.exceptions import ObjectDoesNotExist
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+
+from ..models import Student, CodeDraft
+from ..drafts import get_draft, current_text, save_patch, DraftConflict, InvalidPatch
+from ..quiz_sessions import SessionClosed
+
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
+from rest_framework.response import Response
+
+
+class CodeDraftAPIView(APIView):
+    """
+    Autosave for the signed-in student's editor on a playground, assessment
+    or quiz. PATCH {"base_version": 3, "ops": [[position, delete_count, insert], ...]}
+    or {"base_version": 3, "text": "..."}; a 409 carries the current version
+    and text to rebase on.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get_draft(self, kind, object_id):
+        if kind not in dict(CodeDraft.KINDS):
+            raise Http404
+        student = get_object_or_404(Student, user=self.request.user)
+        try:
+            return get_draft(student, kind, object_id)
+        except ObjectDoesNotExist:
+            raise Http404
+
+    def get(self, request, kind, object_id):
+        try:
+            draft = self.get_draft(kind, object_id)
+        except SessionClosed as e:
+            return Response({'error': str(e)}, status=status.HTTP_403_FORBIDDEN)
+        return Response({'version': draft.version, 'text': current_text(draft)}, status=status.HTTP_200_OK)
+
+    def patch(self, request, kind, object_id):
+        base_version = request.data.get('base_version')
+        ops, text = request.data.get('ops'), request.data.get('text')
+        if not isinstance(base_version, int) or (ops is None) == (text is None):
+            return Response({'error': 'Send base_version and either ops or text.'}, status=status.HTTP_400_BAD_REQUEST)
+        if text is not None and not isinstance(text, str):
+            return Response({'error': 'text must be a string.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            version = save_patch(self.get_draft(kind, object_id), base_version, ops=ops, text=text)
+        except SessionClosed as e:
+            return Response({'error': str(e)}, status=status.HTTP_403_FORBIDDEN)
+        except InvalidPatch as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except DraftConflict as e:
+            return Response(
+                {'error': str(e), 'version': e.version, 'text': e.text}, status=status.HTTP_409_CONFLICT)
+        return Response({'version': version}, status=status.HTTP_200_OK)
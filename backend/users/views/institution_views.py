@@ -1,7 +1,6 @@
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
-from django.template.loader import render_to_string
 from django.utils.crypto import get_random_string
 from django.core.mail import EmailMultiAlternatives
 from django.conf import settings
@@ -12,6 +11,10 @@ from rest_framework.permissions import AllowAny, IsAuthenticated
 
 from ..serializers import InstitutionSerializer, InstitutionManagerSerializer, UserSerializer, AdminSerializer, ManagerSerializer
 from ..models import Institution, Manager, User, Admin
+from ..query_planner import QueryPlanMixin
+from ..provisioning import provision_accounts, send_credentials
+from ..outbox import enqueue_message
+from ..email_rendering import render_email
 
 
 # TODO: Implement payment logic: When payment has been successful, change the
@@ -85,6 +88,10 @@ class CreateAdminView(generics.CreateAPIView):
     permission_classes = [AllowAny]
 
     def create(self, request, *args, **kwargs):
+        # A list under 'users' creates a batch of admins in one go
+        if 'users' in request.data:
+            return self.create_batch(request)
+
         # Handle POST request to create a new user
         email = request.data['email']
         institution_id = request.data['institution_id']
@@ -140,8 +147,8 @@ class CreateAdminView(generics.CreateAPIView):
             "email": email
         }
         subject = "Your Admin Account for Institution Management System"
-        text_body = render_to_string('manager/create_admin.txt', context)
-        html_body = render_to_string('manager/create_admin.html', context)
+        text_body = render_email('manager/create_admin.txt', context)
+        html_body = render_email('manager/create_admin.html', context)
         message = EmailMultiAlternatives(
             subject=subject,
             from_email=manager_email,  # Use manager's email as the sender
@@ -149,13 +156,34 @@ class CreateAdminView(generics.CreateAPIView):
             body=text_body,
         )
         message.attach_alternative(html_body, "text/html")
-        message.send()
+        enqueue_message(message, dedupe_key=f'credentials:{user.pk}')
 
         # Return the serialized user data
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    def create_batch(self, request):
+        # Expects {'users': [{'email': ...}], 'institution_id': ...}
+        users = request.data['users']
+        institution = get_object_or_404(Institution, id=request.data.get('institution_id'))
+        manager = get_object_or_404(Manager, institution=institution)
+
+        if not isinstance(users, list) or not users:
+            return Response({'error': 'users must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+
+        entries = [{'email': user.get('email'), 'user_role': 'admin'} for user in users]
+        accounts, errors = provision_accounts(institution, entries, roles=['admin'])
+        send_credentials(
+            accounts, manager.user.email, 'manager/create_admin',
+            "Your Admin Account for Institution Management System",
+        )
+
+        return Response({
+            'created_users': UserSerializer([user for user, _ in accounts], many=True).data,
+            'errors': errors
+        }, status=status.HTTP_201_CREATED if accounts else status.HTTP_400_BAD_REQUEST)
+
 
-class AdminList(generics.ListAPIView):
+class AdminList(QueryPlanMixin, generics.ListAPIView):
     serializer_class = AdminSerializer
     # TODO: update permissions to IsOwnerOrAdmin
     permission_classes = [AllowAny]
@@ -164,14 +192,6 @@ class AdminList(generics.ListAPIView):
         institution_id = self.kwargs['institution_id']
         institution = get_object_or_404(Institution, id=institution_id)
         return Admin.objects.filter(institution=institution)
-    
-    def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response({
-            'count': queryset.count(),
-            'results': serializer.data
-        })
 
 class AdminDetail(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = AdminSerializer
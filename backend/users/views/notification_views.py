@@ -0,0 +1,65 @@
+from django.http import Http404
+
+from ..models import Notification
+from ..serializers import NotificationSerializer
+from ..notifications import unread_count, read_up_to, unread_notifications, mark_all_read, mark_read
+
+from rest_framework import generics, status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
+from rest_framework.response import Response
+
+
+class NotificationListAPIView(generics.ListAPIView):
+    """
+    The signed-in user's inbox, newest first, with their unread count.
+    ?unread=true lists only unread notifications.
+    """
+    serializer_class = NotificationSerializer
+    permission_classes = [IsAuthenticated]
+    cursor_ordering = '-id'
+    query_budget = 3
+
+    def list(self, request, *args, **kwargs):
+        self.read_up_to = read_up_to(request.user)
+        response = super().list(request, *args, **kwargs)
+        response.data['unread_count'] = unread_count(request.user)
+        return response
+
+    def get_queryset(self):
+        if self.request.query_params.get('unread') == 'true':
+            return unread_notifications(self.request.user, self.read_up_to)
+        return Notification.objects.filter(user=self.request.user)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['read_up_to'] = getattr(self, 'read_up_to', 0)
+        return context
+
+
+class NotificationUnreadCountAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+    query_budget = 1
+
+    def get(self, request):
+        return Response({'unread_count': unread_count(request.user)}, status=status.HTTP_200_OK)
+
+
+class NotificationMarkAllReadAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+    query_budget = 5
+
+    def post(self, request):
+        mark_all_read(request.user)
+        return Response({'unread_count': 0}, status=status.HTTP_200_OK)
+
+
+class NotificationMarkReadAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+    query_budget = 6
+
+    def post(self, request, notification_id):
+        if not mark_read(request.user, notification_id):
+            if not Notification.objects.filter(id=notification_id, user=request.user).exists():
+                raise Http404
+        return Response({'unread_count': unread_count(request.user)}, status=status.HTTP_200_OK)
@@ -1,13 +1,17 @@
 from django.shortcuts import get_object_or_404
 
-from ..models import User, Student, CourseEnrollment, Course, Assessment, Quiz, PlayGround, Submission, Teacher, Institution
-from ..serializers import StudentSerializer, CourseEnrollmentSerializer, CourseSerializer, AssessmentSerializer, QuizSerializer, PlayGroundSerializer, SubmissionSerializer
-from ..tasks import grade_submission_task
+from ..models import User, Student, CourseEnrollment, Course, Assessment, Quiz, PlayGround, Submission, Teacher, Institution, GradebookEntry, QuizSession
+from ..serializers import StudentSerializer, CourseEnrollmentSerializer, CourseSerializer, AssessmentSerializer, QuizSerializer, PlayGroundSerializer, SubmissionSerializer, CourseEnrollmentSummarySerializer, GradebookEntrySerializer, QuizSessionSerializer
+from ..tasks import enqueue_grading
+from ..quiz_sessions import start_session, save_draft, submit_quiz, SessionClosed
+from ..drafts import latest_text, flush_student_drafts
+from ..query_planner import QueryPlanMixin
 
 from rest_framework import generics, status
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAuthenticated
 
 
 class StudentProfileAPIView(generics.RetrieveUpdateAPIView):
@@ -26,9 +30,10 @@ class StudentProfileAPIView(generics.RetrieveUpdateAPIView):
         # return user_models.Student.objects.get(user=user)
         
 
-class StudentCourseListAPIView(generics.ListAPIView):
-    serializer_class = CourseEnrollmentSerializer
+class StudentCourseListAPIView(QueryPlanMixin, generics.ListAPIView):
+    serializer_class = CourseEnrollmentSummarySerializer
     permission_classes = [AllowAny]
+    query_budget = 3
 
     def get_queryset(self):
         student_id = self.kwargs['student_id']
@@ -36,9 +41,10 @@ class StudentCourseListAPIView(generics.ListAPIView):
         return CourseEnrollment.objects.filter(student=student)
 
 
-class StudentCourseDetailAPIView(generics.RetrieveAPIView):
+class StudentCourseDetailAPIView(QueryPlanMixin, generics.RetrieveAPIView):
     serializer_class = CourseEnrollmentSerializer
     permission_classes = [AllowAny]
+    query_budget = 8
 
     def get_object(self):
         student_id = self.kwargs['student_id']
@@ -48,7 +54,7 @@ class StudentCourseDetailAPIView(generics.RetrieveAPIView):
         course = get_object_or_404(Course, course_id=course_id)
 
         # Use get() instead of filter() to retrieve a single CourseEnrollment instance
-        return get_object_or_404(CourseEnrollment, student=student, course=course)
+        return get_object_or_404(self.plan_queryset(CourseEnrollment.objects.all()), student=student, course=course)
 
 
 class EnrollStudentsAPIView(generics.CreateAPIView):
@@ -93,6 +99,9 @@ class StudentPlaygroundAPIView(generics.ListCreateAPIView):
     def get_queryset(self):
         student_id = self.kwargs['student_id']
         student = get_object_or_404(Student, id=student_id)
+        if self.request.method == 'GET':
+            # Autosaved edits may not have been written through to code_area yet
+            flush_student_drafts(student, 'playground')
         return PlayGround.objects.filter(student=student)
 
     def perform_create(self, serializer):
@@ -128,7 +137,7 @@ class StudentAssignmentAPIView(generics.ListCreateAPIView):
         )
 
         # Trigger AI grading asynchronously
-        grade_submission_task.delay(submission.id)
+        enqueue_grading(submission)
 
         return Response(
             {"message": "Assignment submitted successfully.",
@@ -155,15 +164,14 @@ class StudentQuizAPIView(generics.ListCreateAPIView):
         quiz = get_object_or_404(Quiz, quiz_id=quiz_id)
         student = get_object_or_404(Student, user=self.request.user)
 
-        submission = Submission.objects.create(
-            student=student,
-            quiz=quiz,
-            submission_type='QUIZ',
-            submitted_code=submitted_code
-        )
+        # Timed quizzes are only accepted within the student's session
+        try:
+            submission = submit_quiz(student, quiz, submitted_code)
+        except SessionClosed as e:
+            return Response({'error': str(e)}, status=status.HTTP_403_FORBIDDEN)
 
         # Trigger AI grading asynchronously
-        grade_submission_task.delay(submission.id)
+        enqueue_grading(submission)
 
         return Response(
             {"message": "Quiz submitted successfully.",
@@ -172,11 +180,77 @@ class StudentQuizAPIView(generics.ListCreateAPIView):
         )
 
 
+class StudentQuizSessionAPIView(APIView):
+    """
+    The signed-in student's session on a quiz. POST starts it (and its timer,
+    for a timed quiz), PUT saves the draft submitted if time runs out.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get_session(self, quiz_id):
+        student = get_object_or_404(Student, user=self.request.user)
+        return get_object_or_404(QuizSession.objects.select_related('quiz'), quiz__quiz_id=quiz_id, student=student)
+
+    def get(self, request, quiz_id):
+        session = self.get_session(quiz_id)
+        # Autosaved edits reach draft_code only when the draft is compacted
+        session.draft_code = latest_text(session.student_id, 'quiz', quiz_id, default=session.draft_code)
+        return Response(QuizSessionSerializer(session).data, status=status.HTTP_200_OK)
+
+    def post(self, request, quiz_id):
+        quiz = get_object_or_404(Quiz, quiz_id=quiz_id)
+        student = get_object_or_404(Student, user=request.user)
+        session = start_session(student, quiz)
+        return Response(QuizSessionSerializer(session).data, status=status.HTTP_201_CREATED)
+
+    def put(self, request, quiz_id):
+        session = self.get_session(quiz_id)
+        try:
+            save_draft(session, request.data.get('draft_code', ''))
+        except SessionClosed as e:
+            return Response({'error': str(e)}, status=status.HTTP_403_FORBIDDEN)
+        return Response(QuizSessionSerializer(session).data, status=status.HTTP_200_OK)
+
+
 class StudentScoresAPIView(generics.ListAPIView):
     serializer_class = SubmissionSerializer
     permission_classes = [AllowAny]
+    query_budget = 3
+    cursor_ordering = ('-submitted_at', '-id')
 
     def get_queryset(self):
         student_id = self.kwargs['student_id']
         student = get_object_or_404(Student, id=student_id)
         return Submission.objects.filter(student=student, grading_status='GRADED')
+
+
+class StudentGradebookAPIView(APIView):
+    """A student's gradebook, grouped by course, with a best-score average per course."""
+    permission_classes = [AllowAny]
+    query_budget = 2
+
+    def get(self, request, student_id):
+        entries = list(
+            GradebookEntry.objects.filter(student_id=student_id)
+            .select_related('course', 'student__user', 'assessment', 'quiz')
+            .order_by('course_id', 'id')
+        )
+        if not entries:
+            get_object_or_404(Student, id=student_id)
+
+        courses = {}
+        for entry in entries:
+            courses.setdefault(entry.course, []).append(entry)
+
+        summary = []
+        for course, course_entries in courses.items():
+            best_scores = [entry.best_score for entry in course_entries if entry.best_score is not None]
+            summary.append({
+                'course_id': course.course_id,
+                'title': course.title,
+                'attempted': len(course_entries),
+                'graded': len(best_scores),
+                'average_best_score': round(sum(best_scores) / len(best_scores), 2) if best_scores else None,
+                'entries': GradebookEntrySerializer(course_entries, many=True).data,
+            })
+        return Response({'student': int(student_id), 'courses': summary}, status=status.HTTP_200_OK)
@@ -1,10 +1,15 @@
+import math
+
 from django.shortcuts import get_object_or_404
+from django.conf import settings
 
 from ..models import Teacher, Submission
-from ..service import perform_ai_grading
+from ..service import cached_ai_grading, TransientGradingError
+from ..scheduling import get_scheduler
+from ..gradebook import save_submission
 
 from rest_framework import generics, status
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.parsers import JSONParser
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -32,7 +37,7 @@ class ManualGradeAPIView(APIView):
             submission.instructor_feedback = feedback
 
         submission.grading_status = 'GRADED'
-        submission.save()
+        save_submission(submission)
 
         return Response({"message": "Submission graded successfully."}, status=status.HTTP_200_OK)
 
@@ -67,7 +72,7 @@ class AIGradeAPIView(APIView):
             else:
                 return Response({"message": "Invalid submission type."}, status=status.HTTP_400_BAD_REQUEST)
 
-            ai_score, ai_feedback = perform_ai_grading(
+            ai_score, ai_feedback = cached_ai_grading(
                 submitted_code=submission.submitted_code,
                 instructor_solution=instructor_solution,
                 grading_parameters=grading_parameters
@@ -76,7 +81,7 @@ class AIGradeAPIView(APIView):
             submission.score = ai_score
             submission.ai_feedback = ai_feedback
             submission.grading_status = 'GRADED'
-            submission.save()
+            save_submission(submission)
 
             return Response(
                 {
@@ -86,8 +91,50 @@ class AIGradeAPIView(APIView):
                 },
                 status=status.HTTP_200_OK
             )
+        except TransientGradingError as e:
+            retry_after = math.ceil(e.retry_after or settings.AI_GRADING_BACKOFF_BASE)
+            return Response(
+                {"message": "AI grading is busy, try again shortly.", "error": str(e)},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": str(retry_after)}
+            )
         except Exception as e:
             return Response(
                 {"message": "AI grading failed.", "error": str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+
+class SubmissionCodeAPIView(APIView):
+    """
+    A submission's code, for its student and the course's teacher. List
+    endpoints leave the code out; it is only read from its blob here. The
+    blob hash doubles as an ETag since the content never changes.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, submission_id):
+        submission = get_object_or_404(
+            Submission.objects.select_related('student', 'assessment__course', 'quiz__course'), id=submission_id)
+        work = submission.assessment or submission.quiz
+        is_student = submission.student is not None and submission.student.user_id == request.user.id
+        is_teacher = work is not None and Teacher.objects.filter(user=request.user, id=work.course.teacher_id).exists()
+        if not (is_student or is_teacher):
+            return Response({"message": "Unauthorized access."}, status=status.HTTP_403_FORBIDDEN)
+
+        etag = f'"{submission.code_blob_id}"'
+        if request.headers.get('If-None-Match') == etag:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        return Response(
+            {'submission_id': submission.id, 'hash': submission.code_blob_id, 'submitted_code': submission.submitted_code},
+            status=status.HTTP_200_OK,
+            headers={'ETag': etag},
+        )
+
+
+class GradingQueueMetricsAPIView(APIView):
+    """Depth and wait time of the grading queues, per priority tier."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(get_scheduler().metrics(), status=status.HTTP_200_OK)
@@ -1,11 +1,16 @@
 from django.shortcuts import get_object_or_404
 
-from ..models import Teacher, Course, CourseEnrollment, Assessment, Submission, Institution, Student, Quiz
-from ..serializers import TeacherSerializer, CourseSerializer, CourseEnrollmentSerializer, AssessmentSerializer, SubmissionSerializer, QuizSerializer
+from ..models import Teacher, Course, CourseEnrollment, Assessment, Submission, Institution, Student, Quiz, CodeTestCase, GradebookEntry
+from ..serializers import TeacherSerializer, CourseSerializer, CourseEnrollmentSerializer, AssessmentSerializer, SubmissionSerializer, QuizSerializer, AssessmentSummarySerializer, QuizSummarySerializer, CodeTestCaseSerializer, GradebookEntrySerializer
+from ..query_planner import QueryPlanMixin
+from ..analytics import course_analytics
+from ..notifications import schedule_course_notification
 
 from rest_framework import generics, status
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny
+from rest_framework.views import APIView
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.exceptions import PermissionDenied
 
 
 class TeacherProfileAPIView(generics.RetrieveUpdateAPIView):
@@ -18,9 +23,11 @@ class TeacherProfileAPIView(generics.RetrieveUpdateAPIView):
         return teacher
 
 
-class TeacherCourseListAPIView(generics.ListCreateAPIView):
+class TeacherCourseListAPIView(QueryPlanMixin, generics.ListCreateAPIView):
     serializer_class = CourseSerializer
     permission_classes = [AllowAny]
+    query_budget = 10
+    cursor_ordering = ('-created_at', '-id')
 
     def get_queryset(self):
         teacher_id = self.kwargs['teacher_id']
@@ -29,16 +36,17 @@ class TeacherCourseListAPIView(generics.ListCreateAPIView):
         return Course.objects.filter(teacher=teacher)
 
 
-class TeacherCourseDetailAPIView(generics.RetrieveUpdateAPIView):
+class TeacherCourseDetailAPIView(QueryPlanMixin, generics.RetrieveUpdateAPIView):
     serializer_class = CourseSerializer
     permission_classes = [AllowAny]
+    query_budget = 10
 
     def get_object(self):
         teacher_id = self.kwargs['teacher_id']
         course_id = self.kwargs['course_id']
 
         teacher = Teacher.objects.get(id=teacher_id)
-        return get_object_or_404(Course, teacher=teacher, course_id=course_id)
+        return get_object_or_404(self.plan_queryset(Course.objects.all()), teacher=teacher, course_id=course_id)
 
 
 class TeacherCourseCreateAPIView(generics.CreateAPIView):
@@ -59,9 +67,10 @@ class TeacherCourseCreateAPIView(generics.CreateAPIView):
         return Response({"message": "Course created successfully"}, status=status.HTTP_201_CREATED)
 
 
-class TeacherStudentListAPIView(generics.ListAPIView):
+class TeacherStudentListAPIView(QueryPlanMixin, generics.ListAPIView):
     serializer_class = CourseEnrollmentSerializer
     permission_classes = [AllowAny]
+    query_budget = 10
 
     def get_queryset(self):
         teacher_id = self.kwargs['teacher_id']
@@ -97,7 +106,7 @@ class TeacherAssessmentCreateAPIView(generics.CreateAPIView):
         # Get the course object
         course = get_object_or_404(Course, course_id=course_id)
 
-        Assessment.objects.create(
+        assessment = Assessment.objects.create(
             course=course,
             title=title,
             description=description,
@@ -108,12 +117,13 @@ class TeacherAssessmentCreateAPIView(generics.CreateAPIView):
             max_score=max_score,
             due_date=due_date,
         )
+        schedule_course_notification(course, f'New assessment "{assessment.title}" in {course.title}.')
 
         return Response({"message": "Assessment created successfully"}, status=status.HTTP_201_CREATED)
 
 
-class TeacherAssessmentListAPIView(generics.ListAPIView):
-    serializer_class = AssessmentSerializer
+class TeacherAssessmentListAPIView(QueryPlanMixin, generics.ListAPIView):
+    serializer_class = AssessmentSummarySerializer
     permission_classes = [AllowAny]
 
     def get_queryset(self):
@@ -153,12 +163,13 @@ class TeacherQuizCreateAPIView(generics.CreateAPIView):
             max_score=max_score,
             time_limit=time_limit
         )
+        schedule_course_notification(course, f'New quiz "{quiz.title}" in {course.title}.')
 
         return Response({"message": "Quiz created successfully", "quiz_id": quiz.quiz_id}, status=status.HTTP_201_CREATED)
 
 
-class TeacherQuizListAPIView(generics.ListAPIView):
-    serializer_class = QuizSerializer
+class TeacherQuizListAPIView(QueryPlanMixin, generics.ListAPIView):
+    serializer_class = QuizSummarySerializer
     permission_classes = [AllowAny]
 
     def get_queryset(self):
@@ -170,10 +181,64 @@ class TeacherQuizListAPIView(generics.ListAPIView):
 class TeacherScoresAPIView(generics.ListAPIView):
     serializer_class = SubmissionSerializer
     permission_classes = [AllowAny]
+    query_budget = 4
+    cursor_ordering = ('-submitted_at', '-id')
 
     def get_queryset(self):
         teacher_id = self.kwargs['teacher_id']
         teacher = get_object_or_404(Teacher, id=teacher_id)
         course_id = self.kwargs['course_id']
         course = get_object_or_404(Course, course_id=course_id, teacher=teacher)
-        return Submission.objects.filter(assessment__course=course, grading_status='PENDING')
+        # Includes submissions the AI could not grade, which are left to the teacher
+        return Submission.objects.filter(assessment__course=course, grading_status__in=['PENDING', 'FAILED'])
+
+
+class TeacherGradebookAPIView(generics.ListAPIView):
+    """Every student's standing on every assessment and quiz of a course, from the materialized gradebook."""
+    serializer_class = GradebookEntrySerializer
+    permission_classes = [AllowAny]
+    query_budget = 3
+    cursor_ordering = ('student_id', 'id')
+
+    def get_queryset(self):
+        course = get_object_or_404(Course, course_id=self.kwargs['course_id'])
+        return GradebookEntry.objects.filter(course=course).select_related('student__user', 'assessment', 'quiz')
+
+
+class TeacherCourseAnalyticsAPIView(APIView):
+    """Score distributions, percentiles, late rates and submission timing per assessment and quiz."""
+    permission_classes = [AllowAny]
+
+    def get(self, request, course_id):
+        course = get_object_or_404(Course, course_id=course_id)
+        return Response(course_analytics(course), status=status.HTTP_200_OK)
+
+
+class TeacherTestCaseListCreateAPIView(generics.ListCreateAPIView):
+    """
+    Test cases of one assessment or quiz, used to grade its submissions.
+    Only the teacher of the course can see them, since hidden test cases
+    must not reach students.
+    """
+    serializer_class = CodeTestCaseSerializer
+    permission_classes = [IsAuthenticated]
+    cursor_ordering = ('order', 'id')
+
+    def get_work(self):
+        if 'assessment_id' in self.kwargs:
+            work = get_object_or_404(Assessment.objects.select_related('course'), assessment_id=self.kwargs['assessment_id'])
+            field = 'assessment'
+        else:
+            work = get_object_or_404(Quiz.objects.select_related('course'), quiz_id=self.kwargs['quiz_id'])
+            field = 'quiz'
+        teacher = get_object_or_404(Teacher, user=self.request.user)
+        # Ensure the work belongs to the teacher's course
+        if work.course.teacher_id != teacher.id:
+            raise PermissionDenied("Unauthorized access.")
+        return {field: work}
+
+    def get_queryset(self):
+        return CodeTestCase.objects.filter(**self.get_work())
+
+    def perform_create(self, serializer):
+        serializer.save(**self.get_work())